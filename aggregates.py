@@ -0,0 +1,81 @@
+
+# system imports:
+import time
+
+MAX_GAP = 60.0  # [s] longer intervals without samples are not integrated, e.g. fetch errors or a restart
+
+
+def _emptyDay(day):
+    return {"day": day, "positive": 0.0, "negative": 0.0, "seconds": 0.0, "integral": 0.0, "min": None, "max": None,
+            "states": {}}
+
+
+# local day number, changes at local midnight
+def _dayNumber(now):
+    return int((now + time.localtime(now).tm_gmtoff) // 86400)
+
+
+# DailyAggregate class for one power value: energy split by sign, min, max, time weighted mean and time per state of
+# today and yesterday, plus the energy totals. Value and state of a sample hold until the next sample over the real
+# elapsed time. One update is O(1) and the memory is fixed, the states are a small set like the HM states.
+class DailyAggregate:
+
+    def __init__(self):
+        self._last = None  # (time, value, state) of the last sample
+        self.today = _emptyDay(None)
+        self.yesterday = _emptyDay(None)
+        self.total = [0.0, 0.0]  # [Wh] positive and negative energy since the first sample
+
+    # returns True if the day rolled over with this sample
+    def update(self, value, now, state=None):
+        rollover = False
+        day = _dayNumber(now)
+        if self.today["day"] != day:
+            rollover = self.today["day"] is not None
+            self.yesterday = self.today if self.today["day"] == day - 1 else _emptyDay(day - 1)
+            self.today = _emptyDay(day)
+        if self._last:
+            lastTime, lastValue, lastState = self._last
+            dt = now - lastTime
+            if 0 < dt <= MAX_GAP:
+                # the interval before midnight is counted for the new day, one sample interval at most
+                today = self.today
+                energy = lastValue * dt / 3600
+                if energy >= 0:
+                    today["positive"] += energy
+                    self.total[0] += energy
+                else:
+                    today["negative"] -= energy
+                    self.total[1] -= energy
+                today["seconds"] += dt
+                today["integral"] += lastValue * dt
+                if lastState is not None:
+                    today["states"][lastState] = today["states"].get(lastState, 0.0) + dt
+        today = self.today
+        today["min"] = value if today["min"] is None else min(today["min"], value)
+        today["max"] = value if today["max"] is None else max(today["max"], value)
+        self._last = (now, value, state)
+        return rollover
+
+    # [W] time weighted mean of today (0) or yesterday (1)
+    def getMean(self, index=0):
+        day = self.yesterday if index else self.today
+        return day["integral"] / day["seconds"] if day["seconds"] else 0.0
+
+    def getDay(self, index=0):
+        return self.yesterday if index else self.today
+
+    # copies, the checkpoint detects changes by comparing with the last values
+    def getCheckpoint(self):
+        return {
+            "today": dict(self.today, states=dict(self.today["states"])),
+            "yesterday": dict(self.yesterday, states=dict(self.yesterday["states"])),
+            "total": list(self.total),
+        }
+
+    # a day in the past is moved to yesterday by the next update
+    def restoreCheckpoint(self, data):
+        if data and len(data.get("total", ())) == 2:
+            self.today = data["today"]
+            self.yesterday = data["yesterday"]
+            self.total = [float(value) for value in data["total"]]
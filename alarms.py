@@ -0,0 +1,75 @@
+
+ALARM_GRID = "Grid Shelly HTTP"
+ALARM_TEMPERATURE = "Temperature"
+ALARM_DTU = "OpenDTU HTTP Push"
+ALARM_FETCH = "OpenDTU HTTP Fetch"
+ALARM_HM = "OpenDTU HM state"
+ALARM_BALCONY = "Balcony Shelly HTTP"
+ALARM_BATTERY = "Battery charge current limit"
+ALARM_NONE = "HM status (--)"
+# name -> (bit of /ActiveAlarms, priority with 0 first, on delay [s], off delay [s]), the on delay ignores single bad
+# reports of the Shellys, the HM state and the temperature, the off delay keeps a flapping alarm active. The DTU write
+# alarm already ignores the first failed limit, the battery limit is taken from the BMS as it is
+ALARM_DEFINITIONS = {
+    ALARM_GRID: (1, 1, 10, 60),
+    ALARM_TEMPERATURE: (2, 3, 30, 30),
+    ALARM_DTU: (4, 4, 0, 300),
+    ALARM_FETCH: (8, 0, 10, 60),
+    ALARM_HM: (16, 2, 30, 60),
+    ALARM_BALCONY: (32, 5, 10, 60),
+    ALARM_BATTERY: (64, 6, 0, 60),
+}
+
+
+# AlarmAggregator class collecting the alarm reports of one cycle, the state is evaluated once per cycle.
+# Reports of an alarm within a cycle are ORed. An alarm gets active if reported for onDelay seconds and stays active
+# until not reported for offDelay seconds, so a flapping alarm neither toggles the DBUS alarm nor hides another one.
+# The winner is the active alarm with the lowest priority value, the first activated one on equal priority.
+class AlarmAggregator:
+
+    def __init__(self, definitions):
+        self._definitions = definitions  # name -> (bit, priority, onDelay [s], offDelay [s])
+        self._reports = {}  # (name, device) -> reported state of the running cycle
+        self._states = {}  # (name, device) -> [raw state, time stamp of the last raw change, active, activated]
+
+    def report(self, name, device, on):
+        key = (name, device or "")
+        self._reports[key] = self._reports.get(key, False) or bool(on)
+
+    # debounced states of the cycle, returns the keys which changed the active state
+    def evaluate(self, now):
+        for key, on in self._reports.items():
+            state = self._states.setdefault(key, [False, now, False, now])
+            if state[0] != on:
+                state[0] = on
+                state[1] = now
+        self._reports = {}
+        changed = []
+        for key, state in self._states.items():
+            raw, stamp, active, _ = state
+            _, _, onDelay, offDelay = self._definitions[key[0]]
+            if raw and not active and now - stamp >= onDelay:
+                state[2] = True
+                state[3] = now
+                changed.append(key)
+            elif not raw and active and now - stamp >= offDelay:
+                state[2] = False
+                changed.append(key)
+        return changed
+
+    def isActive(self, name, device=None):
+        state = self._states.get((name, device or ""))
+        return bool(state and state[2])
+
+    # active (name, device) keys, winner first
+    def getActive(self):
+        active = [(key, state[3]) for key, state in self._states.items() if state[2]]
+        active.sort(key=lambda item: (self._definitions[item[0][0]][1], item[1]))
+        return [key for key, _ in active]
+
+    # one bit per active alarm name, independent of the device
+    def getBitmask(self):
+        bitmask = 0
+        for name, _ in self.getActive():
+            bitmask |= self._definitions[name][0]
+        return bitmask
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+'''backtest of the seasonal feed in logic of seasonal.py over SOC history, e.g. VRM CSV exports, with parameter sweeps'''
+
+# system imports:
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+# our imports:
+from seasonal import BASESOC, MINMAXSOC, MAXSOC, FEEDINONHYS, peakFloatingMax
+
+SIGN_OF_LIFE = 600                            # [s] relay decision interval, SignOfLifeLog of config.ini in seconds
+MAX_GAP = 3600                                # [s] longer gaps of the history do not count as feed in time
+TIME_COLUMNS = ("timestamp", "time", "date")  # first matching header is the time column
+SOC_COLUMNS = ("state of charge", "soc")      # first header containing one of these is the SOC column
+
+
+def _parseTime(text):
+    text = text.strip()
+    try:
+        stamp = float(text)
+        return stamp / 1000 if stamp > 1e11 else stamp  # VRM API exports use milliseconds
+    except ValueError:
+        return datetime.datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()
+
+
+def load_csv(filename, socColumn=None):
+    '''Time stamps [s] and SOC [%] of a CSV file, VRM exports have one or more header rows before the data.'''
+    with open(filename, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        times, socs = [], []
+        timeIndex = socIndex = None
+        for row in csv.reader(file, dialect):
+            if timeIndex is None:
+                header = [cell.strip().lower() for cell in row]
+                timeIndex = next((index for index, cell in enumerate(header) if cell in TIME_COLUMNS), None)
+                names = (socColumn.lower(),) if socColumn else SOC_COLUMNS
+                socIndex = next((index for index, cell in enumerate(header)
+                                 if any(name in cell for name in names) and index != timeIndex), None)
+                if socIndex is None:
+                    timeIndex = None
+                continue
+            try:
+                stamp = _parseTime(row[timeIndex])
+                soc = float(row[socIndex])
+            except (ValueError, IndexError):
+                # unit rows below the header and empty values
+                continue
+            times.append(stamp)
+            socs.append(soc)
+    if timeIndex is None:
+        raise ValueError(f"{filename}: no time and SOC column found")
+    return np.array(times, dtype=np.float64), np.array(socs, dtype=np.float64)
+
+
+def load(filenames, socColumn=None):
+    '''Merged history of several files sorted by time, SOC as integer like read from DBUS.'''
+    parts = [load_csv(filename, socColumn) for filename in filenames]
+    times = np.concatenate([part[0] for part in parts])
+    socs = np.concatenate([part[1] for part in parts])
+    order = np.argsort(times, kind="stable")
+    times, socs = times[order], socs[order]
+    keep = np.concatenate(([True], np.diff(times) > 0))
+    return times[keep], socs[keep].astype(np.int64)
+
+
+def synthetic(years, seed=1, interval=300):
+    '''SOC history with a daily cycle, a larger amplitude in summer and random cloudy days, for trying the sweeps.'''
+    rnd = np.random.default_rng(seed)
+    times = np.arange(0, years * 365 * 86400, interval, dtype=np.float64)
+    day = times / 86400
+    season = 0.5 - 0.5 * np.cos(2 * np.pi * (day - 172) / 365)  # 1 at midsummer
+    weather = np.repeat(rnd.uniform(0.3, 1.0, int(day[-1]) + 1), 86400 // interval)[:len(times)]
+    swing = (15 + 35 * season) * weather
+    soc = 30 + 40 * season + swing * np.sin(2 * np.pi * (day % 1 - 0.35))
+    return times, np.clip(np.round(soc), 5, 100).astype(np.int64)
+
+
+def floating_max(soc, minMaxSoc=MINMAXSOC):
+    '''/SocFloatingMax per sample. Only SOC peaks change it, the loop runs over the peaks, not over the samples.'''
+    steps = np.diff(soc)
+    changes = np.flatnonzero(steps)
+    increments = steps[changes]
+    # the same test as seasonal.isPeak on the increments of consecutive SOC changes
+    peaks = np.flatnonzero((increments[1:] * increments[:-1] < 0) & (increments[:-1] > 0)) + 1
+    peakIndex = changes[peaks]  # sample with the peak SOC, the new value applies from the next sample
+    values = np.empty(len(peakIndex) + 1, dtype=np.int64)
+    values[0] = floatingMax = minMaxSoc
+    for number, peakSoc in enumerate(soc[peakIndex].tolist(), 1):
+        floatingMax = peakFloatingMax(peakSoc, floatingMax, minMaxSoc)
+        values[number] = floatingMax
+    return values[np.searchsorted(peakIndex + 1, np.arange(len(soc)), side="right")]
+
+
+def relay(times, soc, minSoc, hysteresis=FEEDINONHYS, signOfLife=SIGN_OF_LIFE):
+    '''Feed in relay per sample and the relay toggles, like seasonal.feedInRelay called by the sign of life.'''
+    ticks = np.arange(times[0] + signOfLife, times[-1] + signOfLife, signOfLife)
+    index = np.searchsorted(times, ticks, side="right") - 1
+    tickSoc, tickMin = soc[index], minSoc[index]
+    # +1 switches on, -1 switches off, 0 keeps the state
+    event = np.where(tickSoc >= tickMin + hysteresis, 1, np.where(tickSoc <= tickMin - hysteresis, -1, 0))
+    last = np.maximum.accumulate(np.where(event != 0, np.arange(len(event)), -1))
+    state = (last >= 0) & (event[np.maximum(last, 0)] > 0)
+    toggles = int(np.count_nonzero(np.diff(state.astype(np.int8), prepend=0)))
+    position = np.searchsorted(ticks, times, side="right") - 1
+    return (position >= 0) & state[np.maximum(position, 0)], toggles
+
+
+def backtest(times, soc, baseSoc=BASESOC, minMaxSoc=MINMAXSOC, hysteresis=FEEDINONHYS, signOfLife=SIGN_OF_LIFE):
+    '''Feed in hours, feed in days, lowest SOC during feed in and relay toggles of one parameter set.
+    The SOC is the recorded one, a different feed in would have changed it, the results compare the decisions.'''
+    floatingMax = floating_max(soc, minMaxSoc)
+    # seasonal.feedInMinSoc for all samples
+    minSoc = baseSoc - (np.minimum(floatingMax, MAXSOC) - baseSoc)
+    relayOn, toggles = relay(times, soc, minSoc, hysteresis, signOfLife)
+    feedIn = relayOn & (soc > minSoc)
+    duration = np.diff(times, append=times[-1])
+    duration[duration > MAX_GAP] = 0
+    return {
+        "base_soc": baseSoc,
+        "min_max_soc": minMaxSoc,
+        "hysteresis": hysteresis,
+        "feed_in_hours": round(float(duration[feedIn].sum()) / 3600, 1),
+        "feed_in_days": int(len(np.unique(times[feedIn] // 86400))),
+        "min_soc_feed_in": int(soc[feedIn].min()) if feedIn.any() else None,
+        "min_feed_in_min_soc": int(minSoc.min()),
+        "relay_toggles": toggles,
+    }
+
+
+def _range(text):
+    # "54", "50,54,58" or "50:58:2" with the end included
+    if ":" in text:
+        start, end, *step = (int(value) for value in text.split(":"))
+        return list(range(start, end + 1, step[0] if step else 1))
+    return [int(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*", help="CSV files with time stamp and SOC column, e.g. VRM exports")
+    parser.add_argument("--soc-column", help="part of the SOC column header, default 'state of charge' or 'soc'")
+    parser.add_argument("--synthetic", type=float, metavar="YEARS", help="synthetic SOC history instead of files")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-soc", type=_range, default=[BASESOC], help="e.g. 54, 50,54,58 or 50:58:2")
+    parser.add_argument("--min-max-soc", type=_range, default=[MINMAXSOC])
+    parser.add_argument("--hysteresis", type=_range, default=[FEEDINONHYS])
+    parser.add_argument("--sign-of-life", type=int, default=SIGN_OF_LIFE, help="[s] relay decision interval")
+    parser.add_argument("--sort", default="feed_in_hours", help="result column to sort by, descending")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        times, soc = synthetic(args.synthetic, args.seed)
+    elif args.files:
+        times, soc = load(args.files, args.soc_column)
+    else:
+        parser.error("no CSV files and no --synthetic")
+    started = time.monotonic()
+    results = [
+        backtest(times, soc, baseSoc, minMaxSoc, hysteresis, args.sign_of_life)
+        for baseSoc, minMaxSoc, hysteresis in itertools.product(args.base_soc, args.min_max_soc, args.hysteresis)
+    ]
+    elapsed = time.monotonic() - started
+    results.sort(key=lambda result: (result[args.sort] is None, -(result[args.sort] or 0)))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    days = (times[-1] - times[0]) / 86400
+    print(f"{len(soc)} samples over {days:.0f} days, {len(results)} parameter sets in {elapsed:.2f}s")
+    columns = list(results[0])
+    print(" ".join(f"{column:>19}" for column in columns))
+    for result in results:
+        print(" ".join(f"{str(result[column]):>19}" for column in columns))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+
+# system imports:
+import json
+import logging
+import os
+import time
+
+
+# Checkpoint class to keep the controller state over a restart.
+# Values are written only when changed and not more often than minWriteInterval seconds. The file is written to a
+# temporary file and renamed, so a crash leaves either the old or the new checkpoint but never a broken one.
+class Checkpoint:
+
+    def __init__(self, filename, minWriteInterval):
+        self._filename = filename
+        self._minWriteInterval = minWriteInterval
+        self._values = {}
+        self._savedAt = 0.0  # time stamp of the checkpoint file, used for the staleness checks
+        self._dirty = False
+        self._lastWrite = 0.0
+        self._load()
+
+    # age of the loaded checkpoint in seconds, large if there is none
+    def getAge(self):
+        return time.time() - self._savedAt
+
+    # value restored from the checkpoint if it is not older than maxAge seconds, otherwise default
+    def get(self, key, default, maxAge):
+        if key in self._values and self.getAge() <= maxAge:
+            return self._values[key]
+        return default
+
+    def set(self, key, value):
+        if self._values.get(key) != value:
+            self._values[key] = value
+            self._dirty = True
+
+    def flush(self, force=False):
+        now = time.time()
+        if not self._dirty or (not force and (now - self._lastWrite) < self._minWriteInterval):
+            return
+        tmpname = f"{self._filename}.tmp"
+        try:
+            with open(tmpname, "w", encoding="utf-8") as tmpfile:
+                json.dump({"time": now, "values": self._values}, tmpfile)
+                tmpfile.flush()
+                os.fsync(tmpfile.fileno())
+            os.replace(tmpname, self._filename)
+            self._savedAt = now
+            self._dirty = False
+        except OSError as e:
+            logging.warning(f"Checkpoint not written: {str(e)}")
+        # do not retry on each call if the file system is not writeable
+        self._lastWrite = now
+
+    def _load(self):
+        try:
+            with open(self._filename, "r", encoding="utf-8") as cpfile:
+                data = json.load(cpfile)
+            self._values = dict(data["values"])
+            self._savedAt = float(data["time"])
+            logging.info(f"Checkpoint loaded, age {int(self.getAge())}s")
+        except FileNotFoundError:
+            logging.info("No checkpoint found, start with defaults")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Checkpoint ignored: {str(e)}")
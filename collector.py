@@ -0,0 +1,310 @@
+
+# system imports:
+import configparser
+import logging
+import multiprocessing
+import os
+import time
+import requests  # for http GET in the collector process
+
+from dbus_service import DtuSocket, Singleton, COMMAND_PENDING
+from metrics import METRICS
+from loopwatch import WATCHDOG
+
+START_TIMEOUT = 30.0  # [s] wait for the first DTU data at startup, the services are created with it
+
+
+# (class name, user, password) of a requests auth object, digest auth objects are not picklable
+def _authSpec(auth):
+    return (type(auth).__name__, auth.username, auth.password) if auth else None
+
+
+def _fetchShelly(sessions, url, auth, timeout):
+    session = sessions.get(url)
+    if session is None:
+        session = sessions[url] = requests.Session()
+        if auth:
+            session.auth = getattr(requests.auth, auth[0])(auth[1], auth[2])
+    try:
+        rsp = session.get(url=url, timeout=timeout)
+        rsp.raise_for_status()
+        return ("ok", rsp.json())
+    except requests.HTTPError as e:
+        return ("http", str(e))
+    except requests.ConnectTimeout as e:
+        return ("connect", str(e))
+    except requests.ReadTimeout as e:
+        return ("read", str(e))
+    except requests.ConnectionError as e:
+        return ("connect", str(e))
+    except Exception as e:
+        return ("decode", str(e))
+
+
+def _snapshot(socket, shelly, results):
+    meterData = socket._meter_data
+    return {
+        # only the inverters are used, total and hints of the DTU stay here
+        "meterData": {"inverters": meterData["inverters"]} if meterData else None,
+        "nominalPower": socket._nominalPower,
+        "updateStamp": socket._updateStamp,
+        "fresh": socket._fresh,
+        "counters": socket.getErrorCounter(),
+        "results": results,
+        "shelly": shelly,
+        "metrics": METRICS.take(),
+    }
+
+
+# collector process: owns the DTU socket and the Shelly sessions, answers each collect request with one snapshot
+# and executes the commands in the order they are sent
+def _collect(connection, httptimeout):
+    Singleton._instances.pop(DtuSocket, None)
+    METRICS.take()  # forked copy of the DBUS process values, only deltas of this process are sent
+    socket = DtuSocket()
+    socket.commandSpacing = 0.0  # enforced by the DBUS process
+    sessions = {}
+    results = {}
+    while True:
+        try:
+            kind, *args = connection.recv()
+            if kind == "stop":
+                return
+            if kind == "collect":
+                # Shelly first, the grid value is the most time critical one
+                shelly = {url: _fetchShelly(sessions, url, auth, float(httptimeout)) for url, auth in args[0]}
+                socket.fetchLimitData()
+                connection.send(_snapshot(socket, shelly, results))
+                results = {}
+            elif kind == "push":
+                results[("push", args[0])] = socket.pushNewLimit(*args)
+            elif kind == "switch":
+                results[("switch", args[0])] = socket.switchOnOff(*args)
+            elif kind == "resetDevice":
+                results[("resetDevice", args[0])] = socket.resetDevice(*args)
+            elif kind == "resetDTU":
+                results[("resetDTU", None)] = socket.resetDTU()
+        except (EOFError, OSError):
+            # main process is gone
+            return
+        except Exception as e:
+            logging.critical('Error at %s', '_collect', exc_info=e)
+
+
+# response of a Shelly fetch done by the collector process
+class CollectedResponse:
+
+    def __init__(self, data):
+        self.status_code = 200
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+    def close(self):
+        pass
+
+
+# requests.Session stand-in for the Shelly service, each collected result is returned once
+class RemoteSession:
+
+    def __init__(self, socket):
+        self._socket = socket
+
+    def get(self, url, auth=None, **kwargs):
+        return self._socket.getCollected(url, auth)
+
+
+# RemoteDtuSocket class, proxy of the DtuSocket in the collector process.
+# Network I/O and JSON decoding run in the collector process, the DBUS process only unpickles the snapshots and never
+# waits for the network. prefetch() sends the collect request the collect time before the next cycle (collectorLead,
+# at least HTTPTimeout per request of the collector), the cycle uses the newest snapshot. A Shelly result missing at
+# the cycle is replaced by the last one while it is younger than a cycle, otherwise it is awaited up to the collect
+# time, a URL used for the first time (startup, meter detection) is collected at once. Commands are sent at once and
+# return COMMAND_PENDING, the result of a limit push arrives with a later snapshot and is taken once with
+# takeLimitResult, failed switch and reset commands are logged.
+class RemoteDtuSocket(DtuSocket):
+
+    def __init__(self):
+        self._process = None
+        self._connection = None
+        self._outstanding = False  # collect request sent and not answered
+        self._urls = {}  # url -> auth spec, requested since the last prefetch
+        self._shelly = {}  # url -> (kind, data), not yet used results
+        self._lastShelly = {}  # url -> (monotonic receive time, data) of the last good result
+        self._interval = 0.0  # [s] cycle interval of the last prefetch
+        self._lead = 0.0  # [s] collect time used by the last prefetch
+        self.collectorLead = 1.0
+        self._pendingFresh = {}  # freshness of the snapshots received since the last fetchLimitData
+        self._results = {}  # inverter number -> result of the last limit push, until taken
+        super().__init__()
+
+    def _initSession(self):
+        self._read_config_dtu()
+        self._start()
+        self._request()
+        if not self._receive(START_TIMEOUT):
+            logging.warning("No data from the collector process at startup")
+
+    def _read_config_dtu(self):
+        super()._read_config_dtu()
+        config = configparser.ConfigParser()
+        config.read(f"{(os.path.dirname(os.path.realpath(__file__)))}/config.ini")
+        self.collectorLead = float(config["DEFAULT"].get("collectorLead", fallback=1.0))
+
+    def _start(self):
+        context = multiprocessing.get_context("fork")
+        self._connection, childConnection = context.Pipe()
+        self._process = context.Process(target=_collect, args=(childConnection, self.httptimeout),
+                                        name="collector", daemon=True)
+        self._process.start()
+        childConnection.close()
+        self._outstanding = False
+        logging.info(f"Collector process started, pid {self._process.pid}")
+
+    def _send(self, message):
+        try:
+            self._connection.send(message)
+            return True
+        except OSError as e:
+            logging.warning(f"Collector process not reachable: {str(e)}")
+            return False
+
+    # collect the URLs of this cycle, True if a request is outstanding
+    def _request(self):
+        if not self._process.is_alive():
+            logging.warning("Collector process stopped, restart it")
+            self._start()
+        if not self._outstanding:
+            self._outstanding = self._send(("collect", sorted(self._urls.items())))
+        return self._outstanding
+
+    # GLib timer callback, one shot, the URLs of the next cycle are requested anew
+    def _sendRequest(self):
+        if self._request():
+            self._urls = {}
+        return False
+
+    # worst case duration of a collect: each Shelly URL, the DTU data and the nominal power time out
+    def _collectTime(self):
+        return float(self.httptimeout) * (len(self._urls) + 2)
+
+    # apply all received snapshots, returns True if at least one was received
+    def _receive(self, timeout=0.0):
+        received = False
+        try:
+            while self._connection.poll(timeout):
+                snapshot = self._connection.recv()
+                timeout = 0.0
+                received = True
+                self._outstanding = False
+                if snapshot["meterData"]:
+                    self._meter_data = snapshot["meterData"]
+                self._nominalPower = snapshot["nominalPower"]
+                self._updateStamp = snapshot["updateStamp"]
+                for invSerial, fresh in snapshot["fresh"].items():
+                    self._pendingFresh[invSerial] = self._pendingFresh.get(invSerial, False) or fresh
+                (self.FetchCounter, self.ReadError, self.WriteError, self.ConnectError) = snapshot["counters"]
+                for (kind, pvinverternumber), result in snapshot["results"].items():
+                    if kind == "push":
+                        self._results[pvinverternumber] = result
+                    elif not result:
+                        logging.warning(f"Collector process: {kind} of inverter {pvinverternumber} failed")
+                self._shelly.update(snapshot["shelly"])
+                for url, (kind, data) in snapshot["shelly"].items():
+                    if kind == "ok":
+                        self._lastShelly[url] = (time.monotonic(), data)
+                METRICS.merge(snapshot["metrics"])
+        except (EOFError, OSError) as e:
+            logging.warning(f"Collector process not readable: {str(e)}")
+            self._outstanding = False
+        return received
+
+    def prefetch(self, interval):
+        lead = max(self.collectorLead, self._collectTime())
+        if lead != self._lead:
+            if lead > self.collectorLead:
+                logging.info(f"collectorLead {self.collectorLead} s is below the collect time, {lead} s used")
+            self._lead = lead
+        self._interval = interval
+        WATCHDOG.timeout_add(max(0, int((interval - lead) * 1000)), self._sendRequest)
+
+    def createSession(self):
+        return RemoteSession(self)
+
+    # the result of the URL: the last one while younger than a cycle, else awaited up to the collect time
+    def _awaitCollected(self, url):
+        stamp, data = self._lastShelly.get(url, (None, None))
+        if stamp is not None and time.monotonic() - stamp < self._interval:
+            self._shelly[url] = ("ok", data)
+            return
+        deadline = time.monotonic() + 2 * self._collectTime()  # an outstanding request and one with the URL
+        while url not in self._shelly:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._request():
+                return
+            self._receive(remaining)
+
+    # newest Shelly result for the URL, the URL is collected for the next cycle
+    def getCollected(self, url, auth=None):
+        self._urls[url] = _authSpec(auth)
+        self._receive()
+        if url not in self._shelly:
+            self._awaitCollected(url)
+        kind, data = self._shelly.pop(url, ("read", f"no answer of the collector process within "
+                                                   f"{2 * self._collectTime()} s"))
+        if kind == "ok":
+            return CollectedResponse(data)
+        if kind == "http":
+            raise requests.HTTPError(data)
+        if kind == "read":
+            raise requests.ReadTimeout(data)
+        if kind == "connect":
+            raise requests.ConnectionError(data)
+        raise ValueError(data)
+
+    def skipFetch(self):
+        super().skipFetch()
+        self._receive()
+
+    def fetchLimitData(self):
+        self.SwitchCounter = 0
+        self.ResetCounter = max(0, self.ResetCounter - 1)
+        self._receive()
+        self._fresh, self._pendingFresh = self._pendingFresh, {}
+        return bool(self._meter_data) and any(self._fresh.values())
+
+    def takeLimitResult(self, pvinverternumber):
+        return self._results.pop(pvinverternumber, None)
+
+    def resetDevice(self, pvinverternumber):
+        return COMMAND_PENDING if self._send(("resetDevice", pvinverternumber)) else 0
+
+    def resetDTU(self):
+        return COMMAND_PENDING if self._send(("resetDTU",)) else 0
+
+    def pushNewLimit(self, pvinverternumber, newLimit, absolute=False):
+        if not self.isCommandReady(pvinverternumber):
+            logging.info("RESULT: pushNewLimit, skip limit within DTU_commandSpacing")
+            return 0
+        self._lastCommand[pvinverternumber] = time.monotonic()
+        self._results.pop(pvinverternumber, None)  # answer of an older limit, superseded by this one
+        return COMMAND_PENDING if self._send(("push", pvinverternumber, newLimit, absolute)) else 0
+
+    def switchOnOff(self, pvinverternumber, boOn):
+        if self.SwitchCounter != 0:
+            logging.info("RESULT: switchOnOff, skip switching to avoid to much switching")
+            return 0
+        self.SwitchCounter += 1
+        return COMMAND_PENDING if self._send(("switch", pvinverternumber, boOn)) else 0
+
+
+# start the collector process, DtuSocket() returns the proxy afterwards. Call it before DBUS connections are opened,
+# the process is forked.
+def startCollector():
+    socket = RemoteDtuSocket()
+    Singleton._instances[DtuSocket] = socket
+    return socket
@@ -14,6 +14,8 @@ import sys
 # our imports:
 from dbus_service import OpenDTUService, DCSystemService, DCTempService, DtuSocket, DCAlarmService
 from dbus_shelly_service import DbusShellyemService
+from metrics import METRICS
+from loopwatch import WATCHDOG
 
 if sys.version_info.major == 2:
     import gobject  # pylint: disable=E0401
@@ -53,6 +55,15 @@ def main():
         # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
         DBusGMainLoop(set_as_default=True)
 
+        # optional MQTT transport of the DTU or collector process for the HTTP fetches, forked before any DBUS
+        # connection is opened
+        if config["DEFAULT"].getboolean("DTU_mqtt", fallback=False):
+            from dtumqtt import startDtuMqtt  # pylint: disable=C0415
+            startDtuMqtt()
+        elif config["DEFAULT"].getboolean("collectorProcess", fallback=False):
+            from collector import startCollector  # pylint: disable=C0415
+            startCollector()
+
         # Use DtuSocket singleton to get init data
         socket = DtuSocket()
 
@@ -70,7 +81,7 @@ def main():
         # /Dc/0/Temperature          <-- Degrees centigrade, temperature sensor on SmarShunt/BMV
         # /Dc/1/Voltage              <-- SmartShunt/BMV secondary battery voltage (if configured)
         # /History/EnergyIn          <-- Total energy consumed by dc load(s).
-        # /History/EnergyOut         <-- Total energy generated by ++dcsystem++ 
+        # /History/EnergyOut         <-- Total energy generated by ++dcsystem++, for the HMs the DC energy taken from the battery
         # /Alarms/LowVoltage         <-- Low voltage alarm
         # /Alarms/HighVoltage        <-- High voltage alarm
         # /Alarms/LowStarterVoltage  <-- Low voltage secondary battery (if configured)
@@ -178,6 +189,7 @@ def main():
         # /Ac/Voltage            <- V AC - Deprecated
         # /Ac/L1/Current         <- A AC
         # /Ac/L1/Energy/Forward  <- kWh  - bought
+        # /Ac/L1/Energy/Reverse  <- kWh  - sold
         # /Ac/L1/Power           <- W, real power
         # /Ac/L1/Voltage         <- V AC
         # /Ac/L2/*               <- same as L1
@@ -186,6 +198,7 @@ def main():
         # /ErrorCode
         acPaths = {
             '/Ac/Energy/Forward': {'initial': 0, 'textformat': _kwh}, # energy bought from the grid
+            '/Ac/Energy/Reverse': {'initial': 0, 'textformat': _kwh}, # energy fed into the grid
             '/Ac/Power': {'initial': 0, 'textformat': _w},
             '/Ac/Current': {'initial': 0, 'textformat': _a},
             '/Ac/Voltage': {'initial': 0, 'textformat': _v_ac},
@@ -193,7 +206,17 @@ def main():
             '/Ac/L1/Current': {'initial': 0, 'textformat': _a},
             '/Ac/L1/Power': {'initial': 0, 'textformat': _w},
             '/Ac/L1/Energy/Forward': {'initial': 0, 'textformat': _kwh},
+            '/Ac/L1/Energy/Reverse': {'initial': 0, 'textformat': _kwh},
         }
+        # Shelly 3EM, one emeter per phase
+        for phase in range(2, int(config["SHELLY"].get("Phases", fallback=1)) + 1):
+            acPaths.update({
+                f'/Ac/L{phase}/Voltage': {'initial': 0, 'textformat': _v_ac},
+                f'/Ac/L{phase}/Current': {'initial': 0, 'textformat': _a},
+                f'/Ac/L{phase}/Power': {'initial': 0, 'textformat': _w},
+                f'/Ac/L{phase}/Energy/Forward': {'initial': 0, 'textformat': _kwh},
+                f'/Ac/L{phase}/Energy/Reverse': {'initial': 0, 'textformat': _kwh},
+            })
 
         #[SHELLY]
         servicename="com.victronenergy.acload"
@@ -207,6 +230,17 @@ def main():
             tempService=tempService,
         )
 
+        # optional Prometheus endpoint on its own thread, 0 disables
+        metricsPort = int(config["DEFAULT"].get("metricsPort", fallback=0))
+        if metricsPort:
+            METRICS.start(config["DEFAULT"].get("metricsBind", fallback="127.0.0.1"), metricsPort)
+
+        # GLib loop watchdog, timers later than watchdogStall seconds are logged with the callbacks running meanwhile
+        WATCHDOG.configure(
+            float(config["DEFAULT"].get("watchdogStall", fallback=2.0)),
+            config["DEFAULT"].getboolean("watchdogStackDump", fallback=False),
+        )
+
         # start our main-service
         logging.info("Connected to dbus, and switching over to gobject.MainLoop() (= event based)")
         mainloop = gobject.MainLoop()
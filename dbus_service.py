@@ -13,11 +13,6 @@ import copy
 # victron imports:
 import dbus
 
-if sys.version_info.major == 2:
-    import gobject
-else:
-    from gi.repository import GLib as gobject
-
 sys.path.insert(
     1,
     os.path.join(
@@ -28,6 +23,12 @@ sys.path.insert(
 from vedbus import VeDbusService  # noqa - must be placed after the sys.path.insert
 from version import softwareversion
 from vedbus import VeDbusItemImport
+from metrics import METRICS
+from derating import ThermalModel
+from efficiency import EfficiencyCurve, BINS as EFFICIENCY_BINS
+from alarms import AlarmAggregator, ALARM_DEFINITIONS, ALARM_NONE
+from alarms import ALARM_GRID, ALARM_TEMPERATURE, ALARM_DTU, ALARM_FETCH, ALARM_HM, ALARM_BALCONY, ALARM_BATTERY
+from aggregates import DailyAggregate
 
 
 # Singleton metaclass, see pattern ...
@@ -55,6 +56,11 @@ class DtuSocket(metaclass=Singleton):
         self.FetchCounter = 0
         self.SwitchCounter = 0
         self.ResetCounter = 0
+        self._nominalPower = {}  # nominal power in watts cached per serial, see _refresh_nominal_power
+        self._updateStamp = {}  # time stamp per serial of the last new data delivered by the DTU
+        self._fresh = {}  # per serial, True if the last fetch delivered new data
+        self.commandSpacing = 0.0  # [s] min. time between two limits to the same inverter
+        self._lastCommand = {}  # monotonic time of the last limit per inverter number
         self._initSession()
 
     def _initSession(self):        
@@ -68,21 +74,54 @@ class DtuSocket(metaclass=Singleton):
                 self._session.auth=(self.username, self.password)
             # first fetch on first inverter
             self._refresh_data()
+            self._refresh_nominal_power()
 
     def getLimitData(self, pvinverternumber):
         # copied json strings are passed to the inverters and hopefully collected with an garbage collector when an new string is passed
         return self._meter_data["inverters"][pvinverternumber].copy() if self._meter_data else None
     
+    def getNominalPower(self, pvinverternumber):
+        # nominal power in watts, cached from /api/limit/status, back computed from the actual limit as fallback
+        invData = self._meter_data["inverters"][pvinverternumber]
+        nominalPower = self._nominalPower.get(invData["serial"], 0)
+        if not nominalPower and float(invData["limit_relative"]) > 0:
+            nominalPower = int(float(invData["limit_absolute"]) * 100 / float(invData["limit_relative"]))
+        return nominalPower
+
+    # freshness per inverter, each inverter is updated by the DTU on its own
+    def isFresh(self, pvinverternumber):
+        invSerial = self._meter_data["inverters"][pvinverternumber]["serial"] if self._meter_data else None
+        return self._fresh.get(invSerial, False)
+
+    def getUpdateStamp(self, pvinverternumber):
+        invSerial = self._meter_data["inverters"][pvinverternumber]["serial"] if self._meter_data else None
+        return self._updateStamp.get(invSerial, 0)
+
+    def getDataAge(self, pvinverternumber):
+        stamp = self.getUpdateStamp(pvinverternumber)
+        return int(time.time() - stamp) if stamp else COUNTERLIMIT
+
+    def skipFetch(self):
+        # loop without fetch, the data is kept but nothing is new
+        self.SwitchCounter = 0
+        self.ResetCounter = max(0, self.ResetCounter - 1)
+        self._fresh = {}
+        METRICS.inc("opendtu_fetch_skipped_total")
+
     def fetchLimitData(self):
         self.SwitchCounter = 0
         self.ResetCounter = max(0, self.ResetCounter - 1)
         if self._session:
             result = False
             try: 
-                ageBeforeRefresh = (self._meter_data["inverters"][0]["data_age"]) if self._meter_data else 0
                 self._refresh_data()
-                ageAfterRefresh = (self._meter_data["inverters"][0]["data_age"])
-                result = (ageBeforeRefresh != ageAfterRefresh)
+                # True if at least one inverter delivered new data
+                result = any(self._fresh.values())
+                # fetch once for new inverters, nominal power does not change, retry unknown values from time to time
+                serials = [invData["serial"] for invData in self._meter_data["inverters"]]
+                if (   any(invSerial not in self._nominalPower for invSerial in serials)
+                    or (not all(self._nominalPower.values()) and self.FetchCounter == 0)):
+                    self._refresh_nominal_power()
             finally:
                 return result
         else:
@@ -109,6 +148,7 @@ class DtuSocket(metaclass=Singleton):
             logging.warning(f"HTTP Error at resetDevice for inverter "
                 f"{pvinverternumber} ({name}): {str(e)}")
         finally:
+            METRICS.inc("opendtu_reset_total", target="inverter", result="ok" if result else "error")
             return result
     
     # curl -u "User:Passwort" http://10.1.1.98/api/maintenance/reboot -d 'data={"reboot":true}'
@@ -130,21 +170,35 @@ class DtuSocket(metaclass=Singleton):
                 timeout=float(self.httptimeout)
                 )
             logging.info(f"RESULT: resetDevice, response = {str(rsp.status_code)}")
-            self.ResetCounter = 10 # avoid to much reset in case of connection problems, only allow reset every 10 loops, depends on loop time counted in seconds
+            # avoid to much reset in case of connection problems, only allow reset every 10 loops
+            self.ResetCounter = 10
             if rsp:
                 result = 1
+            METRICS.inc("opendtu_reset_total", target="dtu", result="ok" if result else "error")
         except Exception as e:
+            METRICS.inc("opendtu_reset_total", target="dtu", result="error")
             logging.warning("HTTP Error on reboot DTU")
         finally:
             return result
     
-    def pushNewLimit(self, pvinverternumber, newLimitPercent):
+    # False while the last limit of the inverter is younger than commandSpacing, the DTU forwards each limit to the
+    # inverter by radio and a newer one replaces a limit not yet applied
+    def isCommandReady(self, pvinverternumber):
+        return time.monotonic() - self._lastCommand.get(pvinverternumber, float("-inf")) >= self.commandSpacing
+
+    # limit_type 0 = absolute non persistent [W], 1 = relative non persistent [%]
+    def pushNewLimit(self, pvinverternumber, newLimit, absolute=False):
         result = 0  # 0 AKA not connected
+        if not self.isCommandReady(pvinverternumber):
+            logging.info(f"RESULT: pushNewLimit, skip limit within DTU_commandSpacing")
+            return 0
+        self._lastCommand[pvinverternumber] = time.monotonic()
         try:
             invSerial = self._meter_data["inverters"][pvinverternumber]["serial"]
             name = self._meter_data["inverters"][pvinverternumber]["name"]
             url = f"http://{self.host}/api/limit/config"
-            payload = f'data={{"serial":"{invSerial}", "limit_type":1, "limit_value":{newLimitPercent}}}'
+            limitType = 0 if absolute else 1
+            payload = f'data={{"serial":"{invSerial}", "limit_type":{limitType}, "limit_value":{newLimit}}}'
             rsp = self._session.post(
                 url = url, 
                 data = payload,
@@ -159,6 +213,7 @@ class DtuSocket(metaclass=Singleton):
             logging.warning(f"HTTP Error at pushNewLimit for inverter "
                 f"{pvinverternumber} ({name}): {str(e)}")
         finally:
+            METRICS.inc("opendtu_limit_push_total", inverter=pvinverternumber, result="ok" if result else "error")
             return result
 
     def switchOnOff(self, pvinverternumber, boOn):
@@ -186,11 +241,25 @@ class DtuSocket(metaclass=Singleton):
             logging.warning(f"HTTP Error at switchOnOff for inverter "
                 f"{pvinverternumber} ({name}): {str(e)}")
         finally:
+            METRICS.inc("opendtu_switch_total", inverter=pvinverternumber, action="on" if boOn else "off",
+                        result="ok" if result else "error")
             return result
 
     def getErrorCounter(self):
         return (self.FetchCounter, self.ReadError, self.WriteError, self.ConnectError)
 
+    # session for the Shelly fetches, the collector process proxy returns collected responses (see collector.py)
+    def createSession(self):
+        return requests.Session()
+
+    # answer of a limit push that returned COMMAND_PENDING, None while none arrived (sent synchronously here)
+    def takeLimitResult(self, pvinverternumber):
+        return None
+
+    # request the data of the next cycle in interval seconds, fetched synchronously by the cycle itself here
+    def prefetch(self, interval):
+        pass
+
     # read config file
     def _read_config_dtu(self):
         config = configparser.ConfigParser()
@@ -199,16 +268,21 @@ class DtuSocket(metaclass=Singleton):
         self.username = config["DEFAULT"]["Username"]
         self.password = config["DEFAULT"]["Password"]
         self.httptimeout = config["DEFAULT"]["HTTPTimeout"]
+        self.commandSpacing = float(config["DEFAULT"].get("DTU_commandSpacing", fallback=0))
 
     def _refresh_data(self):
         '''Fetch new data from the DTU API and store in locally if successful.'''
         url = f"http://{self.host}/api/livedata/status"
         meter_data = self._fetch_url(url)
+        fetchTime = time.time()
+        self._fresh = {}
         if meter_data:
             try:
+                receivedSerials = self._merge_inverters(meter_data)
                 self._check_opendtu_data(meter_data)
                 #Store meter data for later use in other methods
                 self._meter_data = meter_data
+                self._update_freshness(fetchTime, receivedSerials)
                 self.FetchCounter = _incLimitCnt(self.FetchCounter)
             except Exception as e:
                 logging.critical('Error at %s', '_fetch_url', exc_info=e)
@@ -216,7 +290,58 @@ class DtuSocket(metaclass=Singleton):
             logging.info("_fetch_url returned null, reset session ")
             # self._session.close()
             # self._session = requests.Session()
-        
+
+    def _merge_inverters(self, meter_data):
+        '''Keep the inverter order and the last good data of inverters missing in a partial response.
+        Returns the serials with complete new data.'''
+        receivedSerials = set()
+        newBySerial = {}
+        for invData in meter_data["inverters"]:
+            newBySerial[invData["serial"]] = invData
+            receivedSerials.add(invData["serial"])
+        if not self._meter_data:
+            return receivedSerials
+        merged = []
+        for oldData in self._meter_data["inverters"]:
+            invData = newBySerial.pop(oldData["serial"], None)
+            if invData is None:
+                merged.append(oldData)
+                continue
+            for key in ("AC", "DC", "INV"):
+                if key not in invData and key in oldData:
+                    invData[key] = oldData[key]
+                    receivedSerials.discard(invData["serial"])
+            merged.append(invData)
+        merged.extend(newBySerial.values())
+        meter_data["inverters"] = merged
+        return receivedSerials
+
+    def _update_freshness(self, fetchTime, receivedSerials):
+        '''Track per serial when the DTU delivered new data, data_age is the age in seconds at fetch time.'''
+        for invData in self._meter_data["inverters"]:
+            invSerial = invData["serial"]
+            if invSerial not in receivedSerials:
+                self._fresh[invSerial] = False
+                continue
+            if _is_true(invData.get("reachable")):
+                stamp = fetchTime - float(invData.get("data_age", 0))
+            else:
+                # an unreachable inverter never gets new data, the fetch itself is the new information
+                stamp = fetchTime
+            fresh = stamp > (self._updateStamp.get(invSerial, 0) + DATA_AGE_TOLERANCE)
+            if fresh:
+                self._updateStamp[invSerial] = stamp
+            self._fresh[invSerial] = fresh
+
+    # curl -u "User:Passwort" http://10.1.1.98/api/limit/status -> {"1141xxx":{"limit_relative":100,"max_power":400,...}}
+    def _refresh_nominal_power(self):
+        '''Fetch the nominal power of all inverters and cache it per serial.'''
+        url = f"http://{self.host}/api/limit/status"
+        limit_status = self._fetch_url(url)
+        if limit_status:
+            for invSerial, status in limit_status.items():
+                self._nominalPower[invSerial] = int(status.get("max_power", 0))
+
     def _check_opendtu_data(self, meter_data):
         ''' Check if OpenDTU data has the right format'''
         # Check for OpenDTU Version
@@ -228,6 +353,8 @@ class DtuSocket(metaclass=Singleton):
     def _fetch_url(self, url):
         '''Fetch JSON data from url. Throw an exception on any error. Only return on success.'''
         json = None
+        error = None
+        fetchStart = time.monotonic()
         try:
             logging.debug(f"calling {url} with timeout={self.httptimeout}")
             rsp = self._session.get(url=url, timeout=float(self.httptimeout))
@@ -235,18 +362,27 @@ class DtuSocket(metaclass=Singleton):
             logging.info(f"_fetch_url response status code: {str(rsp.status_code)}")
             json = rsp.json()
         except requests.HTTPError as http_err:
+            error = "http"
             logging.info(f"_fetch_url response http error: {http_err}")
         except requests.ConnectTimeout as e:
             # Requests that produced this error are safe to retry.
+            error = "connect"
             self.ConnectError += 1
         except requests.ReadTimeout as e:
+            error = "read"
             self.ReadError += 1
         except requests.ConnectionError as e:
             # site does not exist
+            error = "connect"
             self.ConnectError += 1
         except Exception as err:
+            error = "decode"
             logging.critical('Error at %s', '_fetch_url', exc_info=err)
         finally:
+            METRICS.inc("opendtu_fetch_total", target="dtu")
+            METRICS.observe("opendtu_fetch_seconds", time.monotonic() - fetchStart, target="dtu")
+            if error:
+                METRICS.inc("opendtu_fetch_errors_total", target="dtu", kind=error)
             return json
 
 
@@ -259,6 +395,8 @@ HARDWARE_VERSION = 0
 CONNECTED = 1
 
 COUNTERLIMIT = 255
+UNKNOWN_SERIAL = "--" # inverter without DTU data at startup, no checkpoint is kept until the serial is known
+COMMAND_PENDING = 2 # command sent, the result arrives later (collector process), see takeLimitResult
 PRODUCE_COUNTER = 90 #number of loops, depends on loop time counted in seconds
 ON_COUNTER_VALUE = 60 #number of loops, depends on loop time counted in seconds
 OFF_COUNTER_VALUE = 0 #number of loops, depends on loop time counted in seconds
@@ -268,16 +406,12 @@ STATE_ALARM = 9
 ALARM_OK = 0
 ALARM_WARNING = 1
 ALARM_ALARM = 2
-ALARM_GRID = "Grid Shelly HTTP"
-ALARM_TEMPERATURE = "Temperature"
-ALARM_DTU = "OpenDTU HTTP Push"
-ALARM_FETCH = "OpenDTU HTTP Fetch"
-ALARM_HM = "OpenDTU HM state"
-ALARM_BALCONY = "Balcony Shelly HTTP"
-ALARM_BATTERY = "Battery charge current limit"
-ALARM_NONE = "HM status (--)"
 
 TEMPERATURE_OFF_OFFSET = 5 #deegre to cool down
+HM_STATES = ("Init", "Connect", "Grid", "Producing", "SwitchOff", "Off", "SwitchOn", "Error") # index used in the ring log
+RESTORE_STATES = ("Grid", "Producing", "Off") # HM states restored after a restart
+DATA_AGE_TOLERANCE = 1.5 #seconds, data_age is an integer and the fetch takes time
+PHASES = ("L1", "L2", "L3")
 
 
 def _incLimitCnt(value):
@@ -288,6 +422,21 @@ def _is_true(val):
     return val in (1, '1', True, "True", "true")
 
 
+# VeDbusService remembering the paths added by the script, the DBUS snapshot reads them without the velib internals
+class SnapshotDbusService(VeDbusService):
+
+    def __init__(self, *args, **kwargs):
+        self.paths = []
+        super().__init__(*args, **kwargs)
+
+    def add_path(self, path, *args, **kwargs):
+        self.paths.append(path)
+        return super().add_path(path, *args, **kwargs)
+
+    # all path values for the DBUS snapshot
+    def getValues(self):
+        return {path: self[path] for path in self.paths}
+
 # DBUS registry metaclass for all instance of DBUS service, see pattern in ...
 class DCloadRegistry(type):
     '''Run a registry for all PV Inverter'''
@@ -316,10 +465,11 @@ class DCLoadDbusService(metaclass=DCloadRegistry):
             else dbus.SystemBus(private=True)
         )
 
-        self._dbusservice = VeDbusService("{}.http_{:03d}".format(servicename, self._deviceinstance), dbus_conn)
+        self._dbusservice = SnapshotDbusService("{}.http_{:03d}".format(servicename, self._deviceinstance), dbus_conn)
 
         # Create the mandatory objects
-        self._dbusservice.add_mandatory_paths(__file__, softwareversion, CONNECTION, self._deviceinstance, PRODUCT_ID, PRODUCTNAME, FIRMWARE_VERSION, HARDWARE_VERSION, CONNECTED)
+        self._dbusservice.add_mandatory_paths(__file__, softwareversion, CONNECTION, self._deviceinstance, PRODUCT_ID,
+                                              PRODUCTNAME, FIRMWARE_VERSION, HARDWARE_VERSION, CONNECTED)
          # add path values to dbus
         self._paths = paths
         for path, settings in self._paths.items():
@@ -336,6 +486,13 @@ class DCLoadDbusService(metaclass=DCloadRegistry):
         logging.debug("someone else updated %s to %s" % (path, value))
         return True # accept the change
 
+    # all path values of the service for the DBUS snapshot
+    def getSnapshot(self):
+        return {
+            "service": "{}.http_{:03d}".format(self._servicename, self._deviceinstance),
+            "values": self._dbusservice.getValues(),
+        }
+
     # read config file
     def _read_config_dtu_self(self, actual_inverter):
         config = configparser.ConfigParser()
@@ -345,8 +502,13 @@ class DCLoadDbusService(metaclass=DCloadRegistry):
         self.configMinPercent = int(config["DEFAULT"]["MinPercent"])
         self.configMaxPercent = int(config["DEFAULT"]["MaxPercent"])
         self.configStepsPercent = int(config["DEFAULT"]["stepsPercent"])
+        self.configAbsoluteLimit = config["DEFAULT"].get("limitType", fallback="relative") == "absolute"
+        self.configStepsWatt = int(config["DEFAULT"].get("stepsWatt", fallback=1))
         self.configMaxTemperature = int(config["DEFAULT"]["maxTemperature"])
+        self.configDerating = config["DEFAULT"].getboolean("temperatureDerating", fallback=False)
         self.configEnableSwitchOff = config[f"INVERTER{actual_inverter}"].getboolean("enableSwitchOff", fallback=True)
+        # index of the grid phase the inverter feeds in, L1 = 0
+        self.configPhase = PHASES.index(config[f"INVERTER{actual_inverter}"].get("Phase", fallback="L1"))
 
 
 # DBUS com.victronenergy.dcsystem class, consumed power by HM inverters added to the production limit (CCL) of solar inverters 
@@ -411,19 +573,16 @@ class DCAlarmService(DCLoadDbusService):
         # init & register DBUS service
         super().__init__(servicename, self.configDeviceInstance, paths)
         self._dbusservice.add_path("/CustomName", ALARM_NONE, writeable=True)
+        self._dbusservice.add_path("/ActiveAlarms", 0)  # bitmask of all active alarms, see ALARM_DEFINITIONS
         self.__class__._alarmInstance = self
 
-    # set alarm, first wins
-    def setAlarmName(self, name):
-        if self._dbusservice["/Alarm"] == ALARM_OK:
+    # winning alarm name or ALARM_NONE, written only on changes
+    def setActiveAlarm(self, name, bitmask):
+        if self._dbusservice["/ActiveAlarms"] != bitmask:
+            self._dbusservice["/ActiveAlarms"] = bitmask
+        if self._dbusservice["/CustomName"] != name:
             self._dbusservice["/CustomName"] = name
-            self.setAlarmState(True)
-
-    # reset alarm, if alarm name matches
-    def resetAlarmName(self, name):
-        if self._dbusservice["/Alarm"] == ALARM_ALARM and self._dbusservice["/CustomName"] == name:
-            self.setAlarmState(False)
-            self._dbusservice["/CustomName"] = ALARM_NONE
+            self.setAlarmState(name != ALARM_NONE)
 
     # public functions
     def setAlarmState(self, on):
@@ -436,17 +595,33 @@ class DCAlarmService(DCLoadDbusService):
             self._dbusservice["/Alarm"] = ALARM_OK
             self._dbusservice["/State"] = STATE_OK
 
+# alarms of all services, reported during the cycle and published once by publishAlarms
+_alarmAggregator = AlarmAggregator(ALARM_DEFINITIONS)
+
 def setAlarmOnService(name, device: str, on: bool):
+    _alarmAggregator.report(name, device, on)
+
+def _alarmText(name, device):
+    return f"HM status ({device}: {name})" if device else f"HM status ({name})"
+
+# publish stage, debounce the reports of the cycle and write the winner, the bitmask and the inverter alarm paths
+def publishAlarms():
+    for name, device in _alarmAggregator.evaluate(time.monotonic()):
+        on = _alarmAggregator.isActive(name, device)
+        if on:
+            METRICS.inc("opendtu_alarms_total", alarm=name, device=device)
+        METRICS.set("opendtu_alarm_active", int(on), alarm=name, device=device)
+        logging.info(f"{_alarmText(name, device)} {'active' if on else 'cleared'}")
+    active = _alarmAggregator.getActive()
+    text = _alarmText(*active[0]) if active else ALARM_NONE
+    if len(active) > 1:
+        text = f"{text} +{len(active) - 1}"
     inst:DCAlarmService = DCAlarmService._alarmInstance
-    txt = ALARM_NONE
-    if device:
-        txt = f"HM status ({device}: {name})"
-    else:
-        txt = f"HM status ({name})"
-    if on: 
-        inst.setAlarmName(txt)
-    else:
-        inst.resetAlarmName(txt)
+    if inst:
+        inst.setActiveAlarm(text, _alarmAggregator.getBitmask())
+    for service in DCLoadDbusService:
+        if isinstance(service, OpenDTUService):
+            service.updateAlarms(_alarmAggregator.isActive)
 
 
 # DBUS com.victronenergy.dcload class for HM inverters logic using singleto class DtuSocket for DTU communication    
@@ -478,10 +653,20 @@ class OpenDTUService(DCLoadDbusService):
 
         self._tempAlarm = False
         self._WriteAlarm = False
+        # lower limit in the unit of /LastLimit, percent or watts depending on limitType
+        self._minLimit = self.configMinPercent
+        # learned temperature rise against output for the derating
+        self._thermal = ThermalModel(self.configMaxTemperature, self.configMaxTemperature + TEMPERATURE_OFF_OFFSET)
+        # efficiency per load level and the last sample (AC energy [Wh] since the sample before, load, efficiency)
+        self._efficiency = EfficiencyCurve()
+        self._efficiencySample = None
+        # daily AC output with the time per HM state and the DC energy taken from the battery
+        self._daily = DailyAggregate()
+        self._dcDaily = DailyAggregate()
 
         # Use dummy data
         self.invName = self._meter_data["name"] if data else "no DTU data"
-        self.invSerial = self._meter_data["serial"] if data else "--"
+        self.invSerial = self._meter_data["serial"] if data else UNKNOWN_SERIAL
 
         # Counter         
         self._dbusservice.add_path("/UpdateCount", 0)
@@ -492,11 +677,23 @@ class OpenDTUService(DCLoadDbusService):
         self._dbusservice.add_path("/SetLimitCounter", 0)
         self._dbusservice.add_path("/HmAlarmWaitCounter", 0)
         self._dbusservice.add_path("/LastLimit", 0)
+        self._dbusservice.add_path("/DataAge", 0)
+        self._dbusservice.add_path("/DeratedPower", 0)  # [W] allowed power at the actual temperature
+        self._dbusservice.add_path("/SustainablePower", 0)  # [W] learned power that settles at maxTemperature
+        self._dbusservice.add_path("/Efficiency/Actual", 0.0)  # [%] AC/DC of the last sample
+        self._dbusservice.add_path("/Efficiency/Curve", [0] * EFFICIENCY_BINS)  # [%] per 10% load bin, 0 = not learned
+        # 0 = today, 1 = yesterday: AC yield [kWh], max and mean AC power [W], seconds per HM state in order of HM_STATES
+        for index in (0, 1):
+            self._dbusservice.add_path(f"/History/Daily/{index}/Yield", 0.0)
+            self._dbusservice.add_path(f"/History/Daily/{index}/MaxPower", 0)
+            self._dbusservice.add_path(f"/History/Daily/{index}/MeanPower", 0)
+            self._dbusservice.add_path(f"/History/Daily/{index}/StateTime", [0] * len(HM_STATES))
 
         # State machine variables for HM inverter control
         self._hm_state = "Init"  # Init, Connect, Grid, Producing, SwitchOff, Off, SwitchOn, Error
         self._hm_state_timeout = 0  # Counter for state timeouts
-        self._hm_data_age = 0  # Track data age for error detection
+        self._loopSteps = 1  # DTU_loopTime steps per loop, > 1 at the idle loop time
+        self._hm_data_stamp = 0  # Track update stamp of the DTU data for error detection
         self._hm_state_before_error = None  # Preserve active state when entering Error
         self._dbusservice.add_path("/HmState", self._hm_state)
         self._dbusservice.add_path("/HmStateTimeout", self._hm_state_timeout)
@@ -507,27 +704,57 @@ class OpenDTUService(DCLoadDbusService):
         self._dbusservice.add_path("/CustomName", self.invName)
         logging.info(f"Name of Inverters found: {self.invName}")
 
-        # add _update as cyclic call not as fast as setToZeroPower is called
-        gobject.timeout_add_seconds((5 if not self.configStatusTime else int(self.configStatusTime)), self._update)
-
     # public functions
     def setAlarm(self, alarm: str, on: bool):
         setValue = ALARM_ALARM if on else ALARM_OK
         actvalue = self._dbusservice[self._alarm_mapping[alarm]] 
         if setValue != actvalue:
             self._dbusservice[self._alarm_mapping[alarm]] = setValue
+
+    # alarm paths from the debounced alarms, alarms without device concern all inverters
+    def updateAlarms(self, isActive):
+        for alarm in self._alarm_mapping:
+            self.setAlarm(alarm, isActive(alarm, self.invName) or isActive(alarm))
    
     # public functions, load meter data and return current current
     def updateMeterData(self):
         self._meter_data = self._socket.getLimitData(self.pvinverternumber)
+        if self._meter_data and not self.hasSerial():
+            # DTU not reachable at startup, the checkpoint is restored with the serial now
+            self.invSerial = self._meter_data["serial"]
+            logging.info(f"Serial of inverter {self.pvinverternumber}: {self.invSerial}")
         # Copy current error counter to DBU values
         ( self._dbusservice["/FetchCounter"],
           self._dbusservice["/ReadError"],
           self._dbusservice["/WriteError"],
           self._dbusservice["/ConnectError"] ) = self._socket.getErrorCounter()
         hmProducing = self._is_hm_producing() # TODO use state
+        self._efficiencySample = None
+        if self.isDataFresh():
+            now = time.monotonic()
+            acPower = float(self._meter_data["AC"]["0"]["Power"]["v"])
+            dcPower = float(self._meter_data["DC"]["0"]["Power"]["v"])
+            self._thermal.update(acPower, float(self._meter_data["INV"]["0"]["Temperature"]["v"]), now)
+            nominalPower = self._socket.getNominalPower(self.pvinverternumber)
+            acEnergy = self._efficiency.update(acPower, dcPower, nominalPower, now)
+            if acEnergy > 0:
+                self._efficiencySample = (acEnergy, acPower / nominalPower, acPower / dcPower)
         return self._meter_data["DC"]["0"]["Current"]["v"] if hmProducing else 0.0 #"Current":{"v":6.070000172,"u":"A","d":2}
 
+    def hasSerial(self):
+        return self.invSerial != UNKNOWN_SERIAL
+
+    def isProducing(self):
+        return self._is_hm_producing() if self._meter_data else False
+
+    def isDataFresh(self):
+        # True if the last fetch delivered new data for this inverter, e.g. an applied limit is visible
+        return self._socket.isFresh(self.pvinverternumber)
+
+    def getActFeedIn(self):
+        # actual AC limit in watts, used when the inverter is not controlled in this loop
+        return int(float(self._meter_data["limit_absolute"])) if self._is_hm_connected() else 0
+
     def setToZeroPower(self, gridPower, maxFeedIn):
         addFeedIn = 0
         actFeedIn = 0
@@ -543,12 +770,33 @@ class OpenDTUService(DCLoadDbusService):
             self._dbusservice["/HmAlarmWaitCounter"] = 0  # activate disable state error period 
             setAlarmOnService(ALARM_HM, self.invName, not hmConnected)
         elif self._dbusservice["/HmAlarmWaitCounter"] < PRODUCE_COUNTER:
-            self._dbusservice["/HmAlarmWaitCounter"] = _incLimitCnt(self._dbusservice["/HmAlarmWaitCounter"])
+            self._dbusservice["/HmAlarmWaitCounter"] = min(PRODUCE_COUNTER, self._dbusservice["/HmAlarmWaitCounter"] + self._loopSteps)
         else:
             setAlarmOnService(ALARM_HM, self.invName, not hmConnected)
 
-        oldLimitPercent = int(root_meter_data["limit_relative"])
-        maxPower = int((int(root_meter_data["limit_absolute"]) * 100) / oldLimitPercent) if oldLimitPercent else 0
+        # limits are handled in the unit of the limit type, watts (absolute) or percent (relative)
+        # relative until the nominal power is known, an absolute limit of 0 W would switch the HM off
+        nominalPower = self._socket.getNominalPower(self.pvinverternumber)
+        absolute = bool(self.configAbsoluteLimit and nominalPower > 0)
+        if self.configAbsoluteLimit and not absolute:
+            logging.info(f"setToZeroPower, nominal power unknown, relative limit for {self.invName}")
+        if absolute:
+            maxPower = nominalPower
+            oldLimit = int(float(root_meter_data["limit_absolute"]))
+            wattsPerUnit = 1
+            limitStep = self.configStepsWatt
+            limitTolerance = 1  # DTU reports the applied absolute limit rounded
+            minLimit = int(self.configMinPercent * maxPower / 100)
+            maxLimit = int(self.configMaxPercent * maxPower / 100)
+        else:
+            oldLimit = int(root_meter_data["limit_relative"])
+            maxPower = int((int(root_meter_data["limit_absolute"]) * 100) / oldLimit) if oldLimit else 0
+            wattsPerUnit = maxPower / 100
+            limitStep = self.configStepsPercent
+            limitTolerance = 0
+            minLimit = self.configMinPercent
+            maxLimit = self.configMaxPercent
+        self._minLimit = minLimit
         # check if temperature is lower than xx degree and inverter is coinnected to grid (power is always != 0 when connected)
         actTemp = int(root_meter_data["INV"]["0"]["Temperature"]["v"])
         if actTemp > self.configMaxTemperature and gridPower > 0:
@@ -556,7 +804,17 @@ class OpenDTUService(DCLoadDbusService):
         elif actTemp < (self.configMaxTemperature - TEMPERATURE_OFF_OFFSET):
              self._tempAlarm = False
         setAlarmOnService(ALARM_TEMPERATURE, self.invName, self._tempAlarm)
-        if self._tempAlarm:
+        freezeAtTemperature = self._tempAlarm
+        if self.configDerating and maxPower > 0:
+            # derating instead of the freeze at min limit, the remaining demand goes to the next (cooler) inverter
+            nominalPower = nominalPower or maxPower
+            allowedPower = self._thermal.getAllowedPower(float(root_meter_data["INV"]["0"]["Temperature"]["v"]),
+                                                         maxLimit * wattsPerUnit, nominalPower)
+            self._dbusservice["/DeratedPower"] = int(allowedPower)
+            self._dbusservice["/SustainablePower"] = int(self._thermal.getSustainablePower(nominalPower))
+            maxLimit = max(minLimit, min(maxLimit, int(int(allowedPower / wattsPerUnit / limitStep) * limitStep)))
+            freezeAtTemperature = False
+        if freezeAtTemperature:
             logging.info(f"RESULT: setToZeroPower, temperature to high = {actTemp}")
         elif not hmConnected:
             logging.info("RESULT: setToZeroPower, not conneceted to DTU")
@@ -569,43 +827,56 @@ class OpenDTUService(DCLoadDbusService):
         # calculate new limit
         if maxPower > 0 and hmConnected: # and limitStatus in ('Ok', 'OK'):
             # check allowedFeedIn with active feed in
-            actFeedIn = int(oldLimitPercent * maxPower / 100)
+            actFeedIn = int(oldLimit * wattsPerUnit)
             allowedFeedIn = maxFeedIn - actFeedIn
             addFeedIn = gridPower
             if addFeedIn > allowedFeedIn:
                 addFeedIn = allowedFeedIn
 
-            # calculate new limit percent with steps
-            newLimitPercent = int(int((oldLimitPercent + (addFeedIn * 100 / maxPower)) / self.configStepsPercent) * self.configStepsPercent)
-            if newLimitPercent < self.configMinPercent:
-                newLimitPercent = self.configMinPercent
-            if newLimitPercent > self.configMaxPercent:
-                newLimitPercent = self.configMaxPercent
-            if not gridConnected or self._tempAlarm or not hmProducing or self._hm_state != "Producing":
-                self._dbusservice["/LastLimit"] = newLimitPercent #signal state machine new limits to switch on
-                newLimitPercent = self.configMinPercent
+            # calculate new limit with steps
+            newLimit = int(int((oldLimit + (addFeedIn / wattsPerUnit)) / limitStep) * limitStep)
+            if newLimit < minLimit:
+                newLimit = minLimit
+            if newLimit > maxLimit:
+                newLimit = maxLimit
+            if not gridConnected or freezeAtTemperature or not hmProducing or self._hm_state != "Producing":
+                self._dbusservice["/LastLimit"] = newLimit #signal state machine new limits to switch on
+                newLimit = minLimit
+
+            # answer of a limit sent in an earlier cycle by the collector process
+            lateResult = self._socket.takeLimitResult(self.pvinverternumber)
+            if lateResult is not None:
+                setAlarmOnService(ALARM_DTU, self.invName, (not lateResult and self._WriteAlarm))
+                self._WriteAlarm = not lateResult
+                if not lateResult: # not applied, push again without waiting for it
+                    self._dbusservice["/LastLimit"] = oldLimit
 
             # check if limit should be updated
-            if abs(newLimitPercent - oldLimitPercent) > 0:
-                if self._dbusservice["/LastLimit"] != oldLimitPercent:
+            if abs(newLimit - oldLimit) > limitTolerance:
+                if abs(self._dbusservice["/LastLimit"] - oldLimit) > limitTolerance:
                     # wait one cycle until limit is applied to avoid to much pushing of limits to the DTU
-                    self._dbusservice["/LastLimit"] = oldLimitPercent
+                    self._dbusservice["/LastLimit"] = oldLimit
+                elif not self._socket.isCommandReady(self.pvinverternumber):
+                    # last limit is younger than DTU_commandSpacing, keep the old limit for this cycle
+                    newLimit = oldLimit
                 else:
                     # check if limit has already been set
-                    result = self._socket.pushNewLimit(self.pvinverternumber, newLimitPercent)
-                    setAlarmOnService(ALARM_DTU, self.invName, (not result and self._WriteAlarm))
-                    self._WriteAlarm = not result # ignore first error
-                    self._dbusservice["/SetLimitCounter"] = _incLimitCnt(self._dbusservice["/SetLimitCounter"]) # increase counter to signal limit change, can be used for debugging
-                    if not result: # reset to oldLimitPercent on error
-                        newLimitPercent = oldLimitPercent
+                    result = self._socket.pushNewLimit(self.pvinverternumber, newLimit, absolute)
+                    if result != COMMAND_PENDING:
+                        setAlarmOnService(ALARM_DTU, self.invName, (not result and self._WriteAlarm))
+                        self._WriteAlarm = not result # ignore first error
+                    # increase counter to signal limit change, can be used for debugging
+                    self._dbusservice["/SetLimitCounter"] = _incLimitCnt(self._dbusservice["/SetLimitCounter"])
+                    if not result: # reset to oldLimit on error
+                        newLimit = oldLimit
                     else:
-                        self._dbusservice["/LastLimit"] = newLimitPercent
+                        self._dbusservice["/LastLimit"] = newLimit
 
             # return reduced gridPower values
-            addFeedIn = int((newLimitPercent - oldLimitPercent) * maxPower / 100)
+            addFeedIn = int((newLimit - oldLimit) * wattsPerUnit)
             logging.info(f"RESULT: setToZeroPower, result = {addFeedIn}")
             # set DBUS power to new set value
-            actFeedIn = int(newLimitPercent * maxPower / 100)
+            actFeedIn = int(newLimit * wattsPerUnit)
             # use /Dc/1/Voltage showed in details as control loop AC power set value
             self._dbusservice["/Dc/1/Voltage"] = actFeedIn
         return [int(gridPower - addFeedIn),int(maxFeedIn - actFeedIn)]
@@ -617,14 +888,14 @@ class OpenDTUService(DCLoadDbusService):
     # ============================================================================
     
     def _hm_state_machine(self):
-        # Main state machine for controlling HM inverter power state. Called from _update() after data fetch.
+        # Main state machine for controlling HM inverter power state. Called from updateStateMachine() after data fetch.
         if not self._meter_data:
             logging.warning("HM State Machine: No meter data available")
             return
 
-        current_data_age = self._meter_data.get("data_age", 0)
-        data_is_stale = (current_data_age == self._hm_data_age)
-        self._hm_data_age = current_data_age
+        current_data_stamp = self._socket.getUpdateStamp(self.pvinverternumber)
+        data_is_stale = (current_data_stamp == self._hm_data_stamp)
+        self._hm_data_stamp = current_data_stamp
 
         if data_is_stale:
             if self._hm_state != "Error":
@@ -691,7 +962,7 @@ class OpenDTUService(DCLoadDbusService):
         elif self._is_hm_producing():
             self._hm_set_state("Producing")
         # After a ceratin time with grid connection but no production, try to switch on
-        self._hm_state_timeout += 1
+        self._hm_state_timeout += self._loopSteps
         # Configurable time before switching off (e.g., 90 loops)
         if self._hm_state_timeout >= 90:
             self._trigger_switch_on()
@@ -705,8 +976,8 @@ class OpenDTUService(DCLoadDbusService):
             self._hm_set_state("Grid")
             return
         # Check if limit is at minimum and should trigger SwitchOff
-        if self._dbusservice["/LastLimit"] <= self.configMinPercent:
-            self._hm_state_timeout += 1
+        if self._dbusservice["/LastLimit"] <= self._minLimit:
+            self._hm_state_timeout += self._loopSteps
             # Configurable time before switching off (e.g., 10 loops)
             if self._hm_state_timeout >= 90:
                 if self.configEnableSwitchOff:
@@ -721,8 +992,8 @@ class OpenDTUService(DCLoadDbusService):
         if self._is_hm_producing():
             self._hm_set_state("Producing")   
         # Check if limit is requesting production and should trigger SwitchOn
-        if self._dbusservice["/LastLimit"] > self.configMinPercent:
-            self._hm_state_timeout += 1
+        if self._dbusservice["/LastLimit"] > self._minLimit:
+            self._hm_state_timeout += self._loopSteps
             # Configurable time before switching on (e.g., 10 loops)
             if self._hm_state_timeout >= 20:
                 self._trigger_switch_on()
@@ -735,7 +1006,7 @@ class OpenDTUService(DCLoadDbusService):
             self._hm_set_state("Off", 0)
             return
         # Timeout after 30 loops if still producing
-        self._hm_state_timeout += 1
+        self._hm_state_timeout += self._loopSteps
         if self._hm_state_timeout >= 30:
             logging.warning(f"HM State SwitchOff timeout for {self.invName}, forcing Off state")
             self._hm_set_state("Producing", 0)
@@ -746,14 +1017,14 @@ class OpenDTUService(DCLoadDbusService):
             self._hm_set_state("Producing", 0)
             return
         # Timeout after 60 loops if not producing after switch on attempt
-        self._hm_state_timeout += 1
+        self._hm_state_timeout += self._loopSteps
         if self._hm_state_timeout >= 60:
             logging.warning(f"HM State SwitchOn timeout for {self.invName}, returning to Off state")
             self._hm_set_state("Off", 0)
     
     def _state_error(self):
         # rror state: Data fetch or update is not working. Wait for DTU recovery (90 loops). If not recovered, reset DTU.
-        self._hm_state_timeout += 1
+        self._hm_state_timeout += self._loopSteps
         # Allow 90 loops for recovery
         if self._hm_state_timeout < 90:
             return
@@ -775,6 +1046,7 @@ class OpenDTUService(DCLoadDbusService):
         # Set new state and optional timeout.
         if self._hm_state != new_state:
             logging.info(f"HM State Transition: {self._hm_state} -> {new_state}")
+            METRICS.inc("opendtu_state_transitions_total", inverter=self.pvinverternumber, **{"from": self._hm_state, "to": new_state})
             self._hm_state = new_state
         self._hm_state_timeout = timeout
     
@@ -830,34 +1102,135 @@ class OpenDTUService(DCLoadDbusService):
         except (ValueError, TypeError):
             return False
 
-    # slower update loop, a update triggers the DBUS-Monitor from com.victronenergy.system
-    #  /Control/SolarChargeCurrent  -> 0: no limiting, 1: solar charger limited by user setting or intelligent battery
-    #  /Dc/System/MeasurementType should be 1 (calculated by dcsystems)
-    #  /Dc/System/Power should be equal to the sum of self._dbusservice["/Dc/0/Power"]
-    def _update(self):
-        try:
-            self._meter_data = self._socket.getLimitData(self.pvinverternumber)
-            # Copy current error counter to DBU values
-            ( self._dbusservice["/FetchCounter"],
-            self._dbusservice["/ReadError"],
-            self._dbusservice["/WriteError"],
-            self._dbusservice["/ConnectError"] ) = self._socket.getErrorCounter()
-            # Run HM state machine after data fetch
-            self._hm_state_machine()
-            # update status
-            self._dbusservice["/UpdateCount"] = _incLimitCnt(self._dbusservice["/UpdateCount"])
-            if self._meter_data:
-                self._dbusservice["/Dc/0/Voltage"] = self._meter_data["DC"]["0"]["Voltage"]["v"]
-                self._dbusservice["/Dc/0/Current"] = self._meter_data["DC"]["0"]["Current"]["v"]
-                self._dbusservice["/Dc/0/Temperature"] = self._meter_data["INV"]["0"]["Temperature"]["v"]
-                # use /Dc/1/Voltage showed in details as control loop set value
-                # self._dbusservice["/Dc/1/Voltage"] = power
-                self._dbusservice["/History/EnergyIn"] = self._meter_data["AC"]["0"]["YieldTotal"]["v"]
-                self._dbusservice["/Dc/0/Power"] = self._meter_data["AC"]["0"]["Power"]["v"]
+    # yield total [kWh], nominal power [W], temperature and AC power [W] for the wear levelling
+    def getWearData(self):
+        return (
+            float(self._meter_data["AC"]["0"]["YieldTotal"]["v"]),
+            self._socket.getNominalPower(self.pvinverternumber),
+            float(self._meter_data["INV"]["0"]["Temperature"]["v"]),
+            float(self._meter_data["AC"]["0"]["Power"]["v"]),
+        )
 
-        except Exception as e:
-            logging.critical('Error at %s', '_update', exc_info=e)
+    def getState(self):
+        return self._hm_state
+
+    # path values and the internal state not published on DBUS
+    def getSnapshot(self):
+        snapshot = super().getSnapshot()
+        snapshot.update({
+            "number": self.pvinverternumber,
+            "name": self.invName,
+            "serial": self.invSerial,
+            "state": self._hm_state,
+            "fresh": self.isDataFresh(),
+            "nominalPower": self._socket.getNominalPower(self.pvinverternumber) if self._meter_data else 0,
+        })
+        return snapshot
+
+    # learned efficiency at the load level, None if not learned
+    def getEfficiency(self, load):
+        return self._efficiency.get(load)
+
+    # efficiency of the next limit change: at a higher load when increasing, at the actual load when decreasing
+    def getMarginalEfficiency(self, increase):
+        nominalPower = self._socket.getNominalPower(self.pvinverternumber) if self._meter_data else 0
+        if not nominalPower:
+            return None
+        load = float(self._meter_data["AC"]["0"]["Power"]["v"]) / nominalPower
+        return self._efficiency.get(load + 0.1 if increase else load)
+
+    # (AC energy [Wh], load, efficiency) of the sample of this cycle or None
+    def getEfficiencySample(self):
+        return self._efficiencySample
+
+    def getEfficiencyCheckpoint(self):
+        return self._efficiency.getCheckpoint()
+
+    def restoreEfficiencyCheckpoint(self, data):
+        self._efficiency.restoreCheckpoint(data)
+
+    # limit [W], AC power [W], temperature and state index for the ring log
+    def getLogValues(self):
+        if not self._meter_data:
+            return (0.0, 0.0, 0.0, HM_STATES.index(self._hm_state))
+        return (
+            self.getActFeedIn(),
+            float(self._meter_data["AC"]["0"]["Power"]["v"]),
+            float(self._meter_data["INV"]["0"]["Temperature"]["v"]),
+            HM_STATES.index(self._hm_state),
+        )
+
+    # warm restart, only stable states are restored, transitions start from Init
+    def getCheckpoint(self):
+        state = self._hm_state if self._hm_state in RESTORE_STATES else "Init"
+        return {"state": state, "lastLimit": self._dbusservice["/LastLimit"]}
+
+    def restoreCheckpoint(self, data):
+        if data:
+            logging.info(f"Restore {self.invName}: {data}")
+            self._hm_set_state(data["state"], 0)
+            self._dbusservice["/HmState"] = self._hm_state
+            self._dbusservice["/LastLimit"] = data["lastLimit"]
+
+    # [Wh] AC output of today (0) or yesterday (1)
+    def getDailyYield(self, index=0):
+        return self._daily.getDay(index)["positive"]
+
+    def getDailyCheckpoint(self):
+        return {"ac": self._daily.getCheckpoint(), "dc": self._dcDaily.getCheckpoint()}
+
+    def restoreDailyCheckpoint(self, data):
+        if data:
+            self._daily.restoreCheckpoint(data.get("ac"))
+            self._dcDaily.restoreCheckpoint(data.get("dc"))
 
-        # return true, otherwise add_timeout will be removed from GObject - see docs
-        return True
+    # learned thermal model, kept longer than the state
+    def getThermalCheckpoint(self):
+        return self._thermal.getCheckpoint()
 
+    def restoreThermalCheckpoint(self, data):
+        self._thermal.restoreCheckpoint(data)
+
+    # the counters of the state machine and the alarm wait count DTU_loopTime steps, a idle loop counts for several
+    def setLoopSteps(self, steps):
+        self._loopSteps = max(1, int(steps))
+
+    # called by the scheduler of the shelly service after the decode stage, not as fast as setToZeroPower is called
+    def updateStateMachine(self):
+        # Run HM state machine after data fetch
+        self._hm_state_machine()
+
+    # publish stage of each cycle, a update triggers the DBUS-Monitor from com.victronenergy.system
+    #  /Control/SolarChargeCurrent  -> 0: no limiting, 1: solar charger limited by user setting or intelligent battery
+    #  /Dc/System/MeasurementType should be 1 (calculated by dcsystems)
+    #  /Dc/System/Power should be equal to the sum of self._dbusservice["/Dc/0/Power"]
+    def publishStatus(self):
+        # update status
+        self._dbusservice["/UpdateCount"] = _incLimitCnt(self._dbusservice["/UpdateCount"])
+        self._dbusservice["/DataAge"] = self._socket.getDataAge(self.pvinverternumber)
+        METRICS.set("opendtu_data_age_seconds", self._dbusservice["/DataAge"], inverter=self.pvinverternumber)
+        METRICS.set("opendtu_hm_state", HM_STATES.index(self._hm_state), inverter=self.pvinverternumber)
+        METRICS.set("opendtu_limit_watts", self.getActFeedIn() if self._meter_data else 0, inverter=self.pvinverternumber)
+        if self._meter_data:
+            self._dbusservice["/Dc/0/Voltage"] = self._meter_data["DC"]["0"]["Voltage"]["v"]
+            self._dbusservice["/Dc/0/Current"] = self._meter_data["DC"]["0"]["Current"]["v"]
+            self._dbusservice["/Dc/0/Temperature"] = self._meter_data["INV"]["0"]["Temperature"]["v"]
+            # use /Dc/1/Voltage showed in details as control loop set value
+            # self._dbusservice["/Dc/1/Voltage"] = power
+            self._dbusservice["/History/EnergyIn"] = self._meter_data["AC"]["0"]["YieldTotal"]["v"]
+            self._dbusservice["/Dc/0/Power"] = self._meter_data["AC"]["0"]["Power"]["v"]
+            # the last DTU values hold until the DTU delivers new ones, the state time is counted each cycle
+            now = time.time()
+            self._daily.update(float(self._meter_data["AC"]["0"]["Power"]["v"]), now, self._hm_state)
+            self._dcDaily.update(float(self._meter_data["DC"]["0"]["Power"]["v"]), now)
+            # DC energy taken from the battery, integrated since the first start
+            self._dbusservice["/History/EnergyOut"] = round(self._dcDaily.total[0] / 1000, 3)
+            for index in (0, 1):
+                day = self._daily.getDay(index)
+                self._dbusservice[f"/History/Daily/{index}/Yield"] = round(day["positive"] / 1000, 3)
+                self._dbusservice[f"/History/Daily/{index}/MaxPower"] = int(day["max"] or 0)
+                self._dbusservice[f"/History/Daily/{index}/MeanPower"] = int(self._daily.getMean(index))
+                self._dbusservice[f"/History/Daily/{index}/StateTime"] = [int(day["states"].get(state, 0)) for state in HM_STATES]
+        if self._efficiencySample:
+            self._dbusservice["/Efficiency/Actual"] = round(self._efficiencySample[2] * 100, 1)
+            self._dbusservice["/Efficiency/Curve"] = self._efficiency.getCurve()
@@ -3,11 +3,6 @@
 import logging
 import sys
 import os
-if sys.version_info.major == 2:
-    import gobject
-else:
-    from gi.repository import GLib as gobject
-import sys
 import time
 import requests # for http GET
 
@@ -15,14 +10,26 @@ import configparser # for config/ini file
 
 import dbus
 
-from dbus_service import OpenDTUService, DCSystemService, DCTempService, DtuSocket
-from dbus_service import ALARM_BALCONY, ALARM_GRID, ALARM_FETCH, setAlarmOnService 
+from dbus_service import OpenDTUService, DCSystemService, DCTempService, DtuSocket, DCLoadDbusService, SnapshotDbusService
+from dbus_service import ALARM_BALCONY, ALARM_GRID, ALARM_FETCH, setAlarmOnService, publishAlarms
+from scheduler import CycleScheduler
+from checkpoint import Checkpoint
+from ringlog import RingLog
+from metrics import METRICS
+from rotation import WearLeveler
+from seasonal import BASESOC, MINMAXSOC, MAXCALCSOC, MAXSOC, FEEDINONHYS
+from seasonal import isPeak, peakFloatingMax, feedInMinSoc, feedInRelay
+from aggregates import DailyAggregate
+from snapshot import SnapshotExport
+from shelly import ShellyMeter
+from shellypush import startPush
+from profiler import Profiler
+from loopwatch import WATCHDOG
 from version import softwareversion
 
 
 # Victron packages
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), '/opt/victronenergy/dbus-systemcalc-py/ext/velib_python'))
-from vedbus import VeDbusService
 from dbusmonitor import DbusMonitor
 
 
@@ -37,12 +44,7 @@ ERROR_NONE = "--"
 
 AUXDEFAULT = 500                   # [W] assumed plugin power to reduce allowed feed in
 EXCEPTIONPOWER = -100              # [W] assumed feed in to reduce feed in by micro inverter
-BASESOC = 54                       # [%] with 8% min SOC -> 92% range -> 54% in the middle
-MINMAXSOC = BASESOC + 20           # [%] 40% range per default
-MAXCALCSOC = 110                   # [%] 100% plus 10 days/loadcycles (stick longer at 100% in summer)
-MAXSOC = 99                        # [%] maximum state of charge (with 58V battery, 58.5V is the max. voltage)
 MAXFEEDINSOC = 90                  # [%] enable max. feed in if last detcted max. SOC has reached this value 
-FEEDINONHYS = 2                    # [%] hystersis for activationb of feed in relay to prevent alternating on-off
 CCL_DEFAULT = 10                   # [A] at 10°C 
 CCL_MINTEMP = 10                   # [°C]
 COUNTERLIMIT = 255
@@ -56,6 +58,17 @@ HEATER_CONTINUE_CURRENT = 20       # [A] min battery charge current to keep batt
 HEATER_CONTINUE_TEMPERATURE = 13.0 # [°C] min battery temperature to keep battery warm over night
 HEATER_CONTINUE_RANGE = 0.8        # [°C] continue heating range
 ALARMCOUNTER = 2
+SEASONAL_PATHS = ('/Soc', '/SocIncrement', '/SocFloatingMax', '/SocLastMax')  # seasonal state kept over a restart
+SEASONAL_MAX_AGE = 30 * 24 * 3600  # [s] max. age of a checkpoint to restore the seasonal state
+POWER_MAX_AGE = 60                 # [s] max. age of a checkpoint to restore the filtered grid power
+INVERTER_MAX_AGE = 600             # [s] max. age of a checkpoint to restore HM state and limit
+RINGLOG_FILE = "/run/dbus-opendtu-ringlog.bin"  # tmpfs, the ring log is rewritten with each cycle
+IDLE_CYCLES = 15                   # number of idle cycles before the idle loop time is used
+STAGES = ('Fetch', 'Decode', 'StateMachine', 'Control', 'Publish')  # execution order of the cycle scheduler
+METRIC_TARGETS = {ALARM_GRID: 'grid', ALARM_BALCONY: 'balcony'}  # metrics label of the Shelly fetches
+PHASE_STRATEGIES = ('netsum', 'perphase')  # zero feed in on the sum of all phases or on each phase
+DAILY_ENERGY = ('Import', 'Export', 'PlugInSolar', 'InverterOutput', 'FeedInAvoided')  # [kWh] /History/Daily/n paths
+DAILY_POWER = ('MinPower', 'MaxPower', 'MeanPower')  # [W] grid power of the day
 
 
 # you can prefix a function name with an underscore (_) to declare it private. 
@@ -78,6 +91,11 @@ def _validate_heater_value(path, newvalue):
 def _incLimitCnt(value):
     return (value + 1) % COUNTERLIMIT
 
+def _seconds(value):
+    # whole seconds stay int for timeout_add_seconds, e.g. 1.5 needs the millisecond timers
+    seconds = float(value)
+    return int(seconds) if seconds.is_integer() else seconds
+
     
 class DbusShellyemService:
     def __init__(
@@ -94,8 +112,6 @@ class DbusShellyemService:
         config = self._getConfig()
         deviceinstance = int(config['SHELLY']['Deviceinstance'])
         customname = config['SHELLY']['CustomName']
-        self._statusURL = self._getShellyStatusUrl()
-        self._plugInSolarURL = self._getPlugInSolarShellyUrl()
         self._keepAliveURL = config['SHELLY']['KeepAliveURL']
         self._SwitchOffURL = config['SHELLY']['SwitchOffURL']
         self._ZeroPoint = int(config['DEFAULT']['ZeroPoint'])
@@ -104,11 +120,30 @@ class DbusShellyemService:
         self._feedInFilterFactor = int(config['DEFAULT']['feedInFilterFactor'])
         self._bigPowerChangeDifference = int(config['DEFAULT']['feedInAtNegativeWattDifference'])
         self._Accuracy = int(config['DEFAULT']['ACCURACY'])
-        self._DTU_loopTime = int(config['DEFAULT']['DTU_loopTime'])
+        self._DTU_loopTime = _seconds(config['DEFAULT']['DTU_loopTime'])
+        self._DTU_statusTime = _seconds(config['DEFAULT']['DTU_statusTime'])
+        self._idleLoopTime = max(self._DTU_loopTime, _seconds(config['DEFAULT'].get('idleLoopTime', fallback=0)))
+        # millisecond timers, required for fractional loop times
+        self._highResolution = (config['DEFAULT'].getboolean('highResolutionTimers', fallback=False)
+                                or any(isinstance(value, float) for value in (self._DTU_loopTime, self._idleLoopTime)))
+        self._DTU_lazyFetch = config['DEFAULT'].getboolean('DTU_lazyFetch', fallback=False)
+        self._DTU_maxDataAge = int(config['DEFAULT'].get('DTU_maxDataAge', fallback=30))
+        self._phases = max(1, min(3, int(config['SHELLY'].get('Phases', fallback=1))))
+        self._phaseStrategy = config['DEFAULT'].get('phaseStrategy', fallback='netsum')
+        if self._phaseStrategy not in PHASE_STRATEGIES:
+            raise ValueError("phaseStrategy %s is not supported" % (self._phaseStrategy))
         self._SignOfLifeLog = config['DEFAULT']['SignOfLifeLog']
-        # Shelly EM session
-        self._eMsession = requests.Session()
-        self._balconySession = requests.Session()
+        self._rotationTime = int(config['DEFAULT'].get('rotationTime', fallback=0))
+        self._efficiencyPreference = config['DEFAULT'].getboolean('efficiencyPreference', fallback=False)
+        # Shelly EM session, collected by the collector process if enabled
+        self._eMsession = self._socket.createSession()
+        self._balconySession = self._socket.createSession()
+        # meters with the smallest endpoints of the detected generation, the balcony power only
+        self._gridMeter = self._getGridMeter(config)
+        self._plugInSolarMeter = ShellyMeter(
+            config['SHELLY']['Balcony'], self._balconySession, timeout=float(config['DEFAULT']['HTTPTimeout']), energy=False)
+        # pushed samples while the Shellys push (CoIoT or MQTT), the meters above as fallback
+        self._gridMeter, self._plugInSolarMeter = startPush(config, self._gridMeter, self._plugInSolarMeter, self._phases)
         self._pluginAlarmCounter = 0
         self._gridAlarmCounter = 0
         self._dtuAlarmCounter = 0
@@ -125,10 +160,12 @@ class DbusShellyemService:
             else dbus.SystemBus()
         )
       
-        self._dbusservice = VeDbusService("{}.http_{:02d}".format(servicename, deviceinstance), dbus_conn)
+        self._servicename = "{}.http_{:02d}".format(servicename, deviceinstance)
+        self._dbusservice = SnapshotDbusService(self._servicename, dbus_conn)
 
         # Create the mandatory objects
-        self._dbusservice.add_mandatory_paths(__file__, softwareversion, CONNECTION, deviceinstance, PRODUCT_ID, PRODUCTNAME, FIRMWARE_VERSION, HARDWARE_VERSION, CONNECTED)
+        self._dbusservice.add_mandatory_paths(__file__, softwareversion, CONNECTION, deviceinstance, PRODUCT_ID,
+                                              PRODUCTNAME, FIRMWARE_VERSION, HARDWARE_VERSION, CONNECTED)
         
         self._dbusservice.add_path('/CustomName', customname)    
         self._dbusservice.add_path('/Role', 'acload')
@@ -138,6 +175,15 @@ class DbusShellyemService:
         self._dbusservice.add_path('/LoopIndex', 0)
         self._dbusservice.add_path('/NegativeGridCounter', 0)  # counts the times there is a real feed in / power from grid is real negative
         self._dbusservice.add_path('/FeedInRelay', False)
+        self._dbusservice.add_path('/Idle', False)  # slow idle loop time is active
+        # [Wh] battery energy saved against the mean efficiency of all HMs at the same load level
+        self._dbusservice.add_path('/Efficiency/SavedToday', 0.0)
+        self._dbusservice.add_path('/Efficiency/SavedYesterday', 0.0)
+        # 0 = today, 1 = yesterday: grid import and export, plug in solar, HM output and the HM and plug in solar
+        # energy not fed into the grid [kWh], grid power [W] and feed in relay on time [s]
+        for index in (0, 1):
+            for name in DAILY_ENERGY + DAILY_POWER + ('RelayOnTime',):
+                self._dbusservice.add_path(f'/History/Daily/{index}/{name}', 0.0 if name in DAILY_ENERGY else 0)
 
         # additional values
         self._dbusservice.add_path('/AuxFeedInPower', AUXDEFAULT)
@@ -159,6 +205,22 @@ class DbusShellyemService:
         # test custom error 
         self._dbusservice.add_path('/Error', ERROR_NONE)
 
+        # [ms] duration of the scheduler stages of the last cycle
+        for name in STAGES + ('Cycle',):
+            self._dbusservice.add_path(f'/Timing/{name}', 0.0)
+
+        # on demand profiling, write cycles or seconds to start, 0 to stop, counts down to 0
+        self._profiler = Profiler(os.path.dirname(os.path.realpath(__file__)))
+        self._dbusservice.add_path('/Debug/Profile', 0, writeable=True, onchangecallback=self._handleProfile)
+        self._dbusservice.add_path('/Debug/ProfileSeconds', 0, writeable=True, onchangecallback=self._handleProfile)
+        self._dbusservice.add_path('/Debug/ProfileFile', "")
+
+        # GLib loop watchdog, late timer firing and the callbacks causing it
+        self._dbusservice.add_path('/Debug/Watchdog/MaxDrift', 0)  # [ms] since start
+        self._dbusservice.add_path('/Debug/Watchdog/Stalls', 0)
+        self._dbusservice.add_path('/Debug/Watchdog/DriftHistogram', WATCHDOG.getHistogram())
+        self._dbusservice.add_path('/Debug/Watchdog/Offenders', [])
+
         logging.debug("%s /DeviceInstance = %d" % (servicename, deviceinstance))
 
         # add path values to dbus
@@ -171,29 +233,88 @@ class DbusShellyemService:
                 onchangecallback=self._handlechangedvalue
             )
       
-        # power value 
+        # power value, sum of all phases and per phase
         self._power = int(0)
+        self._phasePower = [0] * self._phases
         self._PlugInSolarPower = int(0)
         self._ChargeLimited = False
         self._ContinueHeating = False
 
+        # warm restart, restore the controller state from the last checkpoint
+        self._checkpoint = Checkpoint(
+            f"{(os.path.dirname(os.path.realpath(__file__)))}/checkpoint.json",
+            int(config['DEFAULT'].get('checkpointInterval', fallback=300)),
+        )
+        self._restoredInverters = set()  # inverter numbers with restored checkpoint
+        self._restoreCheckpoint()
+
+        # ring log with one row per cycle, the inverter columns are ordered by inverter number not by control order
+        self._inverterByNumber = sorted(self._inverter, key=lambda dtuService: dtuService.pvinverternumber)
+        ringLogRows = int(config['DEFAULT'].get('ringLogRows', fallback=0))
+        self._ringLog = None
+        if ringLogRows > 0:
+            # tmpfs by default, a file on /data flash is rewritten with each cycle, relative to the script directory
+            ringLogFile = os.path.join(
+                os.path.dirname(os.path.realpath(__file__)),
+                config['DEFAULT'].get('ringLogFile', fallback=RINGLOG_FILE),
+            )
+            try:
+                self._ringLog = RingLog(ringLogFile, ringLogRows, len(self._inverterByNumber))
+            except OSError as e:
+                logging.warning(f"Ring log {ringLogFile} not opened: {str(e)}")
+
         # last update
         self._lastUpdate = 0
-        
-        # add _update timed function, get DTU data and control HMs by call of _controlLoop()
-        # Doing all in one task context realizes a control loop by reading back the actual values before new values are calculated
-        gobject.timeout_add_seconds(self._DTU_loopTime, self._update) 
+
+        # daily aggregates, grid power with the feed in relay state and plug in solar power
+        self._gridDaily = DailyAggregate()
+        self._plugInDaily = DailyAggregate()
+        self._restoreDailyCheckpoint()
+
+        # wear levelling, ranking of the inverters updated with each new DTU data
+        self._leveler = WearLeveler(int(config['DEFAULT']['maxTemperature']))
+        self._lastRotation = time.monotonic()
+        self._savingsDay = time.localtime().tm_yday
+
+        # data of the actual cycle passed from stage to stage
+        self._limitData = False
+        self._lastDtuFetch = 0.0
+        self._invCurrent = 0.0
+        self._swap = False
+
+        # adaptive cadence, raw grid value and feed in state of the last cycle to detect changes
+        self._gridPower = 0
+        self._lastGridPower = 0
+        self._feedInPossible = False
+        self._idleCounter = 0
+
+        # one scheduler for fetch, decode, state machine, control and publish. Doing all in one task context realizes
+        # a control loop by reading back the actual values before new values are calculated
+        # the state machine counts in loops, therefore it keeps the slower DTU_statusTime as a multiple of the loop time
+        self._statusCycles = max(1, round(self._DTU_statusTime / self._DTU_loopTime))
+        self._scheduler = CycleScheduler(self._DTU_loopTime, list(zip(STAGES, (
+            self._fetchStage,
+            self._decodeStage,
+            self._stateMachineStage,
+            self._controlLoop,
+            self._publishStage,
+        ))), self._highResolution)
+        self._scheduler.start()
+
+        # state of all services with one DBUS call, built on demand from the data of the last cycle
+        self._snapshotExport = SnapshotExport(dbus_conn, self._getSnapshot, lambda: self._scheduler.cycleCounter)
         
         # add _signOfLife timed function to switch HM relais at Shelly
-        gobject.timeout_add_seconds((10 if not self._SignOfLifeLog else int(self._SignOfLifeLog)) * 60, self._signOfLife)
+        WATCHDOG.timeout_add_seconds((10 if not self._SignOfLifeLog else int(self._SignOfLifeLog)) * 60, self._signOfLife)
         
         # call _createDbusMonitor after x minutes, since create dbusmonitor disturbs service creation (not all dcsystem are recognized from system)
-        gobject.timeout_add_seconds(60, self._createDbusMonitor)
+        WATCHDOG.timeout_add_seconds(60, self._createDbusMonitor)
 
         # Note: The given function is called repeatedly until it returns G_SOURCE_REMOVE or FALSE, at which point the timeout is automatically 
         # destroyed and the function will not be called again. The first call to the function will be at the end of the first interval. 
         #
-        # Note that timeout functions may be delayed, due to the processing of other event sources. Thus they should not be relied on for precise timing. 
+        # Note that timeout functions may be delayed, due to the processing of other event sources.
+        # Thus they should not be relied on for precise timing.
         
 
     # public function
@@ -205,9 +326,10 @@ class DbusShellyemService:
         try:
             # pass grid meter value and allowed feed in to first DTU inverter
             logging.info("START: Control Loop is running")
-            # trigger read data once from DTU
-            limitData = self._socket.fetchLimitData()
-            invCurrent = 0.0
+            # DTU data has been read once by the fetch stage and passed to the inverters by the decode stage
+            limitData = self._limitData
+            invCurrent = self._invCurrent
+            swap = self._swap
             boostCurrent = 0.0
             temperature = 0.0
             plugInFeedsIn = False
@@ -217,18 +339,6 @@ class DbusShellyemService:
                 logging.info("LIMIT DATA: Failed")
             else:
                 self._dtuAlarmCounter = 0 
-                number = 0
-                # use loop counter to swap with slow _SignOfLifeLog cycle
-                swap = bool(self._dbusservice['/LoopIndex'] == 0)
-                # trigger inverter to fetch meter data from singleton
-                while number < len(self._inverter):
-                    dtuService:OpenDTUService = self._inverter[number]
-                    current = round(dtuService.updateMeterData(),2)
-                    if current != 0.0:
-                        invCurrent += current
-                    else:
-                        swap = False  # if current is zero, do not swap, since at least one inverter is not active and should not be preferred in the next loop
-                    number = number + 1
                 # loop
                 POWER = 0
                 FEEDIN = 1
@@ -237,31 +347,50 @@ class DbusShellyemService:
                 else:
                     maxFeedIn = 0. # prefer switch off of inverter to disconennect them from grid with relais
                 maxDischarge = int(self._dbusservice['/SocVolt'] * self._dbusservice['/SocMaxDischargeCurrent'])
-                plugInFeedsIn = int(self._PlugInSolarPower) > 20 and (self._dbusservice['/Error'] == ERROR_NONE)  # plug in with appr. 20 W
-                powerOffset = -self._ZeroPoint
-                # with floating max is high and high SOC put zero point to zero or to negative
-                if int(self._dbusservice['/SocLastMax']) >= int(self._dbusservice['/PowerFeedInSoc']) and int(self._dbusservice['/SocFloatingMax']) >= MAXSOC:
-                    powerOffset = self._ZeroPoint if plugInFeedsIn else 0
-                gridValue = [int(int(self._power) + powerOffset),min(maxFeedIn, maxDischarge)]
-                logging.info(f"PRESET: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
-                number = 0
-                # around zero point do nothing 
-                while abs(gridValue[POWER]) > self._Accuracy and number < len(self._inverter):
-                    # Do not swap when set values are changed
-                    swap = False
-                    inPower = gridValue[POWER]
-                    dtuService:OpenDTUService = self._inverter[number]
-                    gridValue = dtuService.setToZeroPower(gridValue[POWER], gridValue[FEEDIN])
-                    # multiple inverter, set new limit only once in a loop
-                    if inPower != gridValue[POWER]:
-                        # adapt stored power value to value reduced by micro inverter  
-                        self._power = gridValue[POWER] - powerOffset
-                        logging.info(f"CHANGED and Break: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
-                        break
-                    # switch to next inverter if inverter is at limit (no change so far)
-                    number = number + 1
+                powerOffset, plugInFeedsIn = self._getPowerOffset()
+                # netsum: one group with all inverters, perphase: one group per phase with the inverters of the phase
+                # the max feed in is shared by all groups
+                gridValue = [0, min(maxFeedIn, maxDischarge)]
+                residualPower = 0
+                for phase, (inverters, power, groupOffset) in enumerate(self._controlGroups(powerOffset)):
+                    gridValue[POWER] = int(int(power) + groupOffset)
+                    if self._efficiencyPreference:
+                        inverters = self._efficiencyOrder(inverters, gridValue[POWER] > 0)
+                    logging.info(f"PRESET: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
+                    number = 0
+                    # around zero point do nothing 
+                    while abs(gridValue[POWER]) > self._Accuracy and number < len(inverters):
+                        # Do not swap when set values are changed
+                        swap = False
+                        inPower = gridValue[POWER]
+                        dtuService:OpenDTUService = inverters[number]
+                        if not dtuService.isDataFresh():
+                            # no new data for this inverter, skip it but keep its feed in as part of the max feed in
+                            gridValue[FEEDIN] = int(gridValue[FEEDIN] - dtuService.getActFeedIn())
+                            number = number + 1
+                            continue
+                        gridValue = dtuService.setToZeroPower(gridValue[POWER], gridValue[FEEDIN])
+                        # multiple inverter, set new limit only once in a loop
+                        if inPower != gridValue[POWER]:
+                            # adapt stored power value to value reduced by micro inverter  
+                            self._setControlledPower(phase, gridValue[POWER] - groupOffset)
+                            logging.info(f"CHANGED and Break: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
+                            number = number + 1
+                            break
+                        # switch to next inverter if inverter is at limit (no change so far)
+                        number = number + 1
+                    # inverters not visited in this group still feed in, the next group gets the remaining feed in
+                    for dtuService in inverters[number:]:
+                        gridValue[FEEDIN] = int(gridValue[FEEDIN] - dtuService.getActFeedIn())
+                    residualPower += gridValue[POWER]
+                gridValue[POWER] = residualPower
                 
-                if swap:
+                if swap and self._rotationTime:
+                    # order by wear levelling rank, only producing inverters are moved to the front
+                    logging.info(f"UNCHANGED and Rotate: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
+                    self._inverter = self._leveler.order(self._inverter, lambda dtuService: dtuService.getState() == 'Producing')
+                    self._lastRotation = time.monotonic()
+                elif swap:
                     # swap inverters to avoid using mainly the first ones
                     logging.info(f"UNCHANGED and Continue: Control Loop {gridValue[POWER]}, {gridValue[FEEDIN]} ")
                     position = 0
@@ -308,18 +437,10 @@ class DbusShellyemService:
                     oldSoc = self._dbusservice['/Soc']
                     incSoc = newSoc - oldSoc
                     if incSoc != 0:
-                        # direction change + * - = -
-                        if (incSoc * self._dbusservice['/SocIncrement']) < 0:
-                            if self._dbusservice['/SocIncrement'] > 0:
-                                if oldSoc == MAXSOC:
-                                    self._dbusservice['/SocFloatingMax'] = MAXCALCSOC
-                                if oldSoc < MAXSOC and oldSoc > self._dbusservice['/SocFloatingMax']:
-                                    # increase max immediately with half of difference since each increase of max counts twice for increase of range
-                                    self._dbusservice['/SocFloatingMax'] += int( ((oldSoc - self._dbusservice['/SocFloatingMax']) + 1) / 2 )
-                                if (oldSoc >= MINMAXSOC or self._dbusservice['/SocFloatingMax'] > MINMAXSOC) and oldSoc < self._dbusservice['/SocFloatingMax']:
-                                    # decrease by steps until MINMAXSOC is reached
-                                    self._dbusservice['/SocFloatingMax'] -= 1 
-                                self._dbusservice['/SocLastMax'] = oldSoc
+                        # direction change from charge to discharge, see seasonal.py
+                        if isPeak(incSoc, self._dbusservice['/SocIncrement']):
+                            self._dbusservice['/SocFloatingMax'] = peakFloatingMax(oldSoc, self._dbusservice['/SocFloatingMax'])
+                            self._dbusservice['/SocLastMax'] = oldSoc
                         self._dbusservice['/SocIncrement'] = incSoc
                         self._dbusservice['/Soc'] = newSoc
                     # publish data to DBUS as debug data
@@ -345,16 +466,16 @@ class DbusShellyemService:
                 else:
                     self._dbusservice['/SocFloatingMax'] = MINMAXSOC
             else:
-                self._dbusservice['/SocFloatingMax'] = MINMAXSOC
+                # monitor is created after startup, keep the restored floating max until the battery is read
                 self._dbusservice['/isInverting'] = False
             
             # calculate min SOC based on max SOC and BASESOC. If max SOC increases lower min SOC and vice versa
             # min is addiotinal secured with an voltage guard relais and theoretically with the BMS of the battery
             # deactivate when AC load is on (at least 10A additional dc load) to prevent high discharge current when SocMaxDischargeCurrent is low
             if self._dbusservice['/SocChargeCurrent'] > -float(invCurrent + CCL_DEFAULT):
-                self._dbusservice['/FeedInMinSoc'] = int(BASESOC - (min(int(self._dbusservice['/SocFloatingMax']),MAXSOC) - BASESOC))
+                self._dbusservice['/FeedInMinSoc'] = feedInMinSoc(self._dbusservice['/SocFloatingMax'])
             elif int(self._dbusservice['/SocMaxDischargeCurrent']) > MINMAXDISCHARGE:
-                self._dbusservice['/FeedInMinSoc'] = int(BASESOC - (min(int(self._dbusservice['/SocFloatingMax']),MAXSOC) - BASESOC))
+                self._dbusservice['/FeedInMinSoc'] = feedInMinSoc(self._dbusservice['/SocFloatingMax'])
             else:
                 self._dbusservice['/FeedInMinSoc'] = int(MAXCALCSOC)
 
@@ -403,10 +524,83 @@ class DbusShellyemService:
         # return true, otherwise add_timeout will be removed from GObject - 
         return True
        
+    # offset of the zero point and plug in solar state, the set value for the grid is _power + offset
+    def _getPowerOffset(self):
+        plugInFeedsIn = int(self._PlugInSolarPower) > 20 and (self._dbusservice['/Error'] == ERROR_NONE)  # plug in with appr. 20 W
+        powerOffset = -self._ZeroPoint
+        # with floating max is high and high SOC put zero point to zero or to negative
+        if int(self._dbusservice['/SocLastMax']) >= int(self._dbusservice['/PowerFeedInSoc']) and int(self._dbusservice['/SocFloatingMax']) >= MAXSOC:
+            powerOffset = self._ZeroPoint if plugInFeedsIn else 0
+        return powerOffset, plugInFeedsIn
+
+    # list of (inverters, filtered grid power, offset) controlled together, the order of self._inverter is kept.
+    # perphase splits the offset across the phases with inverters, the sum of all phases is set to ZeroPoint once
+    def _controlGroups(self, powerOffset):
+        if self._phaseStrategy == 'perphase':
+            groups = [
+                ([dtuService for dtuService in self._inverter if dtuService.configPhase == phase], power)
+                for phase, power in enumerate(self._phasePower)
+            ]
+            controlled = max(1, sum(1 for inverters, _ in groups if inverters))
+            return [(inverters, power, powerOffset / controlled) for inverters, power in groups]
+        return [(self._inverter, self._power, powerOffset)]
+
+    # producing inverters with the best efficiency for the next change first: the best one at the higher load when the
+    # feed in increases, the worst one at the actual load when it decreases. Sorted by full percent, the order of
+    # self._inverter (wear levelling) decides between equal values and for not learned curves
+    def _efficiencyOrder(self, inverters, increase):
+        def _key(dtuService):
+            efficiency = dtuService.getMarginalEfficiency(increase) if dtuService.getState() == 'Producing' else None
+            if efficiency is None:
+                return 1000
+            return -round(efficiency * 100) if increase else round(efficiency * 100)
+        return sorted(inverters, key=_key)
+
+    # battery energy saved with the efficiency of the sample compared with the mean efficiency of all HMs
+    def _updateSavings(self):
+        day = time.localtime().tm_yday
+        if day != self._savingsDay:
+            self._savingsDay = day
+            self._dbusservice['/Efficiency/SavedYesterday'] = self._dbusservice['/Efficiency/SavedToday']
+            self._dbusservice['/Efficiency/SavedToday'] = 0.0
+        saved = 0.0
+        for dtuService in self._inverter:
+            sample = dtuService.getEfficiencySample()
+            if not sample:
+                continue
+            acEnergy, load, efficiency = sample
+            known = [value for value in (other.getEfficiency(load) for other in self._inverter) if value]
+            if known:
+                saved += acEnergy / (sum(known) / len(known)) - acEnergy / efficiency
+        if saved:
+            self._dbusservice['/Efficiency/SavedToday'] = round(self._dbusservice['/Efficiency/SavedToday'] + saved, 2)
+
+    # grid power reduced by the new limit of an inverter, until the next meter value is read
+    def _setControlledPower(self, group, power):
+        if self._phaseStrategy == 'perphase':
+            self._power = int(self._power + power - self._phasePower[group])
+            self._phasePower[group] = int(power)
+        else:
+            self._power = int(power)
+
+    # lazy fetch, the DTU is only read when the data of this cycle is used
+    def _isDtuFetchRequired(self):
+        if not self._DTU_lazyFetch or not self._limitData:
+            return True
+        # control action follows, since the grid is outside the accuracy band
+        powerOffset, _ = self._getPowerOffset()
+        if any(abs(int(power) + offset) > self._Accuracy for _, power, offset in self._controlGroups(powerOffset)):
+            return True
+        # the state machine runs in this cycle and needs new data to detect stale data
+        if self._scheduler.cycleCounter % self._statusCycles == 0:
+            return True
+        return (time.monotonic() - self._lastDtuFetch) >= self._DTU_maxDataAge
+
     def _createDbusMonitor(self):
         dummy = {'code': None, 'whenToLog': 'configChange', 'accessLevel': None}
         self._monitor = DbusMonitor({
-            # do not scan 'com.victronenergy.acload' since we are a acload too. This will cause trouble at the DBUS-Monitor from com.victronenergy.system
+            # do not scan 'com.victronenergy.acload' since we are a acload too.
+            # This will cause trouble at the DBUS-Monitor from com.victronenergy.system
             # com.victronenergy.battery.socketcan_can0 or can1 etc.
             #  /Soc                        <- 0 to 100 % (BMV, BYD, Lynx BMS)
             #  /Info/MaxChargeCurrent      <- Charge Current Limit aka CCL  
@@ -443,61 +637,62 @@ class DbusShellyemService:
         return config;
  
  
-    def _getShellyStatusUrl(self):
-        config = self._getConfig()
+    def _getGridMeter(self, config):
         accessType = config['SHELLY']['AccessType']
-        if accessType == 'OnPremise': 
-            URL = "http://%s:%s@%s/status" % (config['SHELLY']['Username'], config['SHELLY']['Password'], config['SHELLY']['Host'])
-            URL = URL.replace(":@", "")
-        else:
+        if accessType != 'OnPremise':
             raise ValueError("AccessType %s is not supported" % (config['SHELLY']['AccessType']))
-        return URL
+        # credentials as HTTP authentication, not in the URL
+        return ShellyMeter(
+            config['SHELLY']['Host'],
+            self._eMsession,
+            self._phases,
+            float(config['DEFAULT']['HTTPTimeout']),
+            config['SHELLY']['Username'],
+            config['SHELLY']['Password'],
+        )
 
- 
-    def _getPlugInSolarShellyUrl(self):
-        config = self._getConfig()
-        # accessType = config['SHELLY']['AccessType']
-        #if accessType == 'OnPremise': 
-        #    URL = "http://%s:%s@%s/status" % (config['SHELLY']['Username'], config['SHELLY']['Password'], config['SHELLY']['Host'])
-        #    URL = URL.replace(":@", "")
-        #else:
-        #    raise ValueError("AccessType %s is not supported" % (config['SHELLY']['AccessType']))
-        URL = "http://%s/status" % (config['SHELLY']['Balcony'])
-        return URL
-   
-    def _fetch_url(self, URL, alarm, session, alarmEnable):
-        json = None
+    def _fetchMeter(self, meter, alarm, alarmEnable):
+        samples = None
+        error = None
+        fetchStart = time.monotonic()
         try:
-            logging.debug(f"calling {URL}")
-            rsp = session.get(url=URL)
-            rsp.raise_for_status() #HTTPError for status code >=400
-            logging.info(f"_fetch_url response status code: {str(rsp.status_code)}")
-            json = rsp.json()
+            samples = meter.read()
         except requests.HTTPError as http_err:
-            logging.info(f"_fetch_url response http error: {http_err}")
+            logging.info(f"_fetchMeter response http error: {http_err}")
             self._dbusservice['/Error'] =f"{alarm} / {http_err}"
+            error = 'http'
         except requests.ConnectTimeout as e:
             # Requests that produced this error are safe to retry.
             self._dbusservice['/Error'] =f"{alarm} / Connect Timeout"
+            error = 'connect'
         except requests.ReadTimeout as e:
             self._dbusservice['/Error'] =f"{alarm} / Read Timeout"
+            error = 'read'
         except requests.ConnectionError as e:
             # site does not exist
             self._dbusservice['/Error'] =f"{alarm} / Connect Error"
+            error = 'connect'
         except Exception as err:
-            logging.critical('Error at %s', '_fetch_url', exc_info=err)
+            logging.critical('Error at %s', '_fetchMeter', exc_info=err)
             self._dbusservice['/Error'] =f"{alarm} / Critical Exception"
+            error = 'decode'
         finally:
-            setAlarmOnService(alarm, None, bool((not json) and alarmEnable))
-            return json
+            target = METRIC_TARGETS.get(alarm, alarm)
+            METRICS.inc('opendtu_fetch_total', target=target)
+            METRICS.observe('opendtu_fetch_seconds', time.monotonic() - fetchStart, target=target)
+            if error:
+                METRICS.inc('opendtu_fetch_errors_total', target=target, kind=error)
+            setAlarmOnService(alarm, None, bool((not samples) and alarmEnable))
+            return samples
  
     def _signOfLife(self):
         try:
-            self._dbusservice['/HeaterEnableCounter'] = max(0, self._dbusservice['/HeaterEnableCounter'] - (10 if not self._SignOfLifeLog else int(self._SignOfLifeLog)))
+            signOfLifeLog = 10 if not self._SignOfLifeLog else int(self._SignOfLifeLog)
+            self._dbusservice['/HeaterEnableCounter'] = max(0, self._dbusservice['/HeaterEnableCounter'] - signOfLifeLog)
             logging.info(" --- Check for min SOC and switch relais --- ")
             # send relay On request to conected Shelly to keep micro inverters connected to grid 
             if self._dbusservice['/LoopIndex'] > 0 and int(self._dbusservice['/Soc']) > (int(self._dbusservice['/FeedInMinSoc']) - FEEDINONHYS):
-                if not self._dbusservice['/FeedInRelay'] and int(self._dbusservice['/Soc']) < (int(self._dbusservice['/FeedInMinSoc']) + FEEDINONHYS):
+                if not feedInRelay(int(self._dbusservice['/Soc']), int(self._dbusservice['/FeedInMinSoc']), self._dbusservice['/FeedInRelay']):
                     self._inverterSwitch( False )
                     logging.info(" ---   Wait for increasing SOC --> OFF   --- ")
                 elif bool(self._dbusservice['/NegativeGridCounter'] < 50):
@@ -535,14 +730,16 @@ class DbusShellyemService:
             except Exception as genExc:
                 logging.warning(f"HTTP Error at SwitchOffURL for inverter: {str(genExc)}")
     
-    def _update(self):   
+    # fetch stage: read grid and plug in solar from the Shellys and the data of all inverters once from the DTU
+    def _fetchStage(self):
         self._dbusservice['/Error'] = "--"
 
         # get feed in from plug in solar
-        balcony_data = self._fetch_url(self._plugInSolarURL, ALARM_BALCONY, self._balconySession, bool(self._pluginAlarmCounter >= ALARMCOUNTER))
+        balcony_data = self._fetchMeter(self._plugInSolarMeter, ALARM_BALCONY, bool(self._pluginAlarmCounter >= ALARMCOUNTER))
         if balcony_data:
-            self._PlugInSolarPower = balcony_data['emeters'][0]['power']
+            self._PlugInSolarPower = balcony_data[0]['power']
             self._pluginAlarmCounter = 0 
+            self._plugInDaily.update(float(self._PlugInSolarPower), time.time())
         else:
             self._PlugInSolarPower = AUXDEFAULT # assume AUXDEFAULT watt to reduce allowed feed in
             self._pluginAlarmCounter = self._pluginAlarmCounter + 1
@@ -550,32 +747,42 @@ class DbusShellyemService:
         self._dbusservice['/AuxFeedInPower'] = self._PlugInSolarPower
 
         # get data from Shelly em (grid)
-        meter_data = self._fetch_url(self._statusURL, ALARM_GRID, self._eMsession, bool(self._gridAlarmCounter >= ALARMCOUNTER))
-        if meter_data:
+        emeters = self._fetchMeter(self._gridMeter, ALARM_GRID, bool(self._gridAlarmCounter >= ALARMCOUNTER))
+        if emeters:
+            # one sample per phase, Shelly EM uses the first channel only
+            phasePower = [emeter['power'] for emeter in emeters]
             # send data to DBus
-            current = meter_data['emeters'][0]['power'] / meter_data['emeters'][0]['voltage']
-            self._dbusservice['/Ac/L1/Voltage'] = meter_data['emeters'][0]['voltage']
-            self._dbusservice['/Ac/L1/Current'] = current
-            self._dbusservice['/Ac/L1/Power'] = meter_data['emeters'][0]['power']
-            self._dbusservice['/Ac/L1/Energy/Forward'] = (meter_data['emeters'][0]['total']/1000)
-            # self._dbusservice['/Ac/L1/Energy/Reverse'] = (meter_data['emeters'][0]['total_returned']/1000)    
+            self._gridPower = sum(phasePower)
+            METRICS.set('opendtu_grid_power_watts', self._gridPower)
+            current = 0.0
+            energyForward = 0.0
+            energyReverse = 0.0
+            for phase, emeter in enumerate(emeters, start=1):
+                phaseCurrent = emeter['power'] / emeter['voltage'] if emeter['voltage'] else 0.0
+                self._dbusservice[f'/Ac/L{phase}/Voltage'] = emeter['voltage']
+                self._dbusservice[f'/Ac/L{phase}/Current'] = phaseCurrent
+                self._dbusservice[f'/Ac/L{phase}/Power'] = emeter['power']
+                self._dbusservice[f'/Ac/L{phase}/Energy/Forward'] = (emeter['total']/1000)
+                self._dbusservice[f'/Ac/L{phase}/Energy/Reverse'] = (emeter['total_returned']/1000)
+                current += phaseCurrent
+                energyForward += emeter['total']/1000
+                energyReverse += emeter['total_returned']/1000
             # don't forget the global values  
             self._dbusservice['/Ac/Current'] = current
-            self._dbusservice['/Ac/Power'] = meter_data['emeters'][0]['power']
-            self._dbusservice['/Ac/Voltage'] = meter_data['emeters'][0]['voltage']
-            self._dbusservice['/Ac/Energy/Forward'] = self._dbusservice['/Ac/L1/Energy/Forward']
-            # self._dbusservice['/Ac/Energy/Reverse'] = self._dbusservice['/Ac/L1/Energy/Reverse'] 
+            self._dbusservice['/Ac/Power'] = self._gridPower
+            self._dbusservice['/Ac/Voltage'] = emeters[0]['voltage']
+            self._dbusservice['/Ac/Energy/Forward'] = energyForward
+            self._dbusservice['/Ac/Energy/Reverse'] = energyReverse
+            # relay state of the sign of life as state, rollover writes the finished day to the checkpoint
+            if self._gridDaily.update(float(self._gridPower), time.time(), 'On' if self._dbusservice['/FeedInRelay'] else 'Off'):
+                self._saveCheckpoint(force=True)
        
-            # update power value with a average sum, dependens on (use)feedInAtNegativeWattDifference or on real feed in 
-            if meter_data['emeters'][0]['power'] < -(self._Accuracy):
-                # if the meter value is negative (feed in) react faster, _feedInFilterFactor = 0 -> meter value is directly used
-                self._setPowerMovingAverage(self._feedInFilterFactor, meter_data['emeters'][0]['power'])
-            elif (self._power - meter_data['emeters'][0]['power']) > self._bigPowerChangeDifference:
-                # if the change is greater than _bigPowerChangeDifference handle the power value like a feed in (react faster)
-                self._setPowerMovingAverage(self._feedInFilterFactor, meter_data['emeters'][0]['power'])
-            else:
-                # in all other cases assume consume and react with _consumeFilterFactor
-                self._setPowerMovingAverage(self._consumeFilterFactor, meter_data['emeters'][0]['power'])
+            # update power values with a average sum, the sum of all phases and each phase for the same filter rules
+            self._power = self._getPowerMovingAverage(self._power, self._gridPower)
+            self._phasePower = [
+                self._getPowerMovingAverage(filtered, actPower)
+                for filtered, actPower in zip(self._phasePower, phasePower)
+            ]
 
             # increment UpdateIndex - to show that new data is available
             self._dbusservice['/UpdateIndex'] = _incLimitCnt(self._dbusservice['/UpdateIndex'])
@@ -585,27 +792,236 @@ class DbusShellyemService:
             self._gridAlarmCounter = 0
         else:
             self._power = EXCEPTIONPOWER   # assume feed in to reduce feed in by micro inverter
+            self._phasePower = [EXCEPTIONPOWER] * self._phases
             self._gridAlarmCounter = self._gridAlarmCounter + 1
             
-        # run control loop after grid values have been updated
-        self._controlLoop()
-           
-        # switch feed in relais off at low soc, do not wait for _signOfLife, concurrent access?
-        # if int(self._dbusservice['/Soc']) <= int(self._dbusservice['/FeedInMinSoc']):
-        #    self._inverterSwitch( False )
+        # trigger read data once from DTU, or keep the last data when it is not used in this cycle
+        if self._isDtuFetchRequired():
+            self._lastDtuFetch = time.monotonic()
+            self._limitData = self._socket.fetchLimitData()
+        else:
+            self._socket.skipFetch()
 
-        # return true, otherwise add_timeout will be removed from GObject - 
-        # see docs http://library.isr.ist.utl.pt/docs/pygtk2reference/gobject-functions.html#function-gobject--timeout-add
-        return True
+    # decode stage: pass DTU data of this cycle to the inverters and sum up the current
+    def _decodeStage(self):
+        self._invCurrent = 0.0
+        if self._rotationTime:
+            # wear levelling, reorder after rotationTime, the ranking decides which inverters are moved
+            self._swap = bool((time.monotonic() - self._lastRotation) >= self._rotationTime)
+        else:
+            # use loop counter to swap with slow _SignOfLifeLog cycle
+            self._swap = bool(self._dbusservice['/LoopIndex'] == 0)
+        if not self._limitData:
+            self._swap = False
+            return
+        now = time.monotonic()
+        for dtuService in self._inverter:
+            current = round(dtuService.updateMeterData(),2)
+            if dtuService.isDataFresh():
+                self._leveler.update(dtuService.pvinverternumber, *dtuService.getWearData(), now)
+            if current != 0.0:
+                self._invCurrent += current
+            elif not self._rotationTime:
+                # if current is zero, do not swap, since at least one inverter is not active and should not be preferred
+                self._swap = False
+        self._updateSavings()
+
+    # state machine stage: same data as the control stage, runs every _statusCycles cycle
+    def _stateMachineStage(self):
+        if self._scheduler.cycleCounter % self._statusCycles == 0:
+            for dtuService in self._inverter:
+                dtuService.updateStateMachine()
+
+    # publish stage: inverter values and stage timing to DBUS
+    def _publishStage(self):
+        for dtuService in self._inverter:
+            dtuService.publishStatus()
+        publishAlarms()
+        # timing of the publish stage itself is the one of the previous cycle
+        for name, value in self._scheduler.stageTime.items():
+            self._dbusservice[f'/Timing/{name}'] = value
+        self._dbusservice['/Timing/Cycle'] = self._scheduler.cycleTime
+        self._updateCadence()
+        self._publishDaily()
+        self._restoreInverterCheckpoints()
+        self._saveCheckpoint()
+        self._writeRingLog()
+        # the collector process fetches the next cycle's data meanwhile, the interval may have changed above
+        self._socket.prefetch(self._scheduler.getInterval())
+        self._publishProfile()
+        self._publishWatchdog()
+
+    # controller, inverter and other service values for SnapshotExport
+    def _getSnapshot(self):
+        return {
+            "time": time.time(),
+            "cycle": self._scheduler.cycleCounter,
+            "controller": {
+                "service": self._servicename,
+                "power": self._power,
+                "gridPower": self._gridPower,
+                "phasePower": self._phasePower,
+                "plugInSolarPower": self._PlugInSolarPower,
+                "order": [dtuService.pvinverternumber for dtuService in self._inverter],
+                "values": self._dbusservice.getValues(),
+            },
+            "inverters": [dtuService.getSnapshot() for dtuService in self._inverterByNumber],
+            "services": [service.getSnapshot() for service in DCLoadDbusService if not isinstance(service, OpenDTUService)],
+        }
+
+    # daily values of the aggregates, the HM output is the sum of the inverter aggregates
+    def _publishDaily(self):
+        for index in (0, 1):
+            grid = self._gridDaily.getDay(index)
+            inverterOutput = sum(dtuService.getDailyYield(index) for dtuService in self._inverter)
+            plugIn = self._plugInDaily.getDay(index)['positive']
+            energy = {
+                'Import': grid['positive'],
+                'Export': grid['negative'],
+                'PlugInSolar': plugIn,
+                'InverterOutput': inverterOutput,
+                'FeedInAvoided': max(0.0, inverterOutput + plugIn - grid['negative']),
+            }
+            for name, value in energy.items():
+                self._dbusservice[f'/History/Daily/{index}/{name}'] = round(value / 1000, 3)
+            self._dbusservice[f'/History/Daily/{index}/MinPower'] = int(grid['min'] or 0)
+            self._dbusservice[f'/History/Daily/{index}/MaxPower'] = int(grid['max'] or 0)
+            self._dbusservice[f'/History/Daily/{index}/MeanPower'] = int(self._gridDaily.getMean(index))
+            self._dbusservice[f'/History/Daily/{index}/RelayOnTime'] = int(grid['states'].get('On', 0))
+
+    def _writeRingLog(self):
+        if not self._ringLog:
+            return
+        inverterValues = []
+        for dtuService in self._inverterByNumber:
+            inverterValues.extend(dtuService.getLogValues())
+        self._ringLog.write(
+            time.time(),
+            self._gridPower,
+            self._power,
+            self._PlugInSolarPower,
+            self._dbusservice['/Soc'],
+            self._dbusservice['/SocMaxChargeCurrent'],
+            self._dbusservice['/SocMaxDischargeCurrent'],
+            bool(self._dbusservice['/FeedInRelay']),
+            self._scheduler.cycleTime,  # of the previous cycle, this one is still running
+            *inverterValues,
+        )
+
+    def _restoreCheckpoint(self):
+        checkpoint = self._checkpoint
+        for path in SEASONAL_PATHS:
+            self._dbusservice[path] = checkpoint.get(path, self._dbusservice[path], SEASONAL_MAX_AGE)
+        # heater counter counts down in minutes, also while the service is not running
+        heaterCounter = checkpoint.get('/HeaterEnableCounter', None, 2 * HEATER_ENABLE_TIME * 60)
+        if heaterCounter is not None:
+            self._dbusservice['/HeaterEnableCounter'] = max(0, int(heaterCounter - checkpoint.getAge() / 60))
+        self._power = int(checkpoint.get('power', self._power, POWER_MAX_AGE))
+        self._restoreInverterCheckpoints()
+
+    # the checkpoint keys of an inverter are its serial, an inverter without DTU data is restored once it is known
+    def _restoreInverterCheckpoints(self):
+        checkpoint = self._checkpoint
+        for dtuService in self._inverter:
+            if not dtuService.hasSerial() or dtuService.pvinverternumber in self._restoredInverters:
+                continue
+            self._restoredInverters.add(dtuService.pvinverternumber)
+            dtuService.restoreCheckpoint(checkpoint.get(f'inverter/{dtuService.invSerial}', None, INVERTER_MAX_AGE))
+            dtuService.restoreThermalCheckpoint(checkpoint.get(f'thermal/{dtuService.invSerial}', None, SEASONAL_MAX_AGE))
+            dtuService.restoreEfficiencyCheckpoint(checkpoint.get(f'efficiency/{dtuService.invSerial}', None, SEASONAL_MAX_AGE))
+            dtuService.restoreDailyCheckpoint(checkpoint.get(f'daily/{dtuService.invSerial}', None, SEASONAL_MAX_AGE))
+
+    # the aggregates move a finished day to yesterday with the next sample
+    def _restoreDailyCheckpoint(self):
+        checkpoint = self._checkpoint
+        self._gridDaily.restoreCheckpoint(checkpoint.get('daily/grid', None, SEASONAL_MAX_AGE))
+        self._plugInDaily.restoreCheckpoint(checkpoint.get('daily/plugin', None, SEASONAL_MAX_AGE))
+
+    def _saveCheckpoint(self, force=False):
+        checkpoint = self._checkpoint
+        for path in SEASONAL_PATHS + ('/HeaterEnableCounter',):
+            checkpoint.set(path, self._dbusservice[path])
+        checkpoint.set('power', int(self._power))
+        for dtuService in self._inverter:
+            if not dtuService.hasSerial():
+                continue  # all inverters without DTU data would write the same keys
+            checkpoint.set(f'inverter/{dtuService.invSerial}', dtuService.getCheckpoint())
+            checkpoint.set(f'thermal/{dtuService.invSerial}', dtuService.getThermalCheckpoint())
+            checkpoint.set(f'efficiency/{dtuService.invSerial}', dtuService.getEfficiencyCheckpoint())
+            checkpoint.set(f'daily/{dtuService.invSerial}', dtuService.getDailyCheckpoint())
+        checkpoint.set('daily/grid', self._gridDaily.getCheckpoint())
+        checkpoint.set('daily/plugin', self._plugInDaily.getCheckpoint())
+        # written only if changed and not faster than checkpointInterval
+        checkpoint.flush(force)
+
+    # adaptive cadence, slow loop time while the inverters are idle and feed in is impossible or it is night
+    def _updateCadence(self):
+        feedInPossible = bool(int(self._dbusservice['/Soc']) > (int(self._dbusservice['/FeedInMinSoc']) - FEEDINONHYS))
+        gridStep = bool(abs(self._gridPower - self._lastGridPower) > self._bigPowerChangeDifference)
+        producing = any(dtuService.isProducing() for dtuService in self._inverter)
+        # no PV data on the DBUS, night is a battery that is not charged
+        night = bool(float(self._dbusservice['/SocChargeCurrent']) <= 0.0)
+        # back to fast cadence immediately on load steps, SOC thresholds or production
+        if producing or (feedInPossible != self._feedInPossible) or (gridStep and feedInPossible):
+            self._idleCounter = 0
+        elif feedInPossible and not night:
+            self._idleCounter = 0  # feed in may start with the next load, stay fast
+        elif self._idleCounter < IDLE_CYCLES:
+            self._idleCounter += 1
+        self._lastGridPower = self._gridPower
+        self._feedInPossible = feedInPossible
+        idle = bool(self._idleCounter >= IDLE_CYCLES)
+        self._dbusservice['/Idle'] = idle
+        interval = self._idleLoopTime if idle else self._DTU_loopTime
+        self._scheduler.setInterval(interval)
+        # the HM state machines count time, not loops
+        for dtuService in self._inverter:
+            dtuService.setLoopSteps(round(interval / self._DTU_loopTime))
+
+    # update power value with a average sum, dependens on (use)feedInAtNegativeWattDifference or on real feed in 
+    def _getPowerMovingAverage(self, filtered, actPower):
+        if actPower < -(self._Accuracy):
+            # if the meter value is negative (feed in) react faster, _feedInFilterFactor = 0 -> meter value is directly used
+            return self._movingAverage(self._feedInFilterFactor, filtered, actPower)
+        if (filtered - actPower) > self._bigPowerChangeDifference:
+            # if the change is greater than _bigPowerChangeDifference handle the power value like a feed in (react faster)
+            return self._movingAverage(self._feedInFilterFactor, filtered, actPower)
+        # in all other cases assume consume and react with _consumeFilterFactor
+        return self._movingAverage(self._consumeFilterFactor, filtered, actPower)
 
     # the factors are used to build a simplified moving average (SMA), SMA(x) = (SMA(t - 1) * factor + x) / (factor + 1)
-    def _setPowerMovingAverage(self, factor, actPower):
+    def _movingAverage(self, factor, filtered, actPower):
         # for bad mathematics check fator for 0 :)
         if factor == 0:
-            self._power = int(actPower)
-        else:
-            self._power = int(((self._power * factor) + actPower) / (factor + 1))
+            return int(actPower)
+        return int(((filtered * factor) + actPower) / (factor + 1))
+
+
+    # DBUS write of /Debug/Profile or /Debug/ProfileSeconds, runs in the GLib loop thread which is profiled
+    def _handleProfile(self, path, value):
+        try:
+            if int(value) == 0:
+                self._profiler.stop()
+                return True
+            if path == '/Debug/Profile':
+                return self._profiler.startCycles(int(value))
+            return self._profiler.startSampling(float(value))
+        except (TypeError, ValueError):
+            return False
+
+    # end of the publish stage, the deterministic profile covers whole cycles
+    def _publishProfile(self):
+        self._profiler.cycleDone()
+        self._dbusservice['/Debug/Profile'] = self._profiler.getCycles()
+        if not self._profiler.isRunning():
+            self._dbusservice['/Debug/ProfileSeconds'] = 0
+        self._dbusservice['/Debug/ProfileFile'] = self._profiler.lastFile
 
+    def _publishWatchdog(self):
+        self._dbusservice['/Debug/Watchdog/MaxDrift'] = int(WATCHDOG.maxDrift * 1000)
+        self._dbusservice['/Debug/Watchdog/Stalls'] = WATCHDOG.stalls
+        self._dbusservice['/Debug/Watchdog/DriftHistogram'] = WATCHDOG.getHistogram()
+        self._dbusservice['/Debug/Watchdog/Offenders'] = WATCHDOG.getOffenders()
 
     # https://github.com/victronenergy/velib_python/blob/master/dbusdummyservice.py#L63
     def _handlechangedvalue(self, path, value):
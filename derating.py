@@ -0,0 +1,76 @@
+
+# system imports:
+import math
+
+THERMAL_TIME = 600.0      # [s] time constant of the HM temperature, the power is averaged with it
+FORGET_TIME = 3 * 3600.0  # [s] older samples lose weight with this time constant
+MIN_SPREAD = 0.1          # min. standard deviation of the averaged power (part of nominal power) to trust the slope
+DERATE_RANGE = 10.0       # [°C] below maxTemperature the allowed power is reduced
+
+
+# ThermalModel class for the temperature derating of one HM.
+# Learns temperature = ambient + slope * power with a weighted least squares fit. The power is averaged with the
+# thermal time constant, so the fit compares the temperature with the power that caused it. The fit gives the
+# sustainable power, the power that settles at maxTemperature.
+class ThermalModel:
+
+    def __init__(self, maxTemperature, offTemperature):
+        self._maxTemperature = maxTemperature
+        self._offTemperature = offTemperature  # allowed power is 0 at this temperature
+        self._power = None  # [W] averaged power
+        self._lastUpdate = None
+        self._sums = [0.0] * 5  # weighted sums of 1, x, y, x*x, x*y with x = power and y = temperature
+
+    def update(self, power, temperature, now):
+        if self._lastUpdate is None:
+            self._power = power
+            self._lastUpdate = now
+            return
+        dt = max(0.0, now - self._lastUpdate)
+        self._lastUpdate = now
+        self._power += (power - self._power) * min(1.0, dt / THERMAL_TIME)
+        decay = math.exp(-dt / FORGET_TIME)
+        x = self._power
+        for index, value in enumerate((1.0, x, temperature, x * x, x * temperature)):
+            self._sums[index] = self._sums[index] * decay + value
+
+    # (ambient, slope) of the fit or None if the power did not vary enough
+    def getFit(self, nominalPower):
+        n, sx, sy, sxx, sxy = self._sums
+        if n < 10 or nominalPower <= 0:
+            return None
+        variance = sxx / n - (sx / n) ** 2
+        if variance < (MIN_SPREAD * nominalPower) ** 2:
+            return None
+        slope = (sxy / n - (sx / n) * (sy / n)) / variance
+        if slope <= 0:
+            return None
+        return (sy / n - slope * sx / n, slope)
+
+    # [W] power that settles at maxTemperature, nominal power if not learned yet
+    def getSustainablePower(self, nominalPower):
+        fit = self.getFit(nominalPower)
+        if not fit:
+            return nominalPower
+        ambient, slope = fit
+        return max(0.0, min(nominalPower, (self._maxTemperature - ambient) / slope))
+
+    # [W] allowed power at the actual temperature: full power below maxTemperature - DERATE_RANGE, down to the
+    # sustainable power at maxTemperature and down to 0 at the off temperature
+    def getAllowedPower(self, temperature, maxPower, nominalPower):
+        sustainable = min(maxPower, self.getSustainablePower(nominalPower))
+        if temperature <= self._maxTemperature - DERATE_RANGE:
+            return maxPower
+        if temperature <= self._maxTemperature:
+            part = (self._maxTemperature - temperature) / DERATE_RANGE
+            return sustainable + part * (maxPower - sustainable)
+        part = max(0.0, (self._offTemperature - temperature) / (self._offTemperature - self._maxTemperature))
+        return part * sustainable
+
+    def getCheckpoint(self):
+        return {"power": self._power, "sums": self._sums}
+
+    def restoreCheckpoint(self, data):
+        if data and len(data.get("sums", ())) == len(self._sums):
+            self._power = data["power"]
+            self._sums = [float(value) for value in data["sums"]]
@@ -0,0 +1,228 @@
+
+# system imports:
+import configparser
+import copy
+import logging
+import os
+import threading
+import time
+
+from dbus_service import DtuSocket, Singleton, _incLimitCnt
+from metrics import METRICS
+
+try:
+    import paho.mqtt.client as mqtt  # optional, only needed for DTU_mqtt=true
+except ImportError:
+    mqtt = None
+
+# OpenDTU topic <prefix>/<serial>/0/<field> -> key in AC or INV of /api/livedata/status, channel 1.. are the DC inputs
+AC_FIELDS = {"power": "Power", "voltage": "Voltage", "current": "Current", "frequency": "Frequency",
+             "yieldtotal": "YieldTotal", "yieldday": "YieldDay", "powerfactor": "PowerFactor",
+             "reactivepower": "ReactivePower"}
+INV_FIELDS = {"temperature": "Temperature", "efficiency": "Efficiency", "powerdc": "Power DC"}
+DC_FIELDS = {"power": "Power", "voltage": "Voltage", "current": "Current", "yieldtotal": "YieldTotal",
+             "yieldday": "YieldDay", "irradiation": "Irradiation"}
+STATUS_FIELDS = ("reachable", "producing", "limit_relative", "limit_absolute")
+
+
+def _number(payload):
+    value = float(payload)
+    return int(value) if value.is_integer() else value
+
+
+# MqttDtuSocket class with the same interface as DtuSocket: the live values and the limit, power and restart commands
+# go over the MQTT broker OpenDTU is connected to. The paho thread only collects the changed fields, fetchLimitData
+# applies them to a copy of the inverter data. The HTTP API is used for the first data (inverter order, names, nominal
+# power), the DTU reboot and as fallback while the broker is not connected or no inverter value arrived for
+# DTU_mqttMaxAge seconds. The commands take the same path as the fetch: a silent DTU gets them by HTTP, which reports
+# the failures, instead of unanswered MQTT messages.
+class MqttDtuSocket(DtuSocket):
+
+    def __init__(self):
+        self._client = None
+        self._connected = False
+        self._lock = threading.Lock()
+        self._pending = {}  # serial -> {(section, channel, key): value}, collected by the paho thread
+        self._received = {}  # serial -> time of the last channel value, new data of the inverter
+        self._lastMessage = 0.0  # monotonic time of the last inverter value
+        self.mqttBroker = None
+        self.mqttPort = 1883
+        self.mqttUsername = ""
+        self.mqttPassword = ""
+        self.mqttTopic = "solar"
+        self.mqttMaxAge = 30.0
+        super().__init__()
+
+    def _initSession(self):
+        super()._initSession()
+        self._start()
+
+    def _read_config_dtu(self):
+        super()._read_config_dtu()
+        config = configparser.ConfigParser()
+        config.read(f"{(os.path.dirname(os.path.realpath(__file__)))}/config.ini")
+        self.mqttBroker = config["DEFAULT"].get("DTU_mqttBroker", fallback="127.0.0.1")
+        self.mqttPort = int(config["DEFAULT"].get("DTU_mqttPort", fallback=1883))
+        self.mqttUsername = config["DEFAULT"].get("DTU_mqttUsername", fallback="")
+        self.mqttPassword = config["DEFAULT"].get("DTU_mqttPassword", fallback="")
+        self.mqttTopic = config["DEFAULT"].get("DTU_mqttTopic", fallback="solar").strip("/")
+        self.mqttMaxAge = float(config["DEFAULT"].get("DTU_mqttMaxAge", fallback=30))
+
+    def _start(self):
+        if mqtt is None:
+            logging.warning("DTU_mqtt needs paho-mqtt, the DTU is read by HTTP")
+            return
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            self._client = mqtt.Client()
+        if self.mqttUsername:
+            self._client.username_pw_set(self.mqttUsername, self.mqttPassword or None)
+        self._client.on_connect = self._onConnect
+        self._client.on_disconnect = self._onDisconnect
+        self._client.on_message = self._onMessage
+        self._client.reconnect_delay_set(1, 60)
+        self._client.connect_async(self.mqttBroker, self.mqttPort)
+        self._client.loop_start()
+        logging.info(f"OpenDTU MQTT client for {self.mqttBroker}:{self.mqttPort}, topic {self.mqttTopic}")
+
+    # paho thread, subscribe again after each reconnect, the arguments differ between paho 1.x and 2.x
+    def _onConnect(self, client, userdata, flags, reasonCode, *args):
+        if getattr(reasonCode, "is_failure", reasonCode != 0):
+            logging.warning(f"OpenDTU MQTT connect refused: {reasonCode}")
+            return
+        self._connected = True
+        client.subscribe(f"{self.mqttTopic}/+/+/+")  # <serial>/status/<field> and <serial>/<channel>/<field>
+        logging.info("OpenDTU MQTT connected")
+
+    def _onDisconnect(self, client, *args):
+        self._connected = False
+        logging.info("OpenDTU MQTT disconnected, the DTU is read by HTTP")
+
+    # paho thread
+    def _onMessage(self, client, userdata, message):
+        try:
+            parts = message.topic[len(self.mqttTopic) + 1:].split("/")
+            if len(parts) != 3 or parts[1] == "cmd":
+                return
+            invSerial, channel, field = parts
+            meterData = self._meter_data  # one read of the reference, the loop may swap it meanwhile
+            if not meterData or all(invData["serial"] != invSerial for invData in meterData["inverters"]):
+                return  # the dtu topics and inverters unknown to the HTTP data
+            payload = message.payload.decode("ascii")
+            if channel == "status":
+                if field not in STATUS_FIELDS:
+                    return
+                item = (None, None, field)
+            elif channel == "0" and field in AC_FIELDS:
+                item = ("AC", "0", AC_FIELDS[field])
+            elif channel == "0" and field in INV_FIELDS:
+                item = ("INV", "0", INV_FIELDS[field])
+            elif channel.isdigit() and channel != "0" and field in DC_FIELDS:
+                item = ("DC", str(int(channel) - 1), DC_FIELDS[field])
+            else:
+                return
+            value = _number(payload)
+            with self._lock:
+                self._pending.setdefault(invSerial, {})[item] = value
+                if item[0]:
+                    self._received[invSerial] = time.time()
+                    self._lastMessage = time.monotonic()
+        except Exception as e:
+            logging.warning(f"OpenDTU MQTT message {message.topic} ignored: {str(e)}")
+
+    def _isLive(self):
+        return (self._connected and bool(self._meter_data)
+                and time.monotonic() - self._lastMessage <= self.mqttMaxAge)
+
+    # apply the collected fields, only the changed inverters are copied, the services keep their data of this cycle
+    def _apply(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            received = dict(self._received)
+        self._fresh = {}
+        inverters = []
+        for invData in self._meter_data["inverters"]:
+            invSerial = invData["serial"]
+            fields = pending.get(invSerial)
+            if fields:
+                invData = copy.deepcopy(invData)
+                for (section, channel, key), value in fields.items():
+                    if section is None:
+                        invData[key] = value
+                    else:
+                        invData.setdefault(section, {}).setdefault(channel, {}).setdefault(key, {})["v"] = value
+            stamp = received.get(invSerial, 0)
+            fresh = stamp > self._updateStamp.get(invSerial, 0)
+            if fresh:
+                self._updateStamp[invSerial] = stamp
+                invData["data_age"] = 0
+            self._fresh[invSerial] = fresh
+            inverters.append(invData)
+        meterData = dict(self._meter_data)
+        meterData["inverters"] = inverters
+        self._meter_data = meterData
+        self.FetchCounter = _incLimitCnt(self.FetchCounter)
+
+    def fetchLimitData(self):
+        if not self._isLive():
+            return super().fetchLimitData()
+        self.SwitchCounter = 0
+        self.ResetCounter = max(0, self.ResetCounter - 1)
+        self._apply()
+        METRICS.inc("opendtu_fetch_total", target="dtu_mqtt")
+        return any(self._fresh.values())
+
+    # publish <prefix>/<serial>/cmd/<command>, QoS 0 like the web UI commands: no answer is awaited
+    def _publish(self, pvinverternumber, command, payload):
+        try:
+            invSerial = self._meter_data["inverters"][pvinverternumber]["serial"]
+            info = self._client.publish(f"{self.mqttTopic}/{invSerial}/cmd/{command}", str(payload))
+            logging.info(f"RESULT: {command}, MQTT rc = {info.rc}")
+            return 1 if info.rc == mqtt.MQTT_ERR_SUCCESS else 0
+        except Exception as e:
+            logging.warning(f"MQTT Error at {command} for inverter {pvinverternumber}: {str(e)}")
+            return 0
+
+    def resetDevice(self, pvinverternumber):
+        if not self._isLive():
+            return super().resetDevice(pvinverternumber)
+        result = self._publish(pvinverternumber, "restart", 1)
+        METRICS.inc("opendtu_reset_total", target="inverter", result="ok" if result else "error")
+        return result
+
+    def pushNewLimit(self, pvinverternumber, newLimit, absolute=False):
+        if not self._isLive():
+            return super().pushNewLimit(pvinverternumber, newLimit, absolute)
+        if not self.isCommandReady(pvinverternumber):
+            logging.info("RESULT: pushNewLimit, skip limit within DTU_commandSpacing")
+            return 0
+        self._lastCommand[pvinverternumber] = time.monotonic()
+        command = "limit_nonpersistent_absolute" if absolute else "limit_nonpersistent_relative"
+        result = self._publish(pvinverternumber, command, newLimit)
+        if not result:
+            self.WriteError += 1
+        METRICS.inc("opendtu_limit_push_total", inverter=pvinverternumber, result="ok" if result else "error")
+        return result
+
+    def switchOnOff(self, pvinverternumber, boOn):
+        if not self._isLive():
+            return super().switchOnOff(pvinverternumber, boOn)
+        if self.SwitchCounter != 0:
+            logging.info("RESULT: switchOnOff, skip switching to avoid to much switching")
+            return 0
+        result = self._publish(pvinverternumber, "power", int(boOn))
+        if result:
+            self.SwitchCounter += 1
+        else:
+            self.WriteError += 1
+        METRICS.inc("opendtu_switch_total", inverter=pvinverternumber, action="on" if boOn else "off",
+                    result="ok" if result else "error")
+        return result
+
+
+# use MQTT for the DTU, DtuSocket() returns the MQTT socket afterwards
+def startDtuMqtt():
+    socket = MqttDtuSocket()
+    Singleton._instances[DtuSocket] = socket
+    return socket
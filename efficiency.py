@@ -0,0 +1,56 @@
+
+BINS = 10                 # load bins of 10% nominal power each
+MIN_SAMPLES = 20          # samples before a bin is used
+AVERAGE_SAMPLES = 200     # running mean up to this count, then exponential average with the same weight
+MIN_LOAD = 0.02           # below this load the DTU values are too coarse
+
+
+# EfficiencyCurve class with the AC/DC efficiency of one HM binned by load level.
+# An update touches one bin, the memory is fixed to BINS values and counts.
+class EfficiencyCurve:
+
+    def __init__(self):
+        self._values = [0.0] * BINS
+        self._counts = [0] * BINS
+        self._lastUpdate = None
+
+    def _bin(self, load):
+        return min(BINS - 1, max(0, int(load * BINS)))
+
+    # returns the AC energy [Wh] since the last update, used for the savings
+    def update(self, acPower, dcPower, nominalPower, now):
+        lastUpdate = self._lastUpdate
+        self._lastUpdate = now
+        if nominalPower <= 0 or dcPower <= 0 or acPower <= 0 or acPower > dcPower:
+            return 0.0
+        load = acPower / nominalPower
+        if load < MIN_LOAD:
+            return 0.0
+        index = self._bin(load)
+        count = self._counts[index]
+        weight = 1.0 / min(count + 1, AVERAGE_SAMPLES)
+        self._values[index] += (acPower / dcPower - self._values[index]) * weight
+        self._counts[index] = count + 1
+        if lastUpdate is None:
+            return 0.0
+        return acPower * (now - lastUpdate) / 3600
+
+    # efficiency at the load level or None if not learned yet
+    def get(self, load):
+        index = self._bin(load)
+        return self._values[index] if self._counts[index] >= MIN_SAMPLES else None
+
+    # [%] per bin, 0 for bins not learned yet
+    def getCurve(self):
+        return [
+            round(value * 100, 1) if count >= MIN_SAMPLES else 0
+            for value, count in zip(self._values, self._counts)
+        ]
+
+    def getCheckpoint(self):
+        return {"values": self._values, "counts": self._counts}
+
+    def restoreCheckpoint(self, data):
+        if data and len(data.get("values", ())) == BINS and len(data.get("counts", ())) == BINS:
+            self._values = [float(value) for value in data["values"]]
+            self._counts = [int(count) for count in data["counts"]]
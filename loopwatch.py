@@ -0,0 +1,120 @@
+
+# system imports:
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from metrics import METRICS, CYCLE_BUCKETS
+
+if sys.version_info.major == 2:
+    import gobject
+else:
+    from gi.repository import GLib as gobject
+
+RECENT_RUNS = 20  # callbacks kept to find the ones running while a timer was due
+OFFENDERS = 5     # worst offenders published
+
+
+def _callbackName(callback):
+    owner = getattr(callback, "__self__", None)
+    name = getattr(callback, "__name__", repr(callback))
+    return f"{type(owner).__name__}.{name}" if owner is not None else name
+
+
+# Watchdog class for the GLib loop. Timers are registered with timeout_add_seconds/timeout_add of the watchdog
+# instead of gobject, the callbacks are wrapped to measure the drift (actual against scheduled firing time) and the
+# duration. A timer firing later than the stall threshold is an overrun, the callbacks which were running while it was
+# due are counted as offenders. Optionally a thread logs the stack of the loop thread once per stall when a callback
+# runs longer than the threshold. Other GLib sources (DBUS calls, DbusMonitor) are not wrapped, their time shows up
+# as drift without an offender.
+class Watchdog:
+
+    def __init__(self):
+        self._stall = 1.0  # [s]
+        self._recent = []  # (name, start, end) of the last callbacks, monotonic
+        self._running = None  # (name, start) of the running callback
+        self._histogram = [0] * (len(CYCLE_BUCKETS) + 1)  # drift count per bucket [s], as the metrics
+        self._offenders = {}  # name -> [overruns caused, max duration [s]]
+        self._thread = None
+        self._loopThread = None
+        self.maxDrift = 0.0  # [s]
+        self.stalls = 0
+
+    def configure(self, stall, stackDump=False):
+        self._stall = stall
+        if stackDump and stall > 0 and not self._thread:
+            self._loopThread = threading.get_ident()
+            self._thread = threading.Thread(target=self._watch, name="watchdog", daemon=True)
+            self._thread.start()
+
+    def timeout_add_seconds(self, interval, callback, *args):
+        return gobject.timeout_add_seconds(interval, self._wrap(interval, callback, args))
+
+    def timeout_add(self, interval, callback, *args):
+        return gobject.timeout_add(interval, self._wrap(interval / 1000.0, callback, args))
+
+    def _wrap(self, interval, callback, args):
+        name = _callbackName(callback)
+        due = [time.monotonic() + interval]
+
+        def _timer():
+            start = time.monotonic()
+            self._record(name, start, max(0.0, start - due[0]), due[0])
+            self._running = (name, start)
+            try:
+                result = callback(*args)
+            finally:
+                end = time.monotonic()
+                self._running = None
+                self._recent.append((name, start, end))
+                del self._recent[:-RECENT_RUNS]
+                METRICS.observe("opendtu_callback_seconds", end - start, callback=name)
+            # GLib schedules the next firing from the dispatch time of this one
+            due[0] = start + interval
+            return result
+        return _timer
+
+    def _record(self, name, now, drift, due):
+        self._histogram[bisect.bisect_left(CYCLE_BUCKETS, drift)] += 1
+        METRICS.observe("opendtu_timer_drift_seconds", drift, timer=name)
+        self.maxDrift = max(self.maxDrift, drift)
+        if drift < self._stall:
+            return
+        self.stalls += 1
+        blocking = [(runName, end - start) for runName, start, end in self._recent if end > due]
+        for runName, duration in blocking:
+            offender = self._offenders.setdefault(runName, [0, 0.0])
+            offender[0] += 1
+            offender[1] = max(offender[1], duration)
+        logging.warning(f"Timer {name} fired {drift:.2f}s late, running meanwhile: "
+                        f"{', '.join(f'{runName} {duration:.2f}s' for runName, duration in blocking) or 'unknown'}")
+
+    # drift count per bucket, the last one is above the largest bucket
+    def getHistogram(self):
+        return list(self._histogram)
+
+    # worst offenders as "name overruns x max ms", most overruns first
+    def getOffenders(self):
+        worst = sorted(self._offenders.items(), key=lambda item: (-item[1][0], -item[1][1]))[:OFFENDERS]
+        return [f"{name} {count}x {int(duration * 1000)}ms" for name, (count, duration) in worst]
+
+    # stack dump thread, one dump per long running callback
+    def _watch(self):
+        dumped = None
+        while True:
+            time.sleep(self._stall / 2)
+            running = self._running
+            if not running or running == dumped or time.monotonic() - running[1] < self._stall:
+                continue
+            dumped = running
+            frame = sys._current_frames().get(self._loopThread)  # pylint: disable=W0212 - no public API for other threads
+            if frame is not None:
+                logging.warning(f"Stall in {running[0]} for more than {self._stall}s:\n"
+                                f"{''.join(traceback.format_stack(frame))}")
+
+
+# one instance for all timers of the process
+WATCHDOG = Watchdog()
@@ -0,0 +1,150 @@
+
+# system imports:
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)            # [s] HTTP request duration
+CYCLE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # [s] scheduler cycle and stage duration
+
+# name -> (type, help, buckets), counters are monotonic and never wrap like the COUNTERLIMIT values on DBUS
+DEFINITIONS = {
+    "opendtu_fetch_total": ("counter", "HTTP fetches by target", None),
+    "opendtu_fetch_errors_total": ("counter", "Failed HTTP fetches by target and kind", None),
+    "opendtu_fetch_seconds": ("histogram", "Duration of HTTP fetches by target", FETCH_BUCKETS),
+    "opendtu_fetch_skipped_total": ("counter", "DTU fetches skipped by the lazy fetch", None),
+    "opendtu_limit_push_total": ("counter", "Limits pushed to the DTU by inverter and result", None),
+    "opendtu_switch_total": ("counter", "HM switch on/off commands by inverter, action and result", None),
+    "opendtu_reset_total": ("counter", "Restarts of an inverter or reboots of the DTU", None),
+    "opendtu_alarms_total": ("counter", "Raised alarms by alarm and device", None),
+    "opendtu_alarm_active": ("gauge", "Alarm state by alarm and device, 1 = active", None),
+    "opendtu_state_transitions_total": ("counter", "HM state machine transitions by inverter", None),
+    "opendtu_hm_state": ("gauge", "HM state by inverter, index of Init, Connect, Grid, Producing, SwitchOff, "
+                                  "Off, SwitchOn, Error", None),
+    "opendtu_limit_watts": ("gauge", "Actual limit by inverter", None),
+    "opendtu_data_age_seconds": ("gauge", "Age of the DTU data by inverter", None),
+    "opendtu_grid_power_watts": ("gauge", "Grid power read from the Shelly EM", None),
+    "opendtu_push_used_total": ("counter", "Shelly samples taken from pushes instead of polling by target", None),
+    "opendtu_cycles_total": ("counter", "Control cycles of the scheduler", None),
+    "opendtu_cycle_seconds": ("histogram", "Duration of a control cycle", CYCLE_BUCKETS),
+    "opendtu_stage_seconds": ("histogram", "Duration of the scheduler stages", CYCLE_BUCKETS),
+    "opendtu_loop_interval_seconds": ("gauge", "Actual scheduler interval", None),
+    "opendtu_timer_drift_seconds": ("histogram", "Late firing of the GLib timers by timer", CYCLE_BUCKETS),
+    "opendtu_callback_seconds": ("histogram", "Duration of the GLib timer callbacks by callback", CYCLE_BUCKETS),
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+# Metrics class for a Prometheus text endpoint.
+# The values are changed by the GLib loop only. publish() copies them once per cycle into a new snapshot and swaps
+# the reference, the HTTP thread renders the last snapshot and never touches the live values or waits for the loop.
+class Metrics:
+
+    def __init__(self):
+        self._values = {}  # (name, labels) -> value, for histograms [count per bucket ..., count +Inf, sum]
+        self._snapshot = {}
+        self._server = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name, default=None, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))), default)
+
+    def observe(self, name, value, **labels):
+        buckets = DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._values.get(key)
+        if histogram is None:
+            histogram = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    # values changed since the last call, the values are reset (collector process, see collector.py)
+    def take(self):
+        values, self._values = self._values, {}
+        return values
+
+    # add the values of take() of another process, counters and histograms are deltas, gauges are set
+    def merge(self, values):
+        for key, value in values.items():
+            kind = DEFINITIONS.get(key[0], ("gauge",))[0]
+            if kind == "gauge" or key not in self._values:
+                self._values[key] = value
+            elif kind == "histogram":
+                self._values[key] = [own + other for own, other in zip(self._values[key], value)]
+            else:
+                self._values[key] += value
+
+    # called once per cycle, the only copy of the values
+    def publish(self):
+        self._snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in self._values.items()}
+
+    def render(self):
+        snapshot = self._snapshot  # one read of the reference, the loop may swap it meanwhile
+        lines = []
+        lastName = None
+        for (name, labels), value in sorted(snapshot.items(), key=lambda item: item[0]):
+            kind, description, buckets = DEFINITIONS.get(name, ("untyped", "", None))
+            if name != lastName:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                lastName = name
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulated = 0
+            for bound, count in zip(buckets + ("+Inf",), value[:-1]):
+                cumulated += count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulated}")
+            lines.append(f"{name}_sum{_labels(labels)} {round(value[-1], 6)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulated}")
+        return "\n".join(lines) + "\n"
+
+    # HTTP server on its own daemon thread, GET /metrics
+    def start(self, bind, port):
+        if self._server:
+            return
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=C0103 - name given by BaseHTTPRequestHandler
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=W0622 - signature of BaseHTTPRequestHandler
+                pass
+
+        try:
+            self._server = HTTPServer((bind, port), MetricsHandler)
+        except OSError as e:
+            logging.warning(f"Metrics endpoint not started: {str(e)}")
+            return
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"Metrics endpoint at http://{bind}:{port}/metrics")
+
+
+# one instance for all services of the process
+METRICS = Metrics()
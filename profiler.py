@@ -0,0 +1,108 @@
+
+# system imports:
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+
+SAMPLE_INTERVAL = 0.005  # [s] stack sampling interval, about 200 samples per second
+MAX_SECONDS = 600        # [s] longest sampling run
+MAX_CYCLES = 1000        # longest deterministic run
+
+
+def _frameName(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+# Profiler class for on demand profiling of the GLib loop thread, started by writing /Debug/Profile (cycles,
+# deterministic, cProfile pstats) or /Debug/ProfileSeconds (sampling, collapsed stacks for flamegraph.pl or
+# speedscope). Nothing is installed while idle, cProfile is disabled after the cycles, the sampling thread ends after
+# the seconds. The results are written next to current.log as profile-<time>.pstats or profile-<time>.collapsed.
+class Profiler:
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._profile = None
+        self._cycles = 0  # remaining cycles of the deterministic run
+        self._sampler = None
+        self._stop = threading.Event()
+        self.lastFile = ""
+
+    def _filename(self, extension):
+        return os.path.join(self._directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+    def isRunning(self):
+        return bool(self._profile) or bool(self._sampler and self._sampler.is_alive())
+
+    def getCycles(self):
+        return self._cycles
+
+    # call from the GLib loop thread, the profiled thread
+    def startCycles(self, cycles):
+        if self.isRunning() or not 0 < int(cycles) <= MAX_CYCLES:
+            return False
+        self._cycles = int(cycles)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logging.info(f"Profiling {self._cycles} cycles")
+        return True
+
+    # called at the end of each cycle, detaches after the last one
+    def cycleDone(self):
+        if not self._profile:
+            return
+        self._cycles -= 1
+        if self._cycles > 0:
+            return
+        self._profile.disable()
+        filename = self._filename("pstats")
+        try:
+            self._profile.dump_stats(filename)
+            self.lastFile = filename
+            logging.warning(f"Profile written to {filename}")
+        except OSError as e:
+            logging.warning(f"Profile not written: {str(e)}")
+        self._profile = None
+        self._cycles = 0
+
+    # call from the thread to be sampled
+    def startSampling(self, seconds):
+        if self.isRunning() or not 0 < float(seconds) <= MAX_SECONDS:
+            return False
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), float(seconds)),
+                                         name="profiler", daemon=True)
+        self._sampler.start()
+        logging.info(f"Sampling for {seconds}s")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._profile:
+            self._cycles = 1
+            self.cycleDone()
+
+    def _sample(self, threadId, seconds):
+        stacks = {}
+        end = time.monotonic() + seconds
+        while time.monotonic() < end and not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(threadId)  # pylint: disable=W0212 - no public API for other threads
+            names = []
+            while frame is not None:
+                names.append(_frameName(frame))
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                stacks[stack] = stacks.get(stack, 0) + 1
+        filename = self._filename("collapsed")
+        try:
+            with open(filename, "w", encoding="utf-8") as file:
+                for stack, count in sorted(stacks.items()):
+                    file.write(f"{stack} {count}\n")
+            self.lastFile = filename
+            logging.warning(f"Profile written to {filename}, {sum(stacks.values())} samples")
+        except OSError as e:
+            logging.warning(f"Profile not written: {str(e)}")
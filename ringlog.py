@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+'''memory mapped ring buffer with one row per control cycle, export with: ringlog.py ringlog.bin out.csv|out.parquet'''
+
+# system imports:
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"DTURING1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIQ")  # magic, version, capacity, inverter count, rows written
+HEADER_SIZE = 64
+# time stamp, raw grid, filtered grid, plug in solar, SOC, CCL, DCL, relay, loop duration
+ROW_FIELDS = (
+    ("time", "d"), ("grid", "f"), ("gridFiltered", "f"), ("plugIn", "f"), ("soc", "f"),
+    ("ccl", "f"), ("dcl", "f"), ("relay", "B"), ("loopTime", "f"),
+)
+# per inverter: limit, AC power, temperature, HM state (index of HM_STATES)
+INVERTER_FIELDS = (("limit", "f"), ("power", "f"), ("temperature", "f"), ("state", "B"))
+
+
+def _row_format(inverterCount):
+    return "<" + "".join(fmt for _, fmt in ROW_FIELDS) + "".join(fmt for _, fmt in INVERTER_FIELDS) * inverterCount
+
+
+# RingLog class, fixed size file mapped into memory. A write packs one row into the mapping and increments the
+# row counter in the header, there is no allocation of buffers and no file system call per row.
+class RingLog:
+
+    def __init__(self, filename, capacity, inverterCount):
+        self._row = struct.Struct(_row_format(inverterCount))
+        self._capacity = capacity
+        self._inverterCount = inverterCount
+        size = HEADER_SIZE + capacity * self._row.size
+        self._file = os.fdopen(os.open(filename, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        try:
+            self._file.seek(0)
+            magic, version, oldCapacity, oldCount, self._written = HEADER.unpack(self._file.read(HEADER.size))
+            if (magic, version, oldCapacity, oldCount) != (MAGIC, VERSION, capacity, inverterCount):
+                raise ValueError("format changed")
+        except (struct.error, ValueError):
+            logging.info(f"RingLog: create {filename} for {capacity} rows")
+            self._written = 0
+            self._file.truncate(0)
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, capacity, inverterCount, self._written)
+
+    def write(self, *values):
+        offset = HEADER_SIZE + (self._written % self._capacity) * self._row.size
+        self._row.pack_into(self._mm, offset, *values)
+        self._written += 1
+        # counter is written last, a reader sees either the old or the complete new row
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self._capacity, self._inverterCount, self._written)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def read(filename):
+    '''Map the ring buffer with NumPy (zero copy) and return the rows in chronological order.'''
+    import numpy as np  # pylint: disable=C0415 - only required for the analysis
+
+    with open(filename, "rb") as logfile:
+        magic, version, capacity, inverterCount, written = HEADER.unpack(logfile.read(HEADER.size))
+    if (magic, version) != (MAGIC, VERSION):
+        raise ValueError(f"{filename} is not a ring log")
+    fields = [(name, "<" + fmt) for name, fmt in ROW_FIELDS]
+    for number in range(inverterCount):
+        fields += [(f"inv{number}_{name}", "<" + fmt) for name, fmt in INVERTER_FIELDS]
+    rows = np.memmap(filename, dtype=np.dtype(fields), mode="r", offset=HEADER_SIZE, shape=(capacity,))
+    if written <= capacity:
+        return rows[:written]
+    # wrapped, the only copy is the concatenation of both parts
+    start = written % capacity
+    return np.concatenate((rows[start:], rows[:start]))
+
+
+def export(filename, outname):
+    '''Export the ring buffer to CSV or Parquet (pandas required) depending on the file extension.'''
+    rows = read(filename)
+    if outname.endswith(".parquet"):
+        import pandas as pd  # pylint: disable=C0415,E0401 - only required for the export
+
+        frame = pd.DataFrame(rows)
+        frame["time"] = pd.to_datetime(frame["time"], unit="s")
+        frame.to_parquet(outname)
+    else:
+        with open(outname, "w", encoding="utf-8") as outfile:
+            outfile.write(",".join(rows.dtype.names) + "\n")
+            for row in rows:
+                values = list(row.tolist())
+                values[0] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(values[0]))
+                outfile.write(",".join(str(value) for value in values) + "\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"usage: {os.path.basename(sys.argv[0])} ringlog.bin out.csv|out.parquet")
+        sys.exit(1)
+    export(sys.argv[1], sys.argv[2])
@@ -0,0 +1,65 @@
+
+# system imports:
+import heapq
+import itertools
+
+ENERGY_WEIGHT = 0.01       # score per full load hour (YieldTotal / nominal power), 100h count like 10 degree
+DUTY_WEIGHT = 2.0          # score for a recent duty of 100% nominal power
+HEADROOM_WEIGHT = 0.1      # score per degree below maxTemperature, subtracted
+DUTY_TIME = 900.0          # [s] time constant of the recent duty average
+
+
+# WearLeveler class to rank the inverters for the control loop, the first inverter takes most of the changes.
+# Low score first: little energy compared to the nominal power, low recent duty and much temperature headroom.
+# The ranking is kept in a heap, an update pushes a new entry and invalidates the old one of the inverter.
+class WearLeveler:
+
+    def __init__(self, maxTemperature):
+        self._maxTemperature = maxTemperature
+        self._heap = []
+        self._entries = {}  # inverter number -> valid heap entry [score, sequence, number, valid]
+        self._duty = {}  # inverter number -> (average of power / nominal power, time stamp)
+        self._sequence = itertools.count()
+
+    # called with new DTU data of an inverter
+    def update(self, number, energy, nominalPower, temperature, power, now):
+        if nominalPower <= 0:
+            return
+        load = min(1.0, max(0.0, power / nominalPower))
+        duty, lastUpdate = self._duty.get(number, (load, now))
+        # exponential average with the time constant DUTY_TIME, the DTU data does not arrive in fixed intervals
+        factor = min(1.0, (now - lastUpdate) / DUTY_TIME)
+        duty += (load - duty) * factor
+        self._duty[number] = (duty, now)
+        score = (
+            ENERGY_WEIGHT * energy * 1000 / nominalPower
+            + DUTY_WEIGHT * duty
+            - HEADROOM_WEIGHT * (self._maxTemperature - temperature)
+        )
+        oldEntry = self._entries.get(number)
+        if oldEntry:
+            oldEntry[-1] = False
+        entry = [score, next(self._sequence), number, True]
+        self._entries[number] = entry
+        heapq.heappush(self._heap, entry)
+        # drop invalid entries when they dominate the heap
+        if len(self._heap) > 4 * len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[-1]]
+            heapq.heapify(self._heap)
+
+    def getScore(self, number):
+        entry = self._entries.get(number)
+        return entry[0] if entry else None
+
+    # inverter numbers, best first
+    def ranking(self):
+        return [entry[2] for entry in heapq.nsmallest(len(self._entries), (entry for entry in self._heap if entry[-1]))]
+
+    # new order of the inverter services, the ranked ones first, the others keep their order at the end
+    def order(self, inverters, ranked):
+        position = {number: index for index, number in enumerate(self.ranking())}
+        first = sorted(
+            (dtuService for dtuService in inverters if ranked(dtuService) and dtuService.pvinverternumber in position),
+            key=lambda dtuService: position[dtuService.pvinverternumber],
+        )
+        return first + [dtuService for dtuService in inverters if dtuService not in first]
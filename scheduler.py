@@ -0,0 +1,85 @@
+
+# system imports:
+import logging
+import time
+
+from metrics import METRICS
+from loopwatch import WATCHDOG
+
+
+# Scheduler class for one control cycle, the stages are called in the given order on one timer.
+# All stages of a cycle work on the DTU and Shelly data fetched at the begin of the same cycle.
+# timeout_add_seconds is rounded and grouped to whole seconds by GLib. With highResolution one shot millisecond timers
+# are scheduled on the monotonic clock instead, fractional intervals are possible and the cadence does not drift with
+# the cycle duration.
+class CycleScheduler:
+
+    def __init__(self, interval, stages, highResolution=False):
+        self._interval = interval
+        self._stages = stages  # list of (name, function), the order is the execution order
+        self._highResolution = highResolution
+        self._timer = None
+        self._restart = False
+        self._next = 0.0  # monotonic due time of the next cycle, highResolution only
+        self.cycleCounter = 0
+        self.cycleTime = 0.0  # [ms] duration of the last cycle
+        self.stageTime = {name: 0.0 for name, _ in stages}  # [ms] duration per stage of the last cycle
+
+    def start(self):
+        if not self._timer:
+            if self._highResolution:
+                self._next = time.monotonic() + self._interval
+                self._timer = WATCHDOG.timeout_add(int(self._interval * 1000), self._run)
+            else:
+                self._timer = WATCHDOG.timeout_add_seconds(self._interval, self._run)
+
+    def getInterval(self):
+        return self._interval
+
+    # new interval is applied at the end of the running or next cycle
+    def setInterval(self, interval):
+        if interval != self._interval:
+            logging.info(f"Scheduler interval {self._interval}s -> {interval}s")
+            self._interval = interval
+            self._restart = True
+
+    def _run(self):
+        cycleStart = time.monotonic()
+        for name, stage in self._stages:
+            stageStart = time.monotonic()
+            try:
+                stage()
+            except Exception as e:
+                # a failing stage must not stop the following stages, e.g. publish the error counters
+                logging.critical('Error at %s', name, exc_info=e)
+            stageDuration = time.monotonic() - stageStart
+            self.stageTime[name] = round(stageDuration * 1000, 1)
+            METRICS.observe("opendtu_stage_seconds", stageDuration, stage=name)
+        cycleDuration = time.monotonic() - cycleStart
+        self.cycleTime = round(cycleDuration * 1000, 1)
+        self.cycleCounter += 1
+        METRICS.observe("opendtu_cycle_seconds", cycleDuration)
+        METRICS.inc("opendtu_cycles_total")
+        METRICS.set("opendtu_loop_interval_seconds", self._interval)
+        # one consistent snapshot per cycle for the metrics endpoint
+        METRICS.publish()
+        if self._highResolution:
+            self._scheduleNext()
+            return False
+        if self._restart:
+            # replace the timer, returning false removes the actual one
+            self._restart = False
+            self._timer = WATCHDOG.timeout_add_seconds(self._interval, self._run)
+            return False
+        # return true, otherwise add_timeout will be removed from GObject
+        return True
+
+    # one shot timer to the next due time, a new interval applies from this cycle on
+    def _scheduleNext(self):
+        self._restart = False
+        now = time.monotonic()
+        self._next += self._interval
+        if self._next <= now:
+            # overrun, skip the missed cycles and keep the phase
+            self._next += (int((now - self._next) / self._interval) + 1) * self._interval
+        self._timer = WATCHDOG.timeout_add(int((self._next - now) * 1000), self._run)
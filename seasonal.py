@@ -0,0 +1,37 @@
+
+BASESOC = 54                       # [%] with 8% min SOC -> 92% range -> 54% in the middle
+MINMAXSOC = BASESOC + 20           # [%] 40% range per default
+MAXCALCSOC = 110                   # [%] 100% plus 10 days/loadcycles (stick longer at 100% in summer)
+MAXSOC = 99                        # [%] maximum state of charge (with 58V battery, 58.5V is the max. voltage)
+FEEDINONHYS = 2                    # [%] hystersis for activationb of feed in relay to prevent alternating on-off
+
+
+# Seasonal feed in logic without state of its own, used by the control loop and by backtest.py.
+# The floating max follows the SOC peaks: it jumps up with half of the difference when a peak is higher, it steps
+# down by one per lower peak. A high floating max (summer) lowers the feed in min SOC and vice versa.
+
+# True if the SOC turns from charging to discharging, the SOC before the new increment is a peak
+def isPeak(increment, lastIncrement):
+    return increment * lastIncrement < 0 and lastIncrement > 0
+
+# new floating max after a SOC peak
+def peakFloatingMax(peakSoc, floatingMax, minMaxSoc=MINMAXSOC):
+    if peakSoc == MAXSOC:
+        floatingMax = MAXCALCSOC
+    if peakSoc < MAXSOC and peakSoc > floatingMax:
+        # increase max immediately with half of difference since each increase of max counts twice for increase of range
+        floatingMax += int(((peakSoc - floatingMax) + 1) / 2)
+    if (peakSoc >= minMaxSoc or floatingMax > minMaxSoc) and peakSoc < floatingMax:
+        # decrease by steps until minMaxSoc is reached
+        floatingMax -= 1
+    return floatingMax
+
+# min SOC for feed in, mirrored at the base SOC
+def feedInMinSoc(floatingMax, baseSoc=BASESOC):
+    return int(baseSoc - (min(int(floatingMax), MAXSOC) - baseSoc))
+
+# feed in relay of the sign of life with hysteresis around the min SOC, the state is kept in between
+def feedInRelay(soc, minSoc, relay, hysteresis=FEEDINONHYS):
+    if soc > minSoc - hysteresis:
+        return bool(relay or soc >= minSoc + hysteresis)
+    return False
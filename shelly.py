@@ -0,0 +1,117 @@
+
+# system imports:
+import logging
+import requests  # for http GET
+from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+
+ENERGY_CYCLES = 10  # Gen2 energy counters are a separate RPC call, read every n-th fetch, the power every fetch
+GEN2_USER = "admin"  # Gen2 devices have the fixed user admin and digest authentication
+PHASE_PREFIXES = ("a", "b", "c")  # Gen2 EM component, one prefix per phase
+METHOD_NOT_FOUND = (404, -32601)  # RPC error codes of a missing method, Gen2 "No handler for" and JSON-RPC
+
+
+# True if the RPC error of the response is a missing method, the component does not exist on this device
+def _isMethodNotFound(response):
+    if response is None:
+        return False
+    if response.status_code == 404:
+        return True
+    try:
+        return response.json().get("code") in METHOD_NOT_FOUND
+    except (ValueError, AttributeError):
+        return False
+
+
+def _sample(power, voltage, total, returned):
+    # the keys of a Gen1 emeter, energy in Wh
+    return {"power": float(power), "voltage": float(voltage), "total": float(total), "total_returned": float(returned)}
+
+
+# ShellyMeter class reading the emeters of a Shelly with the smallest endpoints of its generation.
+# The generation is detected once with /shelly (no authentication needed) and cached:
+#   Gen1 (Shelly EM, 3EM):              GET /emeter/<n> per phase
+#   Gen2+ with EM (Pro 3EM):            GET /rpc/EM.GetStatus?id=0, all phases, EMData.GetStatus for the energy
+#   Gen2+ with EM1 (Pro EM, EM Gen3):   GET /rpc/EM1.GetStatus?id=<n> per phase, EM1Data.GetStatus for the energy
+# read() returns one sample per phase with the keys of a Gen1 emeter: power [W], voltage [V], total and
+# total_returned [Wh]. HTTP and decoding errors are raised like requests does, the caller counts them.
+class ShellyMeter:
+
+    def __init__(self, host, session, phases=1, timeout=None, username="", password="", energy=True):
+        self._host = host
+        self._session = session
+        self._phases = phases
+        self._timeout = timeout
+        self._username = username
+        self._password = password
+        self._energy = energy  # False: Gen2 energy is not read, total and total_returned stay 0
+        self._auth = None
+        self._fetchCounter = 0
+        self._totals = [(0.0, 0.0)] * phases  # (total, total_returned) [Wh] of the last Gen2 energy read
+        self.generation = None
+        self.component = None  # "emeter" (Gen1), "EM" or "EM1" (Gen2+)
+
+    def _get(self, path):
+        rsp = self._session.get(url=f"http://{self._host}{path}", auth=self._auth, timeout=self._timeout)
+        rsp.raise_for_status()  # HTTPError for status code >=400
+        return rsp.json()
+
+    # cached after the first complete detection, a failing probe is repeated with the next read. Only a missing
+    # EM.GetStatus method selects EM1, other errors like a wrong password or a timeout are raised
+    def _detect(self):
+        info = self._get("/shelly")
+        generation = int(info.get("gen", 1))
+        if generation == 1:
+            component = "emeter"
+            if self._username and self._password:
+                self._auth = HTTPBasicAuth(self._username, self._password)
+        else:
+            if self._password:
+                self._auth = HTTPDigestAuth(GEN2_USER, self._password)
+            try:
+                self._get("/rpc/EM.GetStatus?id=0")
+                component = "EM"
+            except requests.HTTPError as e:
+                if not _isMethodNotFound(e.response):
+                    raise
+                component = "EM1"
+        self.generation, self.component = generation, component
+        logging.info(f"Shelly {self._host}: generation {generation}, {component} "
+                     f"({info.get('type') or info.get('app') or info.get('model')})")
+
+    def read(self):
+        if self.generation is None:
+            self._detect()
+        self._fetchCounter += 1
+        if self.component == "emeter":
+            return [self._readEmeter(phase) for phase in range(self._phases)]
+        if self._energy and (self._fetchCounter - 1) % ENERGY_CYCLES == 0:
+            self._readEnergy()
+        if self.component == "EM":
+            status = self._get("/rpc/EM.GetStatus?id=0")
+            return [
+                _sample(status[f"{prefix}_act_power"], status[f"{prefix}_voltage"], *self._totals[phase])
+                for phase, prefix in enumerate(PHASE_PREFIXES[:self._phases])
+            ]
+        samples = []
+        for phase in range(self._phases):
+            status = self._get(f"/rpc/EM1.GetStatus?id={phase}")
+            samples.append(_sample(status["act_power"], status["voltage"], *self._totals[phase]))
+        return samples
+
+    def _readEmeter(self, phase):
+        emeter = self._get(f"/emeter/{phase}")
+        return _sample(emeter["power"], emeter["voltage"], emeter["total"], emeter["total_returned"])
+
+    def _readEnergy(self):
+        if self.component == "EM":
+            data = self._get("/rpc/EMData.GetStatus?id=0")
+            self._totals = [
+                (data[f"{prefix}_total_act_energy"], data[f"{prefix}_total_act_ret_energy"])
+                for prefix in PHASE_PREFIXES[:self._phases]
+            ]
+        else:
+            totals = []
+            for phase in range(self._phases):
+                data = self._get(f"/rpc/EM1Data.GetStatus?id={phase}")
+                totals.append((data["total_act_energy"], data["total_act_ret_energy"]))
+            self._totals = totals
@@ -0,0 +1,249 @@
+
+# system imports:
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+
+from metrics import METRICS
+
+try:
+    import paho.mqtt.client as mqtt  # optional, only needed for Push=mqtt
+except ImportError:
+    mqtt = None
+
+COIOT_GROUP = "224.0.1.187"  # CoIoT multicast group of Gen1 Shellys
+COIOT_DEVICE_OPTION = 3332   # CoAP option with the device id, e.g. SHEM#B8E3F2#2
+COIOT_FIELDS = {5: "power", 6: "total", 7: "total_returned", 8: "voltage"}  # CoIoT id 4105 = emeter 0 power, 4205 = 1
+MQTT_GEN1_FIELDS = ("power", "voltage", "total", "total_returned")
+
+
+# PushSlot class with the last pushed samples of one Shelly. The listener thread replaces the (time, samples) tuple,
+# the control loop reads the reference once, no lock is needed.
+class PushSlot:
+
+    def __init__(self):
+        self._value = (0.0, None)
+
+    def set(self, samples):
+        self._value = (time.monotonic(), samples)
+
+    # samples not older than maxAge seconds, None if the pushes stopped
+    def get(self, maxAge):
+        stamp, samples = self._value
+        return samples if samples and time.monotonic() - stamp <= maxAge else None
+
+
+# PushDevice class collecting the values of one Shelly per phase, the pushes may contain single values
+class PushDevice:
+
+    def __init__(self, name, pushId, host, phases):
+        self.name = name
+        self.pushId = pushId
+        self.address = _resolve(host)
+        self.slot = PushSlot()
+        self._phases = [{} for _ in range(phases)]
+
+    def update(self, phase, field, value):
+        if phase < len(self._phases):
+            self._phases[phase][field] = float(value)
+
+    # new samples after all values of a message are updated, once the power of all phases is known
+    def publish(self):
+        if all("power" in values for values in self._phases):
+            # the keys of a Gen1 emeter like ShellyMeter.read(), energy is 0 until pushed
+            self.slot.set([
+                {"power": values["power"], "voltage": values.get("voltage", 0.0),
+                 "total": values.get("total", 0.0), "total_returned": values.get("total_returned", 0.0)}
+                for values in self._phases
+            ])
+
+
+def _resolve(host):
+    try:
+        return socket.gethostbyname(host.split(":")[0])
+    except OSError:
+        return None
+
+
+# PushedMeter class in front of a ShellyMeter: the pushed samples while they are fresh, HTTP polling otherwise
+class PushedMeter:
+
+    def __init__(self, meter, slot, maxAge, target):
+        self._meter = meter
+        self._slot = slot
+        self._maxAge = maxAge
+        self._target = target
+
+    def read(self):
+        samples = self._slot.get(self._maxAge)
+        if samples is None:
+            return self._meter.read()
+        METRICS.inc("opendtu_push_used_total", target=self._target)
+        return samples
+
+
+def _parseCoap(packet):
+    '''Options and payload of a CoAP message, (None, None) for other datagrams.'''
+    if len(packet) < 4 or packet[0] >> 6 != 1:
+        return None, None
+    position = 4 + (packet[0] & 0x0F)  # header and token
+    number = 0
+    options = {}
+    while position < len(packet) and packet[position] != 0xFF:
+        delta, length = packet[position] >> 4, packet[position] & 0x0F
+        position += 1
+        values = []
+        for value in (delta, length):
+            if value == 13:
+                value = packet[position] + 13
+                position += 1
+            elif value == 14:
+                value = int.from_bytes(packet[position:position + 2], "big") + 269
+                position += 2
+            values.append(value)
+        number += values[0]
+        options[number] = packet[position:position + values[1]]
+        position += values[1]
+    return options, packet[position + 1:]
+
+
+# CoiotListener thread for Gen1 CoIoT status messages, multicast or unicast (CoIoT peer setting of the Shelly).
+# The device is matched by the MAC part of the push id, e.g. shellyem-B8E3F2, or by the sender address.
+class CoiotListener:
+
+    def __init__(self, devices, port=5683):
+        self._devices = devices
+        self._port = port
+
+    def start(self):
+        threading.Thread(target=self._run, name="coiot", daemon=True).start()
+
+    def _match(self, options, address):
+        deviceId = options.get(COIOT_DEVICE_OPTION, b"").decode("ascii", "replace").upper()
+        for device in self._devices:
+            mac = device.pushId.rsplit("-", 1)[-1].upper()
+            if (mac and f"#{mac}#" in deviceId) or (not mac and address == device.address):
+                return device
+        return None
+
+    def _run(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("", self._port))
+        except OSError as e:
+            logging.warning(f"CoIoT listener not started: {str(e)}")
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                            struct.pack("4s4s", socket.inet_aton(COIOT_GROUP), socket.inet_aton("0.0.0.0")))
+        except OSError as e:
+            logging.info(f"CoIoT multicast not joined, unicast only: {str(e)}")
+        logging.info(f"CoIoT listener on port {self._port}")
+        while True:
+            try:
+                packet, (address, _) = sock.recvfrom(2048)
+                options, payload = _parseCoap(packet)
+                device = self._match(options, address) if options is not None else None
+                if not device or not payload:
+                    continue
+                for _, sensorId, value in json.loads(payload).get("G", ()):
+                    field = COIOT_FIELDS.get(sensorId % 100)
+                    if field and sensorId // 100 >= 41:
+                        device.update(sensorId // 100 - 41, field, value)
+                device.publish()
+            except Exception as e:
+                logging.warning(f"CoIoT message ignored: {str(e)}")
+
+
+# MqttListener for Gen1 (shellies/<id>/emeter/<n>/<field>) and Gen2 (<id>/status/em:0, em1:<n>, emdata:0,
+# em1data:<n>, generic status update over MQTT enabled) topics. paho runs its own network thread.
+class MqttListener:
+
+    def __init__(self, devices, broker, port=1883, username="", password=""):
+        self._devices = devices
+        self._broker = broker
+        self._port = port
+        self._username = username
+        self._password = password
+
+    def start(self):
+        if mqtt is None:
+            logging.warning("MQTT push needs paho-mqtt, the Shellys are polled")
+            return
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            client = mqtt.Client()
+        if self._username:
+            client.username_pw_set(self._username, self._password or None)
+        client.on_connect = self._onConnect
+        client.on_message = self._onMessage
+        client.reconnect_delay_set(1, 60)
+        client.connect_async(self._broker, self._port)
+        client.loop_start()
+        logging.info(f"MQTT listener for {self._broker}:{self._port}")
+
+    # subscribe again after each reconnect, the arguments differ between paho 1.x and 2.x
+    def _onConnect(self, client, *args):
+        for device in self._devices:
+            client.subscribe(f"shellies/{device.pushId}/emeter/+/+")
+            client.subscribe(f"{device.pushId}/status/+")
+
+    def _onMessage(self, client, userdata, message):
+        try:
+            parts = message.topic.split("/")
+            for device in self._devices:
+                if parts[:2] == ["shellies", device.pushId] and len(parts) == 5 and parts[4] in MQTT_GEN1_FIELDS:
+                    device.update(int(parts[3]), parts[4], float(message.payload))
+                    device.publish()
+                elif parts[:2] == [device.pushId, "status"] and len(parts) == 3:
+                    self._updateGen2(device, parts[2], json.loads(message.payload))
+                    device.publish()
+        except Exception as e:
+            logging.warning(f"MQTT message {message.topic} ignored: {str(e)}")
+
+    def _updateGen2(self, device, component, status):
+        kind, _, index = component.partition(":")
+        if kind == "em1data":
+            device.update(int(index), "total", status["total_act_energy"])
+            device.update(int(index), "total_returned", status["total_act_ret_energy"])
+        elif kind == "em1":
+            device.update(int(index), "voltage", status["voltage"])
+            device.update(int(index), "power", status["act_power"])
+        elif kind == "emdata":
+            for phase, prefix in enumerate("abc"):
+                device.update(phase, "total", status[f"{prefix}_total_act_energy"])
+                device.update(phase, "total_returned", status[f"{prefix}_total_act_ret_energy"])
+        elif kind == "em":
+            for phase, prefix in enumerate("abc"):
+                device.update(phase, "voltage", status[f"{prefix}_voltage"])
+                device.update(phase, "power", status[f"{prefix}_act_power"])
+
+
+# wrap the meters with the push slots and start the listener of config [SHELLY] Push, the meters are returned unchanged
+# for Push=off
+def startPush(config, gridMeter, balconyMeter, phases):
+    mode = config['SHELLY'].get('Push', fallback='off').lower()
+    if mode not in ('coiot', 'mqtt'):
+        return gridMeter, balconyMeter
+    maxAge = float(config['SHELLY'].get('PushMaxAge', fallback=10))
+    devices = [
+        PushDevice('grid', config['SHELLY'].get('GridPushId', fallback=''), config['SHELLY']['Host'], phases),
+        PushDevice('balcony', config['SHELLY'].get('BalconyPushId', fallback=''), config['SHELLY']['Balcony'], 1),
+    ]
+    if mode == 'coiot':
+        CoiotListener(devices, int(config['SHELLY'].get('CoiotPort', fallback=5683))).start()
+    else:
+        MqttListener(
+            [device for device in devices if device.pushId],
+            config['SHELLY'].get('MqttBroker', fallback='127.0.0.1'),
+            int(config['SHELLY'].get('MqttPort', fallback=1883)),
+            config['SHELLY'].get('MqttUsername', fallback=''),
+            config['SHELLY'].get('MqttPassword', fallback=''),
+        ).start()
+    return (PushedMeter(gridMeter, devices[0].slot, maxAge, 'grid'),
+            PushedMeter(balconyMeter, devices[1].slot, maxAge, 'balcony'))
@@ -0,0 +1,840 @@
+#!/usr/bin/env python
+'''closed loop plant simulator, runs the real services on a virtual clock with fake HTTP and DBUS layers'''
+
+# system imports:
+import argparse
+import configparser
+import heapq
+import importlib.util
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from urllib.parse import urlparse, parse_qs
+
+SIM_START = 1719792000.0           # 2024-07-01 00:00 UTC
+DAY = 24 * 3600
+AMBIENT_TEMPERATURE = 20.0     # [°C] ambient temperature of the HMs
+STATUS_CONNECT_ERROR = None        # handler result for a connection error
+PHASE_SHARES = {1: (1.0,), 3: (0.5, 0.3, 0.2)}  # household load per phase, plug in solar feeds in on L1
+
+
+# ============================================================================
+# Plant model: household load, HM inverters behind one DTU, battery, balcony plug in solar, Shellys
+# ============================================================================
+
+class VirtualClock:
+    '''Clock for time.time() and time.monotonic() of the simulated services.'''
+
+    def __init__(self, start):
+        self.now = start
+        self._start = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self._start + 1000.0
+
+
+class LoadProfile:
+    '''Household load with base load, daily peaks and random appliance steps.'''
+
+    def __init__(self, rnd, days, start):
+        self.steps = []  # (start, end, power) of the appliance events, the load steps for the metrics
+        for day in range(int(days) + 1):
+            dayStart = start + day * DAY
+            t = dayStart
+            while t < dayStart + DAY:
+                t += rnd.expovariate(3.0 / 3600)  # ~3 appliance events per hour
+                hour = ((t - dayStart) / 3600) % 24
+                if 6 <= hour <= 23:
+                    self.steps.append((t, t + rnd.uniform(60, 600), rnd.choice((300, 800, 1500, 2200))))
+        self.steps.sort()
+        self._index = 0
+        self._active = []
+        self._rnd = rnd
+
+    def power(self, t):
+        hour = (t % DAY) / 3600
+        base = 180.0
+        base += 300.0 * math.exp(-((hour - 7.5) ** 2) / 0.5)
+        base += 450.0 * math.exp(-((hour - 19.5) ** 2) / 3.0)
+        while self._index < len(self.steps) and self.steps[self._index][0] <= t:
+            self._active.append(self.steps[self._index])
+            self._index += 1
+        self._active = [step for step in self._active if step[1] > t]
+        return base + sum(step[2] for step in self._active) + self._rnd.gauss(0, 8)
+
+
+def _solar(t, peak, sunrise=5.5, sunset=21.0):
+    hour = (t % DAY) / 3600
+    if hour <= sunrise or hour >= sunset:
+        return 0.0
+    return peak * math.sin(math.pi * (hour - sunrise) / (sunset - sunrise)) ** 2
+
+
+class SimBattery:
+    '''LFP battery with SOC, voltage and charge/discharge current limits.'''
+
+    def __init__(self, capacityWh, soc):
+        self.capacityWh = capacityWh
+        self.energy = capacityWh * soc / 100
+        self.current = 0.0
+        self.temperature = 20.0
+
+    @property
+    def soc(self):
+        return 100.0 * self.energy / self.capacityWh
+
+    @property
+    def voltage(self):
+        return 50.0 + 5.5 * self.soc / 100
+
+    @property
+    def ccl(self):
+        return 5.0 if self.soc > 97 else 100.0
+
+    @property
+    def dcl(self):
+        return 0.0 if self.soc < 5 else 100.0
+
+    def step(self, dt, power):
+        # positive power charges the battery, limited by CCL
+        power = min(power, self.ccl * self.voltage)
+        self.energy = min(self.capacityWh, max(0.0, self.energy + power * dt / 3600))
+        self.current = power / self.voltage
+
+
+class SimInverter:
+    '''HM inverter with limit apply delay, ramp, temperature and DTU poll interval.'''
+
+    def __init__(self, rnd, serial, name, nominal, ambient=AMBIENT_TEMPERATURE):
+        self._rnd = rnd
+        self.serial = serial
+        self.name = name
+        self.nominal = nominal
+        self.limit = nominal          # [W] applied limit
+        self.pending = []             # (applyAt, limit) or (applyAt, "on"/"off")
+        self.on = True
+        self.ac = 0.0
+        self.dc = 0.0
+        self.ambient = ambient
+        self.temperature = ambient
+        self.peakTemperature = ambient
+        self.yieldTotal = 0.0         # [kWh]
+        self.gridVoltage = 0.0
+        self.report = None            # data of the last DTU poll
+        self.phase = 0
+        self.peakEfficiency = 0.955 - 0.01 * (int(serial) % 3)  # HMs differ a little
+        self.lastPoll = 0.0
+        self.nextPoll = 0.0
+
+    def command(self, t, value):
+        self.pending.append((t + self._rnd.uniform(4, 10), value))
+
+    def step(self, t, dt, gridOk, batteryOk):
+        while self.pending and self.pending[0][0] <= t:
+            _, value = self.pending.pop(0)
+            if value == "on":
+                self.on = True
+            elif value == "off":
+                self.on = False
+            else:
+                self.limit = max(0.0, min(self.nominal, value))
+        self.gridVoltage = 230.0 if gridOk else 0.0
+        target = min(self.limit, self.nominal) if (self.on and gridOk and batteryOk) else 0.0
+        if target > self.ac:
+            self.ac = min(target, self.ac + 0.1 * self.nominal * dt)  # 10 % nominal per second
+        else:
+            self.ac = max(target, self.ac - 0.5 * self.nominal * dt)
+        load = self.ac / self.nominal
+        efficiency = self.peakEfficiency - 0.12 * (1 - load) ** 4 if self.ac > 0 else 1.0
+        self.dc = self.ac / efficiency
+        # first order thermal model, full power is 25 degree above ambient
+        self.temperature += (self.ambient + 25.0 * load - self.temperature) * dt / 600
+        self.peakTemperature = max(self.peakTemperature, self.temperature)
+        self.yieldTotal += self.ac * dt / 3600000
+        if t >= self.nextPoll:
+            self.lastPoll = t
+            self.nextPoll = t + 5.0
+            self.report = (self.ac, self.dc, self.temperature, self.yieldTotal, self.limit, self.gridVoltage, batteryOk)
+
+    def livedata(self, t, batteryVoltage):
+        ac, dc, temperature, yieldTotal, limit, gridVoltage, reachable = self.report
+        def _v(value, unit, digits=1):
+            return {"v": round(value, digits), "u": unit, "d": digits}
+        return {
+            "serial": self.serial,
+            "name": self.name,
+            "data_age": int(t - self.lastPoll),
+            "reachable": reachable,
+            "producing": ac > 0,
+            "limit_relative": round(100 * limit / self.nominal, 1),
+            "limit_absolute": round(limit, 1),
+            "AC": {"0": {
+                "Power": _v(ac, "W"),
+                "Voltage": _v(gridVoltage, "V"),
+                "Current": _v(ac / 230.0, "A", 2),
+                "YieldTotal": _v(yieldTotal, "kWh", 3),
+            }},
+            "DC": {"0": {
+                "Power": _v(dc, "W"),
+                "Voltage": _v(batteryVoltage, "V"),
+                "Current": _v(dc / batteryVoltage, "A", 2),
+            }},
+            "INV": {"0": {"Temperature": _v(temperature, "°C")}},
+        }
+
+
+class SimPlant:
+    '''Complete plant with HTTP handler for the DTU and the Shellys, used by the simulator and the stand-in servers.'''
+
+    def __init__(self, clock, seed=1, days=7, inverters=3, dt=1.0, pvPeak=3500.0, balconyPeak=600.0, soc=50.0,
+                 phases=1, ambient=AMBIENT_TEMPERATURE):
+        self.clock = clock
+        self.dt = dt
+        self._rnd = random.Random(seed)
+        self.load = LoadProfile(self._rnd, days, clock.now)
+        nominals = (400, 300, 800)
+        self.inverters = [
+            SimInverter(self._rnd, f"1141{number:08d}", f"HM{number}", nominals[number % len(nominals)], ambient)
+            for number in range(inverters)
+        ]
+        self.phaseShares = PHASE_SHARES[phases]
+        for number, inverter in enumerate(self.inverters):
+            inverter.phase = number % phases
+        self.battery = SimBattery(10000.0, soc)
+        self.pvPeak = pvPeak
+        self.balconyPeak = balconyPeak
+        self.relayUntil = 0.0
+        self.dtuDownUntil = 0.0
+        self.grid = 0.0
+        self.phaseGrid = [0.0] * phases
+        self.balcony = 0.0
+        self.gridTotal = [0.0] * phases     # [Wh] Shelly EM counters per phase
+        self.gridReturned = [0.0] * phases
+        self._time = clock.now
+        self.metrics = SimMetrics()
+        self.hosts = {}               # host -> "dtu", "grid", "balcony"
+        self.shellyGen = 1            # generation of both Shellys: 1 /emeter/<n>, 2 RPC with EM (3 phases) or EM1
+        self._lock = threading.RLock()  # the stand-in servers call the plant from several threads
+        for inverter in self.inverters:
+            inverter.step(self._time, 0.0, False, True)
+
+    # advance the plant in dt steps to the actual clock time
+    def advance(self):
+        with self._lock:
+            while self._time + self.dt <= self.clock.now:
+                self._time += self.dt
+                self._step(self._time, self.dt)
+
+    def _step(self, t, dt):
+        relayOn = t < self.relayUntil
+        batteryOk = self.battery.dcl > 0
+        hmAc = 0.0
+        hmDc = 0.0
+        load = self.load.power(t)
+        self.balcony = _solar(t, self.balconyPeak)
+        phaseGrid = [load * share for share in self.phaseShares]
+        phaseGrid[0] -= self.balcony
+        for inverter in self.inverters:
+            inverter.step(t, dt, relayOn, batteryOk)
+            hmAc += inverter.ac
+            hmDc += inverter.dc
+            phaseGrid[inverter.phase] -= inverter.ac
+        self.battery.step(dt, _solar(t, self.pvPeak) - hmDc)
+        self.phaseGrid = phaseGrid
+        self.grid = sum(phaseGrid)
+        for phase, power in enumerate(phaseGrid):
+            if power > 0:
+                self.gridTotal[phase] += power * dt / 3600
+            else:
+                self.gridReturned[phase] -= power * dt / 3600
+        self.metrics.sample(t, dt, self.grid, hmAc, hmDc, phaseGrid)
+
+    # HTTP handler, returns (status, payload), status None for a connection error
+    # role is given by the stand-in servers, otherwise it is taken from the host of the URL
+    def handle(self, method, url, data=None, role=None):
+        with self._lock:
+            return self._handle(method, url, data, role)
+
+    def _handle(self, method, url, data, role):
+        self.advance()
+        parsed = urlparse(url)
+        # the role by host name, the stand-in servers pass it
+        if role is None:
+            role = next((role for host, role in self.hosts.items() if (parsed.hostname or "").endswith(host)), None)
+        query = parse_qs(parsed.query)
+        t = self.clock.now
+        if role == "dtu":
+            if t < self.dtuDownUntil:
+                return STATUS_CONNECT_ERROR, None
+            return self._handleDtu(t, method, parsed.path, data)
+        if role in ("grid", "balcony"):
+            return self._handleShelly(t, role, parsed.path, query)
+        return 404, None
+
+    def _handleDtu(self, t, method, path, data):
+        if path == "/api/livedata/status":
+            return 200, {"inverters": [inverter.livedata(t, self.battery.voltage) for inverter in self.inverters]}
+        if path == "/api/limit/status":
+            return 200, {inverter.serial: {"max_power": inverter.nominal, "limit_set_status": "Ok"}
+                         for inverter in self.inverters}
+        if method != "POST":
+            return 404, None
+        request = json.loads(data[len("data="):]) if data else {}
+        if path == "/api/maintenance/reboot":
+            self.dtuDownUntil = t + 20.0
+            self.metrics.resets += 1
+            return 200, {"type": "success"}
+        inverter = next((inv for inv in self.inverters if inv.serial == request.get("serial")), None)
+        if not inverter:
+            return 400, {"type": "warning"}
+        if path == "/api/limit/config":
+            value = float(request["limit_value"])
+            limit = value if int(request["limit_type"]) in (0, 256) else value * inverter.nominal / 100
+            inverter.command(t, limit)
+            self.metrics.push(t, inverter.serial, limit)
+            return 200, {"type": "success"}
+        if path == "/api/power/config":
+            if request.get("restart"):
+                inverter.command(t, "off")
+                inverter.command(t + 10.0, "on")
+            else:
+                inverter.command(t, "on" if int(request["power"]) else "off")
+            self.metrics.switches += 1
+            return 200, {"type": "success"}
+        return 404, None
+
+    def _emeter(self, power, total=0.0, returned=0.0):
+        return {"power": round(power, 2), "reactive": 0.0, "voltage": 230.0, "is_valid": True,
+                "total": round(total, 1), "total_returned": round(returned, 1)}
+
+    def _emeters(self, role):
+        if role == "grid":
+            return [self._emeter(*values) for values in zip(self.phaseGrid, self.gridTotal, self.gridReturned)]
+        return [self._emeter(self.balcony)]
+
+    # Gen1 emeters of the grid or balcony Shelly at the actual clock time, e.g. for pushes
+    def emeters(self, role):
+        with self._lock:
+            self.advance()
+            return self._emeters(role)
+
+    def _handleShelly(self, t, role, path, query):
+        if path.startswith("/relay/0"):
+            if query.get("turn") == ["on"]:
+                self.relayUntil = t + float(query.get("timer", ["900"])[0])
+            elif query.get("turn") == ["off"]:
+                self.relayUntil = t
+            return 200, {"ison": t < self.relayUntil}
+        emeters = self._emeters(role)
+        if self.shellyGen == 1:
+            if path == "/shelly":
+                return 200, {"type": "SHEM-3" if len(emeters) == 3 else "SHEM", "auth": False, "num_emeters": len(emeters)}
+            if path == "/status":
+                return 200, {"emeters": emeters, "relays": [{"ison": t < self.relayUntil}]}
+            if path.startswith("/emeter/") and path[len("/emeter/"):].isdigit():
+                index = int(path[len("/emeter/"):])
+                return (200, emeters[index]) if index < len(emeters) else (404, None)
+            return 404, None
+        return self._handleShellyRpc(path, query, emeters)
+
+    def _handleShellyRpc(self, path, query, emeters):
+        # Pro 3EM with the EM component for three phases, Pro EM with EM1 per channel
+        component = "EM" if len(emeters) == 3 else "EM1"
+        index = int(query.get("id", ["0"])[0])
+        if path == "/shelly":
+            return 200, {"gen": self.shellyGen, "app": "Pro3EM" if component == "EM" else "ProEM", "auth_en": False}
+        if path == f"/rpc/{component}.GetStatus" and component == "EM" and index == 0:
+            status = {"id": 0, "total_act_power": round(sum(emeter["power"] for emeter in emeters), 2)}
+            for prefix, emeter in zip("abc", emeters):
+                status.update({f"{prefix}_voltage": emeter["voltage"], f"{prefix}_act_power": emeter["power"]})
+            return 200, status
+        if path == f"/rpc/{component}Data.GetStatus" and component == "EM" and index == 0:
+            data = {"id": 0}
+            for prefix, emeter in zip("abc", emeters):
+                data.update({f"{prefix}_total_act_energy": emeter["total"],
+                             f"{prefix}_total_act_ret_energy": emeter["total_returned"]})
+            return 200, data
+        if component == "EM1" and index < len(emeters):
+            emeter = emeters[index]
+            if path == "/rpc/EM1.GetStatus":
+                return 200, {"id": index, "voltage": emeter["voltage"], "act_power": emeter["power"]}
+            if path == "/rpc/EM1Data.GetStatus":
+                return 200, {"id": index, "total_act_energy": emeter["total"],
+                             "total_act_ret_energy": emeter["total_returned"]}
+        # unknown component or id, answered by the Shelly with an error code
+        return 404, {"code": -105, "message": f"Argument 'id', value {index} not found!"}
+
+
+class SimMetrics:
+    '''Control quality: energy, settling time after load steps, oscillations and pushes.'''
+
+    SETTLE_BAND = 50.0   # [W] around the grid target
+    SETTLE_MAX = 600.0   # [s] steps not settled within this time are counted as unsettled
+
+    def __init__(self):
+        self.importWh = 0.0
+        self.exportWh = 0.0
+        self.phaseExportWh = 0.0  # feed in summed per phase, differs from exportWh with more than one phase
+        self.hmWh = 0.0
+        self.dcWh = 0.0
+        self.seconds = 0.0
+        self.pushes = 0
+        self.switches = 0
+        self.resets = 0
+        self.oscillations = 0
+        self.settleTimes = []
+        self.unsettled = 0
+        self.target = 25.0
+        self._futureSteps = []
+        self._openSteps = []
+        self._lastPush = {}   # serial -> (time, limit, direction)
+        self.pushesBySerial = {}
+
+    def setSteps(self, stepTimes):
+        self._futureSteps = sorted(stepTimes, reverse=True)
+
+    def sample(self, t, dt, grid, hmAc, hmDc, phaseGrid):
+        self.seconds += dt
+        if grid > 0:
+            self.importWh += grid * dt / 3600
+        else:
+            self.exportWh -= grid * dt / 3600
+        self.phaseExportWh -= sum(min(0.0, power) for power in phaseGrid) * dt / 3600
+        self.hmWh += hmAc * dt / 3600
+        self.dcWh += hmDc * dt / 3600
+        while self._futureSteps and self._futureSteps[-1] <= t:
+            self._openSteps.append(self._futureSteps.pop())
+        if self._openSteps:
+            settled = abs(grid - self.target) <= self.SETTLE_BAND
+            remaining = []
+            for stepTime in self._openSteps:
+                if settled:
+                    self.settleTimes.append(t - stepTime)
+                elif t - stepTime > self.SETTLE_MAX:
+                    self.unsettled += 1
+                else:
+                    remaining.append(stepTime)
+            self._openSteps = remaining
+
+    def push(self, t, serial, limit):
+        self.pushes += 1
+        self.pushesBySerial[serial] = self.pushesBySerial.get(serial, 0) + 1
+        last = self._lastPush.get(serial)
+        direction = 0
+        if last:
+            direction = (limit > last[1]) - (limit < last[1])
+            # reversal of the limit direction within a minute counts as oscillation
+            if direction and last[2] and direction != last[2] and (t - last[0]) < 60:
+                self.oscillations += 1
+        self._lastPush[serial] = (t, limit, direction or (last[2] if last else 0))
+
+    def result(self):
+        hours = max(self.seconds / 3600, 1e-9)
+        settle = sorted(self.settleTimes)
+        return {
+            "hours": round(hours, 2),
+            "import_kwh": round(self.importWh / 1000, 3),
+            "export_kwh": round(self.exportWh / 1000, 3),
+            "phase_export_kwh": round(self.phaseExportWh / 1000, 3),
+            "hm_kwh": round(self.hmWh / 1000, 3),
+            "dc_kwh": round(self.dcWh / 1000, 3),
+            "settle_mean_s": round(sum(settle) / len(settle), 1) if settle else 0.0,
+            "settle_p90_s": round(settle[int(0.9 * (len(settle) - 1))], 1) if settle else 0.0,
+            "unsettled_steps": self.unsettled,
+            "oscillations": self.oscillations,
+            "pushes_per_hour": round(self.pushes / hours, 2),
+            "switches": self.switches,
+            "resets": self.resets,
+        }
+
+
+# ============================================================================
+# Fake layers: GLib timers on the virtual clock, requests, dbus, vedbus and dbusmonitor
+# ============================================================================
+
+class TimerLoop:
+    '''GLib timeout sources on the virtual clock.'''
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._queue = []
+        self._ids = itertools.count(1)
+        self._removed = set()
+
+    def add(self, interval, callback):
+        sourceId = next(self._ids)
+        heapq.heappush(self._queue, (self._clock.now + interval, sourceId, interval, callback))
+        return sourceId
+
+    def remove(self, sourceId):
+        self._removed.add(sourceId)
+        return True
+
+    def nextDue(self):
+        while self._queue and self._queue[0][1] in self._removed:
+            self._removed.discard(heapq.heappop(self._queue)[1])
+        return self._queue[0][0] if self._queue else math.inf
+
+    def runDue(self):
+        while self.nextDue() <= self._clock.now:
+            _, sourceId, interval, callback = heapq.heappop(self._queue)
+            if callback():
+                heapq.heappush(self._queue, (self._clock.now + interval, sourceId, interval, callback))
+
+
+class FakeResponse:
+    def __init__(self, requestsModule, status, payload, url):
+        self._requests = requestsModule
+        self.status_code = status
+        self._payload = payload
+        self.url = url
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def json(self):
+        if self._payload is None:
+            raise ValueError("no JSON")
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise self._requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+    def close(self):
+        pass
+
+
+def _make_requests(plant):
+    module = types.ModuleType("requests")
+
+    class RequestException(IOError):
+        def __init__(self, *args, response=None):
+            super().__init__(*args)
+            self.response = response
+
+    class HTTPError(RequestException):
+        pass
+
+    class ConnectionError(RequestException):  # pylint: disable=W0622
+        pass
+
+    class Timeout(RequestException):
+        pass
+
+    class ConnectTimeout(ConnectionError, Timeout):
+        pass
+
+    class ReadTimeout(Timeout):
+        pass
+
+    def _request(method, url, data=None):
+        status, payload = plant.handle(method, url, data)
+        if status is STATUS_CONNECT_ERROR:
+            raise ConnectionError(f"connection refused: {url}")
+        return FakeResponse(module, status, payload, url)
+
+    class Session:
+        def __init__(self):
+            self.auth = None
+
+        def get(self, url, timeout=None, **kwargs):
+            return _request("GET", url)
+
+        def post(self, url, data=None, headers=None, timeout=None, **kwargs):
+            return _request("POST", url, data)
+
+        def close(self):
+            pass
+
+    module.RequestException = RequestException
+    module.HTTPError = HTTPError
+    module.ConnectionError = ConnectionError
+    module.Timeout = Timeout
+    module.ConnectTimeout = ConnectTimeout
+    module.ReadTimeout = ReadTimeout
+    module.Session = Session
+    module.get = lambda url, timeout=None, **kwargs: _request("GET", url)
+    module.exceptions = module
+    auth = types.ModuleType("requests.auth")
+    auth.HTTPBasicAuth = lambda username, password: (username, password)
+    auth.HTTPDigestAuth = lambda username, password: (username, password)
+    module.auth = auth
+    return module, auth
+
+
+class FakeVeDbusService:
+    '''Dictionary based VeDbusService, the services are collected by name to read them after the run.'''
+
+    services = {}
+
+    def __init__(self, servicename, bus=None, register=True):
+        self.servicename = servicename
+        self._dbusobjects = {}
+        self._callbacks = {}
+        FakeVeDbusService.services[servicename] = self
+
+    def add_mandatory_paths(self, *args, **kwargs):
+        pass
+
+    def add_path(self, path, value, description="", writeable=False, onchangecallback=None,
+                 gettextcallback=None, valuetype=None):
+        self._dbusobjects[path] = value
+        self._callbacks[path] = onchangecallback
+
+    def __getitem__(self, path):
+        return self._dbusobjects[path]
+
+    def __setitem__(self, path, value):
+        self._dbusobjects[path] = value
+
+    def __contains__(self, path):
+        return path in self._dbusobjects
+
+    # external write like dbus SetValue
+    def setValue(self, path, value):
+        callback = self._callbacks.get(path)
+        if callback and not callback(path, value):
+            return False
+        self._dbusobjects[path] = value
+        return True
+
+
+def _make_dbusmonitor(plant):
+    module = types.ModuleType("dbusmonitor")
+
+    class DbusMonitor:
+        def __init__(self, tree, *args, **kwargs):
+            self._tree = tree
+
+        def get_service_list(self, classname=None):
+            if classname == "com.victronenergy.battery":
+                return {"com.victronenergy.battery.sim": 512}
+            if classname == "com.victronenergy.vebus":
+                return {"com.victronenergy.vebus.sim": 276}
+            return {}
+
+        def get_value(self, servicename, path, default=None):
+            plant.advance()
+            battery = plant.battery
+            values = {
+                "/Soc": int(battery.soc),
+                "/Dc/0/Current": battery.current,
+                "/Info/MaxChargeCurrent": battery.ccl,
+                "/Info/MaxDischargeCurrent": battery.dcl,
+                "/Dc/0/Temperature": battery.temperature,
+                "/Dc/0/Voltage": battery.voltage,
+                "/State": 0,
+                "/Ac/Out/L1/P": 0,
+            }
+            return values.get(path, default)
+
+    module.DbusMonitor = DbusMonitor
+    return module
+
+
+def install_fakes(clock, plant, configOverrides, fakeHttp=True):
+    '''Replace the DBUS and GLib layers and for the virtual clock also HTTP and time for the services of this process.'''
+    loop = TimerLoop(clock)
+    simulator = {"run": None}
+
+    glib = types.SimpleNamespace(
+        timeout_add_seconds=lambda interval, callback, *args: loop.add(float(interval), callback),
+        timeout_add=lambda interval, callback, *args: loop.add(interval / 1000.0, callback),
+        source_remove=loop.remove,
+        MainLoop=lambda: types.SimpleNamespace(run=lambda: simulator["run"](), quit=lambda: None),
+    )
+    gi = types.ModuleType("gi")
+    repository = types.ModuleType("gi.repository")
+    repository.GLib = glib
+    gi.repository = repository
+
+    dbus = types.ModuleType("dbus")
+    dbus.SessionBus = lambda *args, **kwargs: None
+    dbus.SystemBus = lambda *args, **kwargs: None
+    mainloop = types.ModuleType("dbus.mainloop")
+    mainloopGlib = types.ModuleType("dbus.mainloop.glib")
+    mainloopGlib.DBusGMainLoop = lambda *args, **kwargs: None
+    dbus.mainloop = mainloop
+    mainloop.glib = mainloopGlib
+    dbusService = types.ModuleType("dbus.service")
+    dbusService.Object = type("Object", (), {"__init__": lambda self, *args, **kwargs: None})
+    dbusService.method = lambda *args, **kwargs: (lambda function: function)
+    dbus.service = dbusService
+
+    vedbus = types.ModuleType("vedbus")
+    vedbus.VeDbusService = FakeVeDbusService
+    vedbus.VeDbusItemImport = object
+
+    sys.modules.update({
+        "gi": gi, "gi.repository": repository,
+        "dbus": dbus, "dbus.mainloop": mainloop, "dbus.mainloop.glib": mainloopGlib, "dbus.service": dbusService,
+        "vedbus": vedbus, "dbusmonitor": _make_dbusmonitor(plant),
+    })
+    if fakeHttp:
+        requestsModule, requestsAuth = _make_requests(plant)
+        sys.modules.update({"requests": requestsModule, "requests.auth": requestsAuth})
+    if isinstance(clock, VirtualClock):
+        time.time = clock.time
+        time.monotonic = clock.monotonic
+
+    # config.ini of the services with the simulator overrides
+    readConfig = configparser.ConfigParser.read
+
+    def _read(self, filenames, encoding=None):
+        result = readConfig(self, filenames, encoding)
+        for section, values in configOverrides.items():
+            for key, value in values.items():
+                self[section][key] = str(value)
+        return result
+    configparser.ConfigParser.read = _read
+    return loop, simulator
+
+
+# ============================================================================
+# Simulation run and benchmark
+# ============================================================================
+
+def load_services(directory):
+    '''Load dbus-opendtu.py after install_fakes, the checkpoint is written to a temporary directory.'''
+    logging.basicConfig(level=logging.CRITICAL, handlers=[logging.StreamHandler()])
+    spec = importlib.util.spec_from_file_location("dbus_opendtu", f"{directory}/dbus-opendtu.py")
+    main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(main)
+    # keep the checkpoint of a real installation untouched
+    import dbus_shelly_service  # pylint: disable=C0415 - after install_fakes
+    import checkpoint  # pylint: disable=C0415
+    checkpointFile = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+    dbus_shelly_service.Checkpoint = lambda filename, interval: checkpoint.Checkpoint(checkpointFile, interval)
+    return main
+
+
+def run(days, seed, dt=1.0, inverters=3, overrides=None, phases=1, shellyGen=1, ambient=AMBIENT_TEMPERATURE):
+    '''Simulate days on the virtual clock, return the control quality metrics.'''
+    clock = VirtualClock(SIM_START)
+    directory = os.path.dirname(os.path.realpath(__file__))
+    config = configparser.ConfigParser()
+    config.read(f"{directory}/config.ini")
+    plant = SimPlant(clock, seed=seed, days=days, inverters=inverters, dt=dt, phases=phases, ambient=ambient)
+    plant.shellyGen = shellyGen
+    plant.hosts = {
+        config["DEFAULT"]["Host"]: "dtu",
+        config["SHELLY"]["Host"]: "grid",
+        config["SHELLY"]["Balcony"]: "balcony",
+    }
+    plant.metrics.target = float(config["DEFAULT"]["ZeroPoint"])
+    plant.metrics.setSteps([stepTime for step in plant.load.steps for stepTime in step[:2]])
+    configOverrides = {"DEFAULT": {"ringLogRows": 0, "Logging": "CRITICAL"}, "SHELLY": {"Phases": phases}}
+    for number, inverter in enumerate(plant.inverters[:3]):
+        configOverrides[f"INVERTER{number}"] = {"Phase": f"L{inverter.phase + 1}"}
+    for key, value in (overrides or {}).items():
+        section, _, option = key.rpartition(".")
+        configOverrides.setdefault(section or "DEFAULT", {})[option] = value
+    loop, simulator = install_fakes(clock, plant, configOverrides)
+    main = load_services(directory)
+
+    end = clock.now + days * DAY
+    # derating: lowest /DeratedPower and seconds below MaxPercent of the nominal power per inverter
+    maxPercent = float(configOverrides["DEFAULT"].get("MaxPercent", config["DEFAULT"]["MaxPercent"]))
+    deratedMin = [0] * len(plant.inverters)
+    deratedSeconds = [0.0] * len(plant.inverters)
+    # efficiency preference: battery energy saved, /Efficiency/SavedToday summed over the days
+    savings = {"today": 0.0, "total": 0.0}
+
+    def _sample(seconds):
+        for service in FakeVeDbusService.services.values():
+            if "/Efficiency/SavedToday" in service:
+                savedToday = service["/Efficiency/SavedToday"]
+                savings["total"] += savedToday - savings["today"] if savedToday >= savings["today"] else savedToday
+                savings["today"] = savedToday
+        dtuServices = [service for service in FakeVeDbusService.services.values() if "/DeratedPower" in service]
+        for number, (service, inverter) in enumerate(zip(dtuServices, plant.inverters)):
+            derated = service["/DeratedPower"]
+            if 0 < derated < inverter.nominal * maxPercent / 100 - 1:
+                deratedMin[number] = min(deratedMin[number] or derated, derated)
+                deratedSeconds[number] += seconds
+
+    def _run():
+        while clock.now < end:
+            last = clock.now
+            clock.now = min(loop.nextDue(), end, clock.now + 60.0)
+            plant.advance()
+            loop.runDue()
+            _sample(clock.now - last)
+    simulator["run"] = _run
+
+    started = time.process_time()
+    main.main()
+    result = plant.metrics.result()
+    # wear levelling: full load hours and peak temperature per inverter
+    result["full_load_hours"] = [round(inverter.yieldTotal * 1000 / inverter.nominal, 2) for inverter in plant.inverters]
+    result["peak_temperature"] = [round(inverter.peakTemperature, 1) for inverter in plant.inverters]
+    # capped limits and where the demand went: the other HMs (AC energy per HM) or the grid (import_kwh)
+    result["derated_min_w"] = deratedMin
+    result["derated_hours"] = [round(seconds / 3600, 2) for seconds in deratedSeconds]
+    result["hm_kwh_per_inverter"] = [round(inverter.yieldTotal, 3) for inverter in plant.inverters]
+    # the first HM of the control order takes most of the limit changes
+    result["pushes_per_inverter"] = [plant.metrics.pushesBySerial.get(inverter.serial, 0) for inverter in plant.inverters]
+    result["efficiency_saved_wh"] = round(savings["total"], 1)
+    result["cpu_s"] = round(time.process_time() - started, 1)
+    return result
+
+
+# lower is better for all compared metrics
+BENCHMARK_METRICS = ("import_kwh", "export_kwh", "settle_mean_s", "settle_p90_s", "unsettled_steps",
+                     "oscillations", "pushes_per_hour", "switches", "resets")
+
+
+def compare(result, baseline, tolerance):
+    '''Return the list of metrics worse than the baseline by more than tolerance (relative).'''
+    regressions = []
+    for name in BENCHMARK_METRICS:
+        if name in baseline and result[name] > baseline[name] * (1 + tolerance) + 0.01:
+            regressions.append(f"{name}: {result[name]} > {baseline[name]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=1.0, help="plant step in seconds")
+    parser.add_argument("--inverters", type=int, default=3)
+    parser.add_argument("--phases", type=int, default=1, choices=sorted(PHASE_SHARES))
+    parser.add_argument("--shelly-gen", type=int, default=1, choices=(1, 2), help="Shelly generation of the meters")
+    parser.add_argument("--ambient", type=float, default=AMBIENT_TEMPERATURE,
+                        help="ambient temperature of the HMs in °C, e.g. 35 for a hot attic")
+    parser.add_argument("--set", action="append", default=[], metavar="[SECTION.]KEY=VALUE",
+                        help="override a config.ini value, e.g. --set limitType=relative")
+    parser.add_argument("--baseline", help="JSON file with the metrics of the reference run")
+    parser.add_argument("--update-baseline", action="store_true", help="write the result to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args()
+
+    overrides = dict(item.split("=", 1) for item in args.set)
+    result = run(args.days, args.seed, args.dt, args.inverters, overrides, args.phases, args.shelly_gen, args.ambient)
+    print(json.dumps(result, indent=2))
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baselineFile:
+            json.dump(result, baselineFile, indent=2)
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baselineFile:
+            regressions = compare(result, json.load(baselineFile), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+'''print the state snapshot of the running dbus-opendtu service, one DBUS call instead of one GetValue per path'''
+
+# system imports:
+import argparse
+import configparser
+import json
+import os
+import sys
+import time
+
+# victron imports:
+import dbus
+import dbus.service
+
+SNAPSHOT_PATH = "/Snapshot"
+SNAPSHOT_INTERFACE = "com.victronenergy.opendtu.Snapshot"
+SERVICENAME = "com.victronenergy.acload"
+
+
+# SnapshotExport class for the DBUS method GetSnapshot at /Snapshot of the Shelly service.
+# DBUS calls are dispatched by the GLib loop between two cycles, the snapshot is consistent without locking. It is
+# built on the first call after a cycle and kept as JSON string until the next cycle, more callers cost no extra work.
+class SnapshotExport(dbus.service.Object):
+
+    def __init__(self, bus, getSnapshot, getCycle):
+        super().__init__(bus, SNAPSHOT_PATH)
+        self._getSnapshot = getSnapshot
+        self._getCycle = getCycle
+        self._cycle = None
+        self._snapshot = None
+
+    # dbus -y com.victronenergy.acload.http_59 /Snapshot GetSnapshot
+    @dbus.service.method(SNAPSHOT_INTERFACE, in_signature="", out_signature="s")
+    def GetSnapshot(self):  # pylint: disable=C0103 - DBUS method name
+        cycle = self._getCycle()
+        if cycle != self._cycle or self._snapshot is None:
+            # dbus types are subclasses of int, float, str and list, others are written as string
+            self._snapshot = json.dumps(self._getSnapshot(), default=str)
+            self._cycle = cycle
+        return self._snapshot
+
+
+def _getServiceName():
+    config = configparser.ConfigParser()
+    config.read(f"{(os.path.dirname(os.path.realpath(__file__)))}/config.ini")
+    return "{}.http_{:02d}".format(SERVICENAME, int(config['SHELLY']['Deviceinstance']))
+
+
+def _printValues(values, filterText):
+    for path, value in sorted(values.items()):
+        if filterText and filterText.lower() not in path.lower():
+            continue
+        print(f"  {path:<32} {value}")
+
+
+def _print(snapshot, filterText):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["time"]))
+    print(f"cycle {snapshot['cycle']} at {stamp}")
+    controller = snapshot["controller"]
+    print(f"\n[controller] {controller['service']}")
+    for name in ("power", "gridPower", "phasePower", "plugInSolarPower", "order"):
+        print(f"  {name:<32} {controller[name]}")
+    _printValues(controller["values"], filterText)
+    for inverter in snapshot["inverters"]:
+        print(f"\n[inverter {inverter['number']}] {inverter['name']} ({inverter['serial']}) {inverter['service']}")
+        print(f"  {'state':<32} {inverter['state']}")
+        print(f"  {'fresh':<32} {inverter['fresh']}")
+        print(f"  {'nominalPower':<32} {inverter['nominalPower']}")
+        _printValues(inverter["values"], filterText)
+    for service in snapshot["services"]:
+        print(f"\n[service] {service['service']}")
+        _printValues(service["values"], filterText)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--service", default=None, help="DBUS service name, default from [SHELLY] of config.ini")
+    parser.add_argument("--filter", default="", help="print only paths containing this text")
+    parser.add_argument("--json", action="store_true", help="print the raw snapshot as JSON")
+    args = parser.parse_args()
+
+    bus = dbus.SessionBus() if "DBUS_SESSION_BUS_ADDRESS" in os.environ else dbus.SystemBus()
+    remote = bus.get_object(args.service or _getServiceName(), SNAPSHOT_PATH)
+    snapshot = json.loads(remote.GetSnapshot(dbus_interface=SNAPSHOT_INTERFACE))
+    if args.json:
+        print(json.dumps(snapshot, indent=2))
+    else:
+        _print(snapshot, args.filter)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+'''local OpenDTU and Shelly stand-in servers with fault injection, backed by the plant model of simulator.py'''
+
+# system imports:
+import argparse
+import configparser
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# our imports:
+from simulator import FakeVeDbusService, SimPlant, install_fakes, load_services
+
+ROLES = ("dtu", "grid", "balcony")   # one server per role on port, port + 1 and port + 2
+PUSH_IDS = {"grid": "shellyem-0000A1", "balcony": "shellyem-0000B2"}  # push ids of the Shellys, MAC part for CoIoT
+
+
+class WallClock:
+    '''Real time clock for the plant and the timers, the stand-ins run against real HTTP clients.'''
+
+    @property
+    def now(self):
+        return time.time()
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+class Faults:
+    '''Fault injection, the rates are probabilities per request.'''
+
+    def __init__(self, seed=1, latency=0.0, jitter=0.0, timeoutRate=0.0, timeoutDelay=5.0, errorRate=0.0,
+                 errorCode=500, truncateRate=0.0, staleRate=0.0, staleAge=120):
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.latency = latency            # [s] added to each response
+        self.jitter = jitter              # [s] uniform random part of the latency
+        self.timeoutRate = timeoutRate    # no response, connection closed after timeoutDelay
+        self.timeoutDelay = timeoutDelay  # [s] longer than HTTPTimeout of config.ini
+        self.errorRate = errorRate        # HTTP status errorCode instead of the data
+        self.errorCode = errorCode
+        self.truncateRate = truncateRate  # JSON body cut in half
+        self.staleRate = staleRate        # per inverter, data_age increased by staleAge
+        self.staleAge = staleAge          # [s]
+
+    def random(self):
+        with self._lock:
+            return self._rnd.random()
+
+    def delay(self):
+        with self._lock:
+            return self.latency + self._rnd.uniform(0, self.jitter)
+
+
+class ServerStats:
+    '''Request and fault counters of one stand-in server.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "timeout": 0, "error": 0, "truncated": 0, "stale": 0}
+        self.durations = []   # [ms] time in the handler without the injected delays
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def duration(self, ms):
+        with self._lock:
+            self.durations.append(ms)
+
+    def result(self):
+        with self._lock:
+            durations = sorted(self.durations)
+            result = dict(self.counters)
+        result["handler_mean_ms"] = round(sum(durations) / len(durations), 2) if durations else 0.0
+        result["handler_max_ms"] = round(durations[-1], 2) if durations else 0.0
+        return result
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''OpenDTU or Shelly Gen1/Gen2 HTTP API, depending on the role of the server.'''
+
+    protocol_version = "HTTP/1.1"   # keep alive like the real devices, the services use sessions
+
+    def do_GET(self):  # pylint: disable=C0103 - name given by BaseHTTPRequestHandler
+        self._respond("GET", None)
+
+    def do_POST(self):  # pylint: disable=C0103
+        length = int(self.headers.get("Content-Length", 0))
+        self._respond("POST", self.rfile.read(length).decode("utf-8") if length else None)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622 - signature of BaseHTTPRequestHandler
+        logging.debug(f"{self.server.role}: {format % args}")
+
+    def _respond(self, method, data):
+        server = self.server
+        faults = server.faults
+        server.stats.count("requests")
+        time.sleep(faults.delay())
+        if faults.random() < faults.timeoutRate:
+            server.stats.count("timeout")
+            time.sleep(faults.timeoutDelay)
+            self.close_connection = True
+            return
+        if faults.random() < faults.errorRate:
+            server.stats.count("error")
+            self._send(faults.errorCode, b"")
+            return
+        started = time.monotonic()
+        status, payload = server.plant.handle(method, f"http://{self.headers.get('Host')}{self.path}", data, server.role)
+        if status is None:
+            # DTU rebooting, behave like an unreachable host
+            self.close_connection = True
+            return
+        if payload and "inverters" in payload:
+            for inverter in payload["inverters"]:
+                if faults.random() < faults.staleRate:
+                    server.stats.count("stale")
+                    inverter["data_age"] += faults.staleAge
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        if body and faults.random() < faults.truncateRate:
+            server.stats.count("truncated")
+            body = body[:len(body) // 2]
+        server.stats.duration((time.monotonic() - started) * 1000)
+        self._send(status, body)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, role, plant, faults):
+        self.role = role
+        self.plant = plant
+        self.faults = faults
+        self.stats = ServerStats()
+        super().__init__(address, StandInHandler)
+
+
+def serve(plant, faults, bind, port):
+    '''Start the DTU, grid Shelly and balcony Shelly servers in background threads, return them by role.'''
+    servers = {}
+    for offset, role in enumerate(ROLES):
+        server = StandInServer((bind, port + offset), role, plant, faults)
+        threading.Thread(target=server.serve_forever, name=f"standin-{role}", daemon=True).start()
+        servers[role] = server
+        logging.info(f"{role} stand-in at http://{bind}:{port + offset}")
+    return servers
+
+
+def coiot_packet(deviceId, emeters, messageId):
+    '''CoIoT status message of a Gen1 Shelly EM: CoAP NON with code 0.30, device id option 3332 and JSON payload.'''
+    device = deviceId.encode("ascii")
+    values = []
+    for index, emeter in enumerate(emeters):
+        base = 4100 + index * 100
+        values += [[index, base + 5, emeter["power"]], [index, base + 6, emeter["total"]],
+                   [index, base + 7, emeter["total_returned"]], [index, base + 8, emeter["voltage"]]]
+    header = bytes((0x50, 30)) + (messageId & 0xFFFF).to_bytes(2, "big")
+    # option delta 3332 and the length with the extended formats
+    option = bytes(((14 << 4) | (13 if len(device) >= 13 else len(device)),)) + (3332 - 269).to_bytes(2, "big")
+    if len(device) >= 13:
+        option += bytes((len(device) - 13,))
+    return header + option + device + b"\xff" + json.dumps({"G": values}).encode("ascii")
+
+
+def push_coiot(plant, address, port, interval, duration):
+    '''Send CoIoT unicast messages of both Shellys like the CoIoT peer setting does, stop after duration seconds.'''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    end = time.monotonic() + duration
+    messageId = 0
+    while time.monotonic() < end:
+        for role, deviceId in PUSH_IDS.items():
+            messageId += 1
+            sock.sendto(coiot_packet(f"SHEM#{deviceId.rsplit('-', 1)[-1]}#2", plant.emeters(role), messageId),
+                        (address, port))
+        time.sleep(interval)
+    logging.warning("CoIoT pushes stopped")
+
+
+def run_services(plant, duration, bind, port, pushPort=None):
+    '''Run the unchanged services against the stand-ins for duration seconds, DBUS and GLib are faked.'''
+    address = "127.0.0.1" if bind in ("", "0.0.0.0") else bind
+    dtu, grid, balcony = (f"{address}:{port + offset}" for offset in range(len(ROLES)))
+    overrides = {
+        "DEFAULT": {"Host": dtu, "ringLogRows": 0},
+        "SHELLY": {"Host": grid, "Balcony": balcony, "Password": "",
+                   "KeepAliveURL": f"http://{balcony}/relay/0?turn=on&timer=900",
+                   "SwitchOffURL": f"http://{balcony}/relay/0?turn=off"},
+    }
+    if pushPort:
+        overrides["SHELLY"].update({"Push": "coiot", "CoiotPort": pushPort, "PushMaxAge": 5,
+                                    "GridPushId": PUSH_IDS["grid"], "BalconyPushId": PUSH_IDS["balcony"]})
+    loop, simulator = install_fakes(plant.clock, plant, overrides, fakeHttp=False)
+    main = load_services(os.path.dirname(os.path.realpath(__file__)))
+
+    cycles = []
+    end = time.time() + duration
+
+    def _sample():
+        # /Timing/Cycle of the Shelly service is the duration of the last control cycle
+        for name, service in FakeVeDbusService.services.items():
+            if name.startswith("com.victronenergy.acload"):
+                cycles.append(service["/Timing/Cycle"])
+        return True
+
+    def _run():
+        loop.add(1.0, _sample)
+        while time.time() < end:
+            time.sleep(max(0.0, min(loop.nextDue(), end) - time.time()))
+            plant.advance()
+            loop.runDue()
+    simulator["run"] = _run
+    main.main()
+
+    cycles.sort()
+    result = plant.metrics.result()
+    result["cycle_mean_ms"] = round(sum(cycles) / len(cycles), 1) if cycles else 0.0
+    result["cycle_p99_ms"] = cycles[int(0.99 * (len(cycles) - 1))] if cycles else 0.0
+    result["cycle_max_ms"] = cycles[-1] if cycles else 0.0
+    for name, service in FakeVeDbusService.services.items():
+        if name.startswith("com.victronenergy.dcload"):
+            result["dtu_errors"] = {path: service[path] for path in ("/ReadError", "/ConnectError", "/WriteError")
+                                    if path in service}
+            break
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8180, help="DTU port, grid Shelly +1, balcony Shelly +2")
+    parser.add_argument("--inverters", type=int, default=3)
+    parser.add_argument("--shelly-gen", type=int, default=1, choices=(1, 2), help="Gen1 /emeter or Gen2 RPC endpoints")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="[s] added to each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="[s] random part of the latency")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="requests without response")
+    parser.add_argument("--timeout-delay", type=float, default=5.0, help="[s] until the connection is closed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="requests answered with --error-code")
+    parser.add_argument("--error-code", type=int, default=500)
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="responses with truncated JSON")
+    parser.add_argument("--stale-rate", type=float, default=0.0, help="inverters reported with old data_age")
+    parser.add_argument("--stale-age", type=int, default=120, help="[s] added to data_age")
+    parser.add_argument("--stress", action="store_true",
+                        help="60 inverters, 0.2s to 0.5s latency and 2 to 5 percent of each fault")
+    parser.add_argument("--run-services", type=float, metavar="SECONDS",
+                        help="run the services of this repository against the stand-ins and print the metrics")
+    parser.add_argument("--push-coiot", type=int, metavar="PORT",
+                        help="send CoIoT unicast pushes of the Shellys to this UDP port, --run-services listens on it")
+    parser.add_argument("--push-interval", type=float, default=1.0, help="[s] between two pushes")
+    parser.add_argument("--push-for", type=float, default=float("inf"), metavar="SECONDS",
+                        help="stop the pushes after SECONDS to check the polling fallback")
+    parser.add_argument("--log", default="WARNING")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s %(threadName)s %(levelname)s %(message)s", level=args.log)
+
+    if args.stress:
+        args.inverters = max(args.inverters, 60)
+        args.latency, args.jitter = 0.2, 0.3
+        args.timeout_rate, args.error_rate, args.truncate_rate, args.stale_rate = 0.02, 0.05, 0.02, 0.05
+    faults = Faults(args.seed, args.latency, args.jitter, args.timeout_rate, args.timeout_delay, args.error_rate,
+                    args.error_code, args.truncate_rate, args.stale_rate, args.stale_age)
+    days = (args.run_services or 0) / 86400 + 1
+    plant = SimPlant(WallClock(), seed=args.seed, days=days, inverters=args.inverters)
+    plant.shellyGen = args.shelly_gen
+    config = configparser.ConfigParser()
+    config.read(f"{os.path.dirname(os.path.realpath(__file__))}/config.ini")
+    plant.metrics.target = float(config["DEFAULT"]["ZeroPoint"])
+    plant.metrics.setSteps([stepTime for step in plant.load.steps for stepTime in step[:2]])
+    servers = serve(plant, faults, args.bind, args.port)
+
+    if args.push_coiot:
+        address = "127.0.0.1" if args.bind in ("", "0.0.0.0") else args.bind
+        threading.Thread(target=push_coiot, args=(plant, address, args.push_coiot, args.push_interval, args.push_for),
+                         name="standin-push", daemon=True).start()
+
+    try:
+        if args.run_services:
+            result = run_services(plant, args.run_services, args.bind, args.port, args.push_coiot)
+        else:
+            print(f"serving DTU on port {args.port}, Shellys on {args.port + 1} and {args.port + 2}, Ctrl+C to stop")
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        result = plant.metrics.result()
+    result["servers"] = {role: server.stats.result() for role, server in servers.items()}
+    print(json.dumps(result, indent=2))
+    for server in servers.values():
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+
+# system imports:
+import os
+import sys
+
+# the modules are flat in the repository root, next to dbus-opendtu.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
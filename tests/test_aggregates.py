@@ -0,0 +1,76 @@
+
+# system imports:
+import time
+
+import pytest
+
+from aggregates import DailyAggregate, MAX_GAP, _dayNumber
+
+
+# local midnight of the day after now
+def _midnight(now):
+    return (_dayNumber(now) + 1) * 86400 - time.localtime(now).tm_gmtoff
+
+
+START = _midnight(1719792000.0) + 12 * 3600  # local noon
+
+
+def test_energy_split_by_sign():
+    aggregate = DailyAggregate()
+    aggregate.update(1000.0, START)
+    aggregate.update(-500.0, START + 36)
+    aggregate.update(0.0, START + 72)
+    today = aggregate.getDay()
+    assert today["positive"] == pytest.approx(10.0)
+    assert today["negative"] == pytest.approx(5.0)
+    assert aggregate.total == pytest.approx([10.0, 5.0])
+    assert (today["min"], today["max"]) == (-500.0, 1000.0)
+    assert aggregate.getMean() == pytest.approx(250.0)
+
+
+def test_gaps_are_not_integrated():
+    aggregate = DailyAggregate()
+    aggregate.update(1000.0, START)
+    aggregate.update(1000.0, START + MAX_GAP + 1)
+    assert aggregate.getDay()["positive"] == 0.0
+    assert aggregate.getMean() == 0.0
+
+
+def test_time_per_state():
+    aggregate = DailyAggregate()
+    aggregate.update(100.0, START, "Producing")
+    aggregate.update(0.0, START + 30, "Off")
+    aggregate.update(0.0, START + 50, "Off")
+    assert aggregate.getDay()["states"] == {"Producing": 30.0, "Off": 20.0}
+
+
+def test_rollover_at_local_midnight():
+    aggregate = DailyAggregate()
+    midnight = _midnight(START)
+    assert not aggregate.update(360.0, midnight - 20)
+    assert not aggregate.update(360.0, midnight - 10)
+    assert aggregate.update(0.0, midnight + 10)
+    assert aggregate.getDay(1)["positive"] == pytest.approx(1.0)
+    # the interval before midnight counts for the new day
+    assert aggregate.getDay()["positive"] == pytest.approx(2.0)
+    assert aggregate.total[0] == pytest.approx(3.0)
+
+
+def test_day_without_samples_clears_yesterday():
+    aggregate = DailyAggregate()
+    aggregate.update(100.0, START)
+    aggregate.update(100.0, START + 10)
+    aggregate.update(100.0, START + 2 * 86400)
+    assert aggregate.getDay(1)["positive"] == 0.0
+    assert aggregate.getDay(1)["day"] == aggregate.getDay()["day"] - 1
+
+
+def test_checkpoint():
+    aggregate = DailyAggregate()
+    aggregate.update(100.0, START, "Producing")
+    aggregate.update(100.0, START + 36, "Producing")
+    restored = DailyAggregate()
+    restored.restoreCheckpoint(aggregate.getCheckpoint())
+    assert restored.getCheckpoint() == aggregate.getCheckpoint()
+    restored.restoreCheckpoint({"total": [1.0]})
+    assert restored.total == aggregate.total
@@ -0,0 +1,63 @@
+
+# system imports:
+import pytest
+
+from alarms import AlarmAggregator, ALARM_DEFINITIONS, ALARM_GRID, ALARM_DTU, ALARM_FETCH, ALARM_HM, ALARM_BATTERY
+
+
+# report the alarm each second from start to end (excluded), returns the time of the first active cycle
+def _cycles(aggregator, name, on, start, end, device=None):
+    for now in range(start, end):
+        aggregator.report(name, device, on)
+        aggregator.evaluate(now)
+        if aggregator.isActive(name, device) == on:
+            return now
+    return None
+
+
+@pytest.mark.parametrize("name", sorted(ALARM_DEFINITIONS))
+def test_on_and_off_delay(name):
+    _, _, onDelay, offDelay = ALARM_DEFINITIONS[name]
+    aggregator = AlarmAggregator(ALARM_DEFINITIONS)
+    assert _cycles(aggregator, name, True, 0, 1000) == onDelay
+    assert _cycles(aggregator, name, False, 1000, 2000) == 1000 + offDelay
+
+
+def test_single_report_within_on_delay_is_ignored():
+    aggregator = AlarmAggregator(ALARM_DEFINITIONS)
+    aggregator.report(ALARM_GRID, None, True)
+    assert aggregator.evaluate(0) == []
+    for now in range(1, 100):
+        aggregator.report(ALARM_GRID, None, False)
+        aggregator.evaluate(now)
+        assert not aggregator.isActive(ALARM_GRID)
+
+
+def test_flapping_alarm_stays_active():
+    aggregator = AlarmAggregator(ALARM_DEFINITIONS)
+    _cycles(aggregator, ALARM_HM, True, 0, 100, "HM1")
+    for now in range(100, 200):
+        aggregator.report(ALARM_HM, "HM1", now % 20 == 0)
+        aggregator.evaluate(now)
+        assert aggregator.isActive(ALARM_HM, "HM1")
+
+
+def test_reports_of_a_cycle_are_ored():
+    aggregator = AlarmAggregator(ALARM_DEFINITIONS)
+    aggregator.report(ALARM_DTU, "HM1", True)
+    aggregator.report(ALARM_DTU, "HM1", False)
+    assert aggregator.evaluate(0) == [(ALARM_DTU, "HM1")]
+
+
+def test_winner_and_bitmask():
+    aggregator = AlarmAggregator(ALARM_DEFINITIONS)
+    for now in range(0, 20):
+        aggregator.report(ALARM_BATTERY, None, True)
+        aggregator.report(ALARM_DTU, "HM1", True)
+        if now >= 5:
+            aggregator.report(ALARM_FETCH, None, True)
+        aggregator.evaluate(now)
+    # the fetch alarm is activated last but has the lowest priority value
+    assert aggregator.getActive() == [(ALARM_FETCH, ""), (ALARM_DTU, "HM1"), (ALARM_BATTERY, "")]
+    bits = [ALARM_DEFINITIONS[name][0] for name in (ALARM_FETCH, ALARM_DTU, ALARM_BATTERY)]
+    assert aggregator.getBitmask() == sum(bits)
@@ -0,0 +1,72 @@
+
+# system imports:
+import pytest
+
+from derating import ThermalModel, DERATE_RANGE, THERMAL_TIME
+
+MAX_TEMPERATURE = 55.0
+OFF_TEMPERATURE = 60.0
+NOMINAL = 800.0
+
+
+# HM at 30 °C ambient with 40 °C rise at nominal power, alternating between low and full load
+def _learned():
+    model = ThermalModel(MAX_TEMPERATURE, OFF_TEMPERATURE)
+    temperature = 30.0
+    now = 0.0
+    for hour in range(12):
+        power = NOMINAL if hour % 2 else 0.2 * NOMINAL
+        for _ in range(720):
+            now += 5.0
+            temperature += (30.0 + 40.0 * power / NOMINAL - temperature) * 5.0 / THERMAL_TIME
+            model.update(power, temperature, now)
+    return model
+
+
+def test_not_learned():
+    model = ThermalModel(MAX_TEMPERATURE, OFF_TEMPERATURE)
+    assert model.getFit(NOMINAL) is None
+    assert model.getSustainablePower(NOMINAL) == NOMINAL
+    assert model.getAllowedPower(MAX_TEMPERATURE - DERATE_RANGE, 720.0, NOMINAL) == 720.0
+    assert model.getAllowedPower(MAX_TEMPERATURE, 720.0, NOMINAL) == 720.0
+    assert model.getAllowedPower(OFF_TEMPERATURE, 720.0, NOMINAL) == 0.0
+
+
+def test_constant_power_is_not_fitted():
+    model = ThermalModel(MAX_TEMPERATURE, OFF_TEMPERATURE)
+    for second in range(1000):
+        model.update(400.0, 40.0, second * 5.0)
+    assert model.getFit(NOMINAL) is None
+
+
+def test_learned_sustainable_power():
+    model = _learned()
+    ambient, slope = model.getFit(NOMINAL)
+    assert ambient == pytest.approx(30.0, abs=3.0)
+    assert slope * NOMINAL == pytest.approx(40.0, abs=4.0)
+    # 25 °C headroom at 40 °C per nominal power
+    assert model.getSustainablePower(NOMINAL) == pytest.approx(500.0, rel=0.1)
+
+
+def test_allowed_power_curve():
+    model = _learned()
+    sustainable = model.getSustainablePower(NOMINAL)
+    assert model.getAllowedPower(MAX_TEMPERATURE - DERATE_RANGE, NOMINAL, NOMINAL) == NOMINAL
+    middle = model.getAllowedPower(MAX_TEMPERATURE - DERATE_RANGE / 2, NOMINAL, NOMINAL)
+    assert middle == pytest.approx((NOMINAL + sustainable) / 2)
+    assert model.getAllowedPower(MAX_TEMPERATURE, NOMINAL, NOMINAL) == pytest.approx(sustainable)
+    halfway = (MAX_TEMPERATURE + OFF_TEMPERATURE) / 2
+    assert model.getAllowedPower(halfway, NOMINAL, NOMINAL) == pytest.approx(sustainable / 2)
+    assert model.getAllowedPower(OFF_TEMPERATURE + 1, NOMINAL, NOMINAL) == 0.0
+
+
+def test_allowed_power_is_limited_by_max_power():
+    model = _learned()
+    assert model.getAllowedPower(MAX_TEMPERATURE, 300.0, NOMINAL) == 300.0
+
+
+def test_checkpoint():
+    model = _learned()
+    restored = ThermalModel(MAX_TEMPERATURE, OFF_TEMPERATURE)
+    restored.restoreCheckpoint(model.getCheckpoint())
+    assert restored.getFit(NOMINAL) == model.getFit(NOMINAL)
@@ -0,0 +1,56 @@
+
+# system imports:
+import pytest
+
+from efficiency import EfficiencyCurve, BINS, MIN_SAMPLES
+
+
+def _learn(curve, acPower, dcPower, samples=MIN_SAMPLES, nominalPower=800, start=0.0):
+    for second in range(samples):
+        curve.update(acPower, dcPower, nominalPower, start + second * 5.0)
+
+
+def test_bin_is_used_after_min_samples():
+    curve = EfficiencyCurve()
+    _learn(curve, 400.0, 425.0, MIN_SAMPLES - 1)
+    assert curve.get(0.5) is None
+    _learn(curve, 400.0, 425.0, 1, start=1000.0)
+    assert curve.get(0.5) == pytest.approx(400.0 / 425.0)
+    assert curve.get(0.55) == curve.get(0.5)
+    assert curve.get(0.25) is None
+
+
+def test_curve_in_percent_per_bin():
+    curve = EfficiencyCurve()
+    _learn(curve, 80.0, 100.0)
+    _learn(curve, 760.0, 800.0, start=1000.0)
+    values = curve.getCurve()
+    assert len(values) == BINS
+    assert values[1] == 80.0
+    assert values[BINS - 1] == 95.0
+    assert values[5] == 0
+
+
+def test_implausible_samples_are_ignored():
+    curve = EfficiencyCurve()
+    assert curve.update(400.0, 0.0, 800, 0.0) == 0.0
+    assert curve.update(500.0, 400.0, 800, 5.0) == 0.0
+    assert curve.update(10.0, 12.0, 800, 10.0) == 0.0  # below MIN_LOAD
+    assert curve.update(400.0, 425.0, 0, 15.0) == 0.0
+    assert curve.getCurve() == [0] * BINS
+
+
+def test_update_returns_the_ac_energy_since_the_last_update():
+    curve = EfficiencyCurve()
+    assert curve.update(360.0, 400.0, 800, 0.0) == 0.0
+    assert curve.update(360.0, 400.0, 800, 10.0) == pytest.approx(1.0)
+
+
+def test_checkpoint():
+    curve = EfficiencyCurve()
+    _learn(curve, 400.0, 425.0)
+    restored = EfficiencyCurve()
+    restored.restoreCheckpoint(curve.getCheckpoint())
+    assert restored.getCurve() == curve.getCurve()
+    restored.restoreCheckpoint({"values": [1.0]})
+    assert restored.getCurve() == curve.getCurve()
@@ -0,0 +1,75 @@
+
+# system imports:
+import struct
+
+import pytest
+
+import ringlog
+from ringlog import RingLog, HEADER, ROW_FIELDS, INVERTER_FIELDS
+
+
+def _row(number, inverterCount):
+    inverter = (10.0, 20.0, 30.0, 3)
+    return (1719792000.0 + number, float(number), 2.0, 3.0, 50.0, 100.0, 90.0, 1, 4.0) + inverter * inverterCount
+
+
+def _written(filename):
+    with open(filename, "rb") as logfile:
+        return HEADER.unpack(logfile.read(HEADER.size))
+
+
+def test_header_counts_the_rows(tmp_path):
+    filename = str(tmp_path / "ringlog.bin")
+    log = RingLog(filename, 4, 2)
+    for number in range(6):
+        log.write(*_row(number, 2))
+    log.close()
+    assert _written(filename) == (ringlog.MAGIC, ringlog.VERSION, 4, 2, 6)
+
+
+def test_reopen_continues_and_format_change_recreates(tmp_path):
+    filename = str(tmp_path / "ringlog.bin")
+    log = RingLog(filename, 4, 1)
+    log.write(*_row(0, 1))
+    log.close()
+    log = RingLog(filename, 4, 1)
+    log.write(*_row(1, 1))
+    log.close()
+    assert _written(filename)[-1] == 2
+    log = RingLog(filename, 8, 1)
+    log.close()
+    assert _written(filename)[-1] == 0
+
+
+def test_row_layout():
+    rowSize = struct.calcsize("<" + "".join(fmt for _, fmt in ROW_FIELDS))
+    inverterSize = struct.calcsize("<" + "".join(fmt for _, fmt in INVERTER_FIELDS))
+    assert struct.calcsize(ringlog._row_format(3)) == rowSize + 3 * inverterSize
+
+
+def test_read_in_chronological_order(tmp_path):
+    pytest.importorskip("numpy")
+    filename = str(tmp_path / "ringlog.bin")
+    log = RingLog(filename, 4, 2)
+    for number in range(3):
+        log.write(*_row(number, 2))
+    assert ringlog.read(filename)["grid"].tolist() == [0.0, 1.0, 2.0]
+    for number in range(3, 7):
+        log.write(*_row(number, 2))
+    rows = ringlog.read(filename)
+    log.close()
+    assert rows["grid"].tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert rows["inv1_state"].tolist() == [3] * 4
+
+
+def test_export_csv(tmp_path):
+    pytest.importorskip("numpy")
+    filename = str(tmp_path / "ringlog.bin")
+    log = RingLog(filename, 4, 1)
+    log.write(*_row(0, 1))
+    log.close()
+    ringlog.export(filename, str(tmp_path / "out.csv"))
+    lines = (tmp_path / "out.csv").read_text(encoding="utf-8").splitlines()
+    assert lines[0].split(",")[:2] == ["time", "grid"]
+    assert lines[0].endswith("inv0_state")
+    assert len(lines) == 2
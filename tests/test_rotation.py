@@ -0,0 +1,67 @@
+
+# system imports:
+from types import SimpleNamespace
+
+from rotation import WearLeveler, DUTY_TIME
+
+
+def _inverters(*numbers):
+    return [SimpleNamespace(pvinverternumber=number) for number in numbers]
+
+
+def test_less_energy_first():
+    leveler = WearLeveler(55)
+    leveler.update(0, 900.0, 800, 30.0, 0.0, 0.0)
+    leveler.update(1, 100.0, 800, 30.0, 0.0, 0.0)
+    leveler.update(2, 500.0, 800, 30.0, 0.0, 0.0)
+    assert leveler.ranking() == [1, 2, 0]
+
+
+def test_energy_is_compared_to_the_nominal_power():
+    leveler = WearLeveler(55)
+    leveler.update(0, 400.0, 400, 30.0, 0.0, 0.0)  # 1000 full load hours
+    leveler.update(1, 600.0, 1600, 30.0, 0.0, 0.0)  # 375 full load hours
+    assert leveler.ranking() == [1, 0]
+
+
+def test_hot_inverter_moves_back():
+    leveler = WearLeveler(55)
+    leveler.update(0, 100.0, 800, 30.0, 0.0, 0.0)
+    leveler.update(1, 100.0, 800, 30.0, 0.0, 0.0)
+    assert leveler.ranking() == [0, 1]
+    leveler.update(0, 100.0, 800, 54.0, 0.0, 1.0)
+    assert leveler.ranking() == [1, 0]
+
+
+def test_recent_duty_is_averaged():
+    leveler = WearLeveler(55)
+    leveler.update(0, 0.0, 800, 55.0, 0.0, 0.0)
+    leveler.update(0, 0.0, 800, 55.0, 800.0, DUTY_TIME / 2)
+    halfDuty = leveler.getScore(0)
+    leveler.update(0, 0.0, 800, 55.0, 800.0, 2 * DUTY_TIME)
+    assert 0 < halfDuty < leveler.getScore(0)
+
+
+def test_unknown_nominal_power_is_not_ranked():
+    leveler = WearLeveler(55)
+    leveler.update(0, 100.0, 0, 30.0, 0.0, 0.0)
+    assert leveler.getScore(0) is None
+    assert leveler.ranking() == []
+
+
+def test_updates_keep_one_entry_per_inverter():
+    leveler = WearLeveler(55)
+    for now in range(100):
+        leveler.update(now % 3, float(now), 800, 30.0, 100.0, float(now))
+    assert sorted(leveler.ranking()) == [0, 1, 2]
+
+
+def test_order_moves_only_ranked_inverters():
+    leveler = WearLeveler(55)
+    leveler.update(0, 900.0, 800, 30.0, 0.0, 0.0)
+    leveler.update(1, 100.0, 800, 30.0, 0.0, 0.0)
+    leveler.update(2, 500.0, 800, 30.0, 0.0, 0.0)
+    inverters = _inverters(0, 1, 2, 3)
+    producing = {0, 2, 3}
+    ordered = leveler.order(inverters, lambda dtuService: dtuService.pvinverternumber in producing)
+    assert [dtuService.pvinverternumber for dtuService in ordered] == [2, 0, 1, 3]
@@ -0,0 +1,74 @@
+
+# system imports:
+import random
+
+import pytest
+
+from seasonal import MAXCALCSOC, MAXSOC, MINMAXSOC, feedInMinSoc, feedInRelay, isPeak, peakFloatingMax
+
+
+# /SocFloatingMax per sample like the SOC loop of the shelly service, one sample after the other
+def _floatingMaxLoop(socs):
+    floatingMax = MINMAXSOC
+    increment = 0
+    values = [floatingMax]
+    for oldSoc, newSoc in zip(socs, socs[1:]):
+        incSoc = newSoc - oldSoc
+        if incSoc != 0:
+            if isPeak(incSoc, increment):
+                floatingMax = peakFloatingMax(oldSoc, floatingMax)
+            increment = incSoc
+        values.append(floatingMax)
+    return values
+
+
+# SOC random walk with charge and discharge phases, SOC steps of one percent and long constant periods
+def _socWalk(seed, samples):
+    rnd = random.Random(seed)
+    soc = 50
+    direction = 1
+    socs = []
+    for _ in range(samples):
+        if rnd.random() < 0.01:
+            direction = -direction
+        if rnd.random() < 0.3:
+            soc = max(5, min(100, soc + direction))
+        socs.append(soc)
+    return socs
+
+
+def test_peak():
+    assert isPeak(-1, 1)
+    assert not isPeak(1, 1)
+    assert not isPeak(-1, -1)
+    assert not isPeak(1, -1)
+    assert not isPeak(-1, 0)
+
+
+def test_peak_floating_max():
+    assert peakFloatingMax(MAXSOC, MINMAXSOC) == MAXCALCSOC - 1
+    assert peakFloatingMax(MINMAXSOC + 10, MINMAXSOC) == MINMAXSOC + 5
+    assert peakFloatingMax(MINMAXSOC - 10, MINMAXSOC + 5) == MINMAXSOC + 4
+    assert peakFloatingMax(MINMAXSOC - 10, MINMAXSOC) == MINMAXSOC
+
+
+def test_feed_in_min_soc_is_mirrored_at_the_base_soc():
+    assert feedInMinSoc(54) == 54
+    assert feedInMinSoc(74) == 34
+    assert feedInMinSoc(MAXCALCSOC) == feedInMinSoc(MAXSOC)
+
+
+def test_feed_in_relay_hysteresis():
+    assert not feedInRelay(40, 40, False)
+    assert feedInRelay(42, 40, False)
+    assert feedInRelay(39, 40, True)
+    assert not feedInRelay(38, 40, True)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_backtest_floating_max_matches_the_loop(seed):
+    np = pytest.importorskip("numpy")
+    backtest = pytest.importorskip("backtest")
+    socs = _socWalk(seed, 20000)
+    expected = _floatingMaxLoop(socs)
+    assert backtest.floating_max(np.array(socs, dtype=np.int64)).tolist() == expected
@@ -0,0 +1,109 @@
+
+# system imports:
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from shelly import ShellyMeter, ENERGY_CYCLES  # noqa: E402 - after the requests check
+
+
+class _Response:
+    def __init__(self, url, status, payload):
+        self.url = url
+        self.status_code = status
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+
+# requests.Session with fixed answers per path, an exception as answer is raised
+class _Session:
+    def __init__(self, answers):
+        self.answers = answers
+        self.paths = []
+
+    def get(self, url, auth=None, timeout=None):
+        path = url.split("/", 3)[3]
+        self.paths.append("/" + path)
+        answer = self.answers.get("/" + path, (404, {"code": 404, "message": f"No handler for {path}"}))
+        if isinstance(answer, Exception):
+            raise answer
+        return _Response(url, *answer)
+
+
+GEN1 = {
+    "/shelly": (200, {"type": "SHEM", "auth": False}),
+    "/emeter/0": (200, {"power": 120.5, "voltage": 231.0, "total": 1000.0, "total_returned": 50.0}),
+    "/emeter/1": (200, {"power": -20.0, "voltage": 230.0, "total": 10.0, "total_returned": 5.0}),
+}
+PRO3EM = {
+    "/shelly": (200, {"gen": 2, "app": "Pro3EM"}),
+    "/rpc/EM.GetStatus?id=0": (200, {"id": 0, "a_act_power": 100.0, "a_voltage": 230.0, "b_act_power": 200.0,
+                                     "b_voltage": 231.0, "c_act_power": -50.0, "c_voltage": 232.0}),
+    "/rpc/EMData.GetStatus?id=0": (200, {"id": 0, "a_total_act_energy": 1.0, "a_total_act_ret_energy": 2.0,
+                                         "b_total_act_energy": 3.0, "b_total_act_ret_energy": 4.0,
+                                         "c_total_act_energy": 5.0, "c_total_act_ret_energy": 6.0}),
+}
+PROEM = {
+    "/shelly": (200, {"gen": 2, "app": "ProEM"}),
+    "/rpc/EM1.GetStatus?id=0": (200, {"id": 0, "act_power": 300.0, "voltage": 229.0}),
+    "/rpc/EM1Data.GetStatus?id=0": (200, {"id": 0, "total_act_energy": 7.0, "total_act_ret_energy": 8.0}),
+}
+
+
+def test_gen1_emeters():
+    meter = ShellyMeter("shelly", _Session(GEN1), phases=2)
+    samples = meter.read()
+    assert (meter.generation, meter.component) == (1, "emeter")
+    assert samples == [
+        {"power": 120.5, "voltage": 231.0, "total": 1000.0, "total_returned": 50.0},
+        {"power": -20.0, "voltage": 230.0, "total": 10.0, "total_returned": 5.0},
+    ]
+
+
+def test_gen2_em_with_energy_every_n_reads():
+    session = _Session(PRO3EM)
+    meter = ShellyMeter("shelly", session, phases=3)
+    samples = meter.read()
+    assert meter.component == "EM"
+    assert [sample["power"] for sample in samples] == [100.0, 200.0, -50.0]
+    assert [(sample["total"], sample["total_returned"]) for sample in samples] == [(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)]
+    for _ in range(ENERGY_CYCLES):
+        meter.read()
+    assert session.paths.count("/rpc/EMData.GetStatus?id=0") == 2
+    assert session.paths.count("/shelly") == 1
+
+
+def test_gen2_em1_after_missing_em_method():
+    meter = ShellyMeter("shelly", _Session(PROEM), phases=1)
+    assert meter.read() == [{"power": 300.0, "voltage": 229.0, "total": 7.0, "total_returned": 8.0}]
+    assert meter.component == "EM1"
+
+
+def test_gen2_em1_after_rpc_method_not_found_code():
+    answers = dict(PROEM)
+    answers["/rpc/EM.GetStatus?id=0"] = (400, {"code": -32601, "message": "Method not found"})
+    meter = ShellyMeter("shelly", _Session(answers), phases=1)
+    meter.read()
+    assert meter.component == "EM1"
+
+
+@pytest.mark.parametrize("answer", [(401, None), (500, {"code": -1, "message": "busy"}),
+                                    requests.ReadTimeout("timeout")])
+def test_detection_errors_are_raised_and_not_cached(answer):
+    answers = dict(PRO3EM)
+    answers["/rpc/EM.GetStatus?id=0"] = answer
+    session = _Session(answers)
+    meter = ShellyMeter("shelly", session, phases=3, password="secret")
+    with pytest.raises(requests.RequestException):
+        meter.read()
+    assert meter.generation is None and meter.component is None
+    session.answers = PRO3EM
+    meter.read()
+    assert meter.component == "EM"
+    assert session.paths.count("/shelly") == 2
@@ -0,0 +1,91 @@
+
+# system imports:
+import json
+from types import SimpleNamespace
+
+from shellypush import _parseCoap, CoiotListener, PushDevice, PushSlot, PushedMeter, COIOT_DEVICE_OPTION
+
+
+# CoAP option header with the extended delta and length encodings
+def _option(delta, value):
+    header = []
+    extended = b""
+    for number in (delta, len(value)):
+        if number < 13:
+            header.append(number)
+        elif number < 269:
+            header.append(13)
+            extended += bytes([number - 13])
+        else:
+            header.append(14)
+            extended += (number - 269).to_bytes(2, "big")
+    return bytes([header[0] << 4 | header[1]]) + extended + value
+
+
+def _packet(options, payload, token=b""):
+    packet = bytes([0x50 | len(token), 0x1E, 0x00, 0x01]) + token
+    number = 0
+    for option, value in sorted(options.items()):
+        packet += _option(option - number, value)
+        number = option
+    return packet + b"\xff" + payload
+
+
+def test_parse_coap_status():
+    payload = json.dumps({"G": [[0, 4105, 120.5]]}).encode()
+    options, body = _parseCoap(_packet({11: b"cit", 12: b"s", COIOT_DEVICE_OPTION: b"SHEM#B8E3F2#2"}, payload, b"ab"))
+    assert options == {11: b"cit", 12: b"s", COIOT_DEVICE_OPTION: b"SHEM#B8E3F2#2"}
+    assert body == payload
+
+
+def test_parse_coap_long_option():
+    value = b"x" * 300
+    options, body = _parseCoap(_packet({3: value}, b"{}"))
+    assert options == {3: value}
+    assert body == b"{}"
+
+
+def test_parse_coap_without_payload():
+    options, body = _parseCoap(_packet({11: b"cit"}, b"")[:-1])
+    assert options == {11: b"cit"}
+    assert body == b""
+
+
+def test_parse_other_datagrams():
+    assert _parseCoap(b"") == (None, None)
+    assert _parseCoap(b"\x00\x01\x02\x03") == (None, None)
+
+
+def test_match_by_mac_or_address():
+    byMac = PushDevice("grid", "shellyem-B8E3F2", "127.0.0.1", 2)
+    byAddress = PushDevice("balcony", "", "127.0.0.2", 1)
+    listener = CoiotListener([byMac, byAddress])
+    assert listener._match({COIOT_DEVICE_OPTION: b"SHEM#b8e3f2#2"}, "10.0.0.1") is byMac
+    assert listener._match({COIOT_DEVICE_OPTION: b"SHEM#000000#2"}, "127.0.0.2") is byAddress
+    assert listener._match({}, "10.0.0.1") is None
+
+
+def test_device_publishes_when_all_phases_have_power():
+    device = PushDevice("grid", "shellyem-B8E3F2", "127.0.0.1", 2)
+    device.update(0, "power", "100.5")
+    device.update(0, "voltage", 230)
+    device.update(5, "power", 1)  # phase not configured
+    device.publish()
+    assert device.slot.get(10.0) is None
+    device.update(1, "power", -20)
+    device.publish()
+    assert device.slot.get(10.0) == [
+        {"power": 100.5, "voltage": 230.0, "total": 0.0, "total_returned": 0.0},
+        {"power": -20.0, "voltage": 0.0, "total": 0.0, "total_returned": 0.0},
+    ]
+
+
+def test_pushed_meter_polls_without_fresh_pushes():
+    polled = [{"power": 1.0, "voltage": 0.0, "total": 0.0, "total_returned": 0.0}]
+    slot = PushSlot()
+    meter = PushedMeter(SimpleNamespace(read=lambda: polled), slot, 10.0, "grid")
+    assert meter.read() is polled
+    pushed = [{"power": 2.0, "voltage": 0.0, "total": 0.0, "total_returned": 0.0}]
+    slot.set(pushed)
+    assert meter.read() is pushed
+    assert PushedMeter(SimpleNamespace(read=lambda: polled), slot, -1.0, "grid").read() is polled